@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core import signing
+from rest_framework import serializers
+
+from products.models import Product, effective_price
+from .models import CartItem
+from .reservations import available_stock
+from .serializers import CartItemSerializer
+from .services import CartError
+
+# Carts of anonymous visitors: {product id: quantity} signed (and zlib compressed) into a
+# cookie, so browsing and filling a cart costs no database writes. Guest lines use the
+# product id as their item id.
+SALT = 'cart.guest'
+
+
+def load(request):
+    token = request.COOKIES.get(settings.GUEST_CART_COOKIE)
+    if not token:
+        return {}
+    try:
+        lines = signing.loads(token, salt=SALT, max_age=settings.GUEST_CART_MAX_AGE)
+        return {int(product_id): int(quantity) for product_id, quantity in lines if int(quantity) > 0}
+    except (signing.BadSignature, TypeError, ValueError):
+        return {}
+
+
+def store(response, items):
+    if not items:
+        response.delete_cookie(settings.GUEST_CART_COOKIE, samesite='Lax')
+        return response
+    token = signing.dumps(sorted(items.items()), salt=SALT, compress=True)
+    response.set_cookie(
+        settings.GUEST_CART_COOKIE, token,
+        max_age=settings.GUEST_CART_MAX_AGE,
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=True,
+        samesite='Lax',
+    )
+    return response
+
+
+def add(items, product_id, quantity):
+    """Return a copy of ``items`` with ``quantity`` more of the product, checked against the
+    stock left after active holds (read only, guests do not hold stock)."""
+    items = dict(items)
+    wanted = items.get(product_id, 0) + quantity
+    if product_id not in items and len(items) >= settings.GUEST_CART_MAX_LINES:
+        raise CartError("The cart is full.")
+    available = available_stock([product_id])
+    if product_id not in available:
+        raise CartError("Product not found.")
+    if available[product_id] < wanted:
+        raise CartError("Not enough stock.")
+    items[product_id] = wanted
+    return items
+
+
+def cart_data(items, customer=None):
+    """Same shape as CartSerializer, priced by the database in one query."""
+    products = (
+        Product.objects.filter(id__in=items)
+        .annotate(unit_price=effective_price())
+        .values_list('id', 'name', 'unit_price')
+        .order_by('id')
+    )
+    lines = []
+    for product_id, name, unit_price in products:
+        line = CartItem(id=product_id, product_id=product_id, quantity=items[product_id])
+        line.product_name, line.unit_price = name, unit_price
+        line.line_total = unit_price * line.quantity
+        lines.append(line)
+    total = sum(line.line_total for line in lines)
+    return {
+        'id': None,
+        'customer': customer,
+        'items': CartItemSerializer(lines, many=True).data,
+        'total_price': serializers.DecimalField(max_digits=12, decimal_places=2).to_representation(total),
+        'created_at': None,
+        'updated_at': None,
+    }
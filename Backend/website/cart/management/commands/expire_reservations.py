@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from cart.reservations import expire_reservations
+
+
+class Command(BaseCommand):
+    help = "Delete expired stock reservations in batches (run it periodically, e.g. from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        removed = expire_reservations(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} expired reservations."))
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:17
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_items(apps, schema_editor):
+    # fold duplicate (cart, product) lines into the oldest one before the constraint is added
+    CartItem = apps.get_model("cart", "CartItem")
+    duplicates = (
+        CartItem.objects.values("cart_id", "product_id")
+        .annotate(lines=Count("id"), keep=Min("id"), total=Sum("quantity"))
+        .filter(lines__gt=1)
+    )
+    for duplicate in duplicates:
+        CartItem.objects.filter(id=duplicate["keep"]).update(quantity=duplicate["total"])
+        CartItem.objects.filter(
+            cart_id=duplicate["cart_id"], product_id=duplicate["product_id"]
+        ).exclude(id=duplicate["keep"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cart", "0002_stock_reservation"),
+        ("products", "0009_product_rating_sum"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="cartitem",
+            constraint=models.UniqueConstraint(
+                fields=("cart", "product"), name="unique_cart_item"
+            ),
+        ),
+    ]
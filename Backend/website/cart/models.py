@@ -1,6 +1,9 @@
+from decimal import Decimal, ROUND_HALF_UP
+
 from django.db import models
 from django.conf import settings
-from products.models import Product
+from django.db.models import F
+from products.models import Product, effective_price
 
 class Cart(models.Model):
     customer = models.OneToOneField(
@@ -14,6 +17,17 @@ class Cart(models.Model):
     def __str__(self):
         return f"Cart of {self.customer.username}"
 
+class CartItemQuerySet(models.QuerySet):
+
+    def with_prices(self):
+        # unit and line prices computed by the database, with the same sale-aware
+        # expression checkout uses, so cart and order totals cannot diverge
+        return self.annotate(
+            product_name=F("product__name"),
+            unit_price=effective_price("product__"),
+            line_total=F("quantity") * effective_price("product__"),
+        )
+
 class CartItem(models.Model):
     cart = models.ForeignKey(
         Cart,
@@ -27,8 +41,57 @@ class CartItem(models.Model):
     )
     quantity = models.PositiveIntegerField(default=1)
 
+    objects = CartItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["cart", "product"], name="unique_cart_item"),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
     def total_price(self):
-        return self.product.price * self.quantity
+        price = self.product.sale_price if self.product.in_sale else self.product.price
+        # rounded like effective_price()
+        return price.quantize(Decimal('0.01'), ROUND_HALF_UP) * self.quantity
+
+
+class StockReservation(models.Model):
+    # time-boxed hold on a product's stock, owned by a cart (until checkout)
+    # or by an order (until its payment completes)
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="reservations"
+    )
+    cart = models.ForeignKey(
+        Cart,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="reservations"
+    )
+    order = models.ForeignKey(
+        'orders.Order',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="reservations"
+    )
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["cart", "product"], name="unique_cart_reservation"),
+        ]
+        indexes = [
+            # active holds of a product: product = X AND expires_at > now
+            models.Index(fields=["product", "expires_at"], name="reservation_product_exp_idx"),
+            models.Index(fields=["expires_at"], name="reservation_expires_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} held until {self.expires_at}"
@@ -0,0 +1,107 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from products.models import Product, effective_price
+from .models import StockReservation
+
+
+class ReservationError(Exception):
+    pass
+
+
+def active_reservations():
+    return StockReservation.objects.filter(expires_at__gt=timezone.now())
+
+
+def reserved_quantities(product_ids, exclude_cart=None, exclude_order=None):
+    """{product id: quantity held by active reservations}, from one grouped query on the
+    (product, expires_at) index."""
+    reservations = active_reservations().filter(product_id__in=product_ids)
+    if exclude_cart is not None:
+        reservations = reservations.exclude(cart=exclude_cart)
+    if exclude_order is not None:
+        reservations = reservations.exclude(order=exclude_order)
+    rows = reservations.values('product_id').annotate(total=Sum('quantity')).order_by()
+    return {row['product_id']: row['total'] for row in rows}
+
+
+def available_stock(product_ids, exclude_cart=None):
+    """{product id: stock minus active holds}."""
+    reserved = reserved_quantities(product_ids, exclude_cart)
+    stock = Product.objects.filter(id__in=product_ids).values_list('id', 'stock')
+    return {product_id: amount - reserved.get(product_id, 0) for product_id, amount in stock}
+
+
+def lock_and_check(quantities, exclude_cart=None, exclude_order=None):
+    """Lock the products (in id order) and make sure each can cover the wanted quantity
+    on top of everybody else's active holds. Must run inside a transaction.
+    The products come back annotated with their sale-aware ``unit_price``."""
+    products = {
+        product.id: product
+        for product in Product.objects.select_for_update()
+        .filter(id__in=quantities).order_by('id')
+        .only('id', 'name', 'price', 'in_sale', 'sale_price', 'stock', 'seller_id')
+        .annotate(unit_price=effective_price())
+    }
+    if len(products) != len(quantities):
+        raise ReservationError("Some products are no longer available.")
+    reserved = reserved_quantities(list(quantities), exclude_cart, exclude_order)
+    short = [
+        products[product_id].name
+        for product_id, quantity in quantities.items()
+        if products[product_id].stock - reserved.get(product_id, 0) < quantity
+    ]
+    if short:
+        raise ReservationError(f"Not enough stock for: {', '.join(short)}.")
+    return products
+
+
+def reserve_for_cart(cart, quantities):
+    """Hold ``{product id: quantity}`` for the cart, replacing its previous holds on those
+    products. A quantity of 0 drops the hold."""
+    expires_at = timezone.now() + settings.CART_RESERVATION_TTL
+    with transaction.atomic():
+        wanted = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+        if wanted:
+            lock_and_check(wanted, exclude_cart=cart)
+            StockReservation.objects.bulk_create(
+                [
+                    StockReservation(cart=cart, product_id=product_id, quantity=quantity, expires_at=expires_at)
+                    for product_id, quantity in wanted.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['cart', 'product'],
+                update_fields=['quantity', 'expires_at'],
+            )
+        dropped = [product_id for product_id, quantity in quantities.items() if quantity <= 0]
+        if dropped:
+            StockReservation.objects.filter(cart=cart, product_id__in=dropped).delete()
+
+
+def move_to_order(cart_id, order, quantities):
+    """Replace the cart's holds with holds owned by the order, kept until it is paid."""
+    StockReservation.objects.filter(cart_id=cart_id).delete()
+    expires_at = timezone.now() + settings.ORDER_RESERVATION_TTL
+    StockReservation.objects.bulk_create([
+        StockReservation(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)
+        for product_id, quantity in quantities.items()
+    ])
+
+
+def release_order(order):
+    StockReservation.objects.filter(order=order).delete()
+
+
+def expire_reservations(batch_size=1000):
+    """Delete expired holds in batches, returns how many were removed."""
+    removed = 0
+    while True:
+        ids = list(
+            StockReservation.objects.filter(expires_at__lte=timezone.now())
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return removed
+        removed += StockReservation.objects.filter(id__in=ids).delete()[0]
@@ -2,9 +2,11 @@ from rest_framework import serializers
 from .models import Cart, CartItem
 from products.models import Product
 
+# expects items annotated by CartItem.objects.with_prices()
 class CartItemSerializer(serializers.ModelSerializer):
-    product_name = serializers.ReadOnlyField(source='product.name')
-    product_price = serializers.ReadOnlyField(source='product.price')
+    product_name = serializers.ReadOnlyField()
+    product_price = serializers.DecimalField(source='unit_price', max_digits=10, decimal_places=2, read_only=True)
+    total_price = serializers.DecimalField(source='line_total', max_digits=12, decimal_places=2, read_only=True)
 
     class Meta:
         model = CartItem
@@ -19,4 +21,19 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['id', 'customer', 'items', 'total_price', 'created_at', 'updated_at']
 
     def get_total_price(self, obj):
-        return sum(item.total_price() for item in obj.items.all())
+        total = sum(item.line_total for item in obj.items.all())
+        return serializers.DecimalField(max_digits=12, decimal_places=2).to_representation(total)
+
+
+class CartOperationSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    op = serializers.ChoiceField(choices=['set', 'increment', 'remove'], default='increment')
+    quantity = serializers.IntegerField(min_value=0, default=1)
+
+    def validate(self, data):
+        if data['op'] == 'increment' and data['quantity'] < 1:
+            raise serializers.ValidationError("Increment quantity must be at least 1.")
+        return data
+
+class CartBatchSerializer(serializers.Serializer):
+    items = CartOperationSerializer(many=True, allow_empty=False, max_length=500)
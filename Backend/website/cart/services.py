@@ -0,0 +1,106 @@
+from django.db import transaction
+from django.db.models import Case, When, F, Value, IntegerField
+
+from products.models import Product
+from .models import Cart, CartItem
+from .reservations import reserve_for_cart, available_stock, ReservationError
+
+
+class CartError(Exception):
+    pass
+
+
+SET, INCREMENT, REMOVE = 'set', 'increment', 'remove'
+
+
+def merge_operations(operations):
+    """Fold a list of {product_id, op, quantity} into one final operation per product."""
+    merged = {}
+    for operation in operations:
+        product_id, op, quantity = operation['product_id'], operation['op'], operation.get('quantity', 1)
+        if op == SET and quantity == 0:
+            op = REMOVE
+        previous = merged.get(product_id)
+        if op == INCREMENT and previous is not None:
+            previous_op, previous_quantity = previous
+            if previous_op == INCREMENT:
+                merged[product_id] = (INCREMENT, previous_quantity + quantity)
+            else:
+                merged[product_id] = (SET, (previous_quantity if previous_op == SET else 0) + quantity)
+        else:
+            merged[product_id] = (op, quantity)
+    return merged
+
+
+def mutate_cart(cart, operations):
+    """Set, increment or remove many cart lines in one transaction with a fixed number of
+    queries: upserts against the unique (cart, product) constraint and F() increments,
+    so concurrent requests cannot lose an update or duplicate a line. The stock holds of
+    the touched products are updated in the same transaction."""
+    merged = merge_operations(operations)
+    if not merged:
+        return
+
+    with transaction.atomic():
+        found = set(Product.objects.filter(id__in=merged).values_list('id', flat=True))
+        missing = set(merged) - found
+        if missing:
+            raise CartError(f"Products not found: {', '.join(str(product_id) for product_id in sorted(missing))}.")
+
+        removed = [product_id for product_id, (op, _) in merged.items() if op == REMOVE]
+        sets = {product_id: quantity for product_id, (op, quantity) in merged.items() if op == SET}
+        increments = {product_id: quantity for product_id, (op, quantity) in merged.items() if op == INCREMENT}
+
+        if removed:
+            CartItem.objects.filter(cart=cart, product_id__in=removed).delete()
+        if sets:
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart, product_id=product_id, quantity=quantity) for product_id, quantity in sets.items()],
+                update_conflicts=True,
+                unique_fields=['cart', 'product'],
+                update_fields=['quantity'],
+            )
+        if increments:
+            # create the missing lines empty, then add to every line in one UPDATE
+            CartItem.objects.bulk_create(
+                [CartItem(cart=cart, product_id=product_id, quantity=0) for product_id in increments],
+                ignore_conflicts=True,
+            )
+            CartItem.objects.filter(cart=cart, product_id__in=increments).update(quantity=F('quantity') + Case(
+                *[When(product_id=product_id, then=Value(quantity)) for product_id, quantity in increments.items()],
+                output_field=IntegerField(),
+            ))
+
+        quantities = dict.fromkeys(removed, 0)
+        if sets or increments:
+            quantities.update(
+                CartItem.objects.filter(cart=cart, product_id__in=[*sets, *increments])
+                .values_list('product_id', 'quantity')
+            )
+        try:
+            reserve_for_cart(cart, quantities)
+        except ReservationError as error:
+            raise CartError(str(error))
+
+
+def merge_guest_cart(user, items):
+    """Add the lines of a guest cart ({product id: quantity}) to the user's cart with one bulk
+    upsert. Lines that no longer fit the stock are capped to what is still available and
+    products that were removed from the catalog are dropped."""
+    if not items:
+        return
+    cart, _ = Cart.objects.get_or_create(customer=user)
+    available = available_stock(list(items), exclude_cart=cart)
+    items = {product_id: quantity for product_id, quantity in items.items() if available.get(product_id, 0) > 0}
+    if not items:
+        return
+    try:
+        mutate_cart(cart, [
+            {'product_id': product_id, 'op': INCREMENT, 'quantity': quantity} for product_id, quantity in items.items()
+        ])
+    except CartError:
+        current = dict(cart.items.filter(product_id__in=items).values_list('product_id', 'quantity'))
+        mutate_cart(cart, [
+            {'product_id': product_id, 'op': SET, 'quantity': min(current.get(product_id, 0) + quantity, available[product_id])}
+            for product_id, quantity in items.items()
+        ])
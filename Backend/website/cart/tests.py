@@ -1,3 +1,226 @@
-from django.test import TestCase
+import itertools
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from orders.models import Order, OrderItem
+from payments.gateway import FAILED, process_event
+from payments.models import Payment, GatewayEvent
+from products.models import Product
+from users.models import MyUser
+from .models import Cart, CartItem, StockReservation
+from .reservations import reserve_for_cart, expire_reservations, available_stock, move_to_order, ReservationError
+from .services import merge_operations, mutate_cart, CartError, SET, INCREMENT, REMOVE
+
+
+mobiles = itertools.count(9120000001)
+
+
+def make_product(stock=1):
+    seller = MyUser.objects.create_user(mobile=f'0{next(mobiles)}', is_seller=True, is_customer=False)
+    return Product.objects.create(seller=seller, name='product', description='description', price=10, stock=stock)
+
+
+def make_cart():
+    return Cart.objects.get_or_create(customer=MyUser.objects.create_user(mobile=f'0{next(mobiles)}'))[0]
+
+
+class ConcurrentReservationTests(TransactionTestCase):
+
+    def test_last_unit_is_reserved_once(self):
+        product = make_product(stock=1)
+        carts = [make_cart() for _ in range(4)]
+        barrier = threading.Barrier(len(carts))
+        outcomes = []
+
+        def reserve(cart):
+            try:
+                barrier.wait()
+                reserve_for_cart(cart, {product.id: 1})
+                outcomes.append('reserved')
+            except ReservationError:
+                outcomes.append('refused')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=reserve, args=(cart,)) for cart in carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes), ['refused'] * 3 + ['reserved'])
+        self.assertEqual(StockReservation.objects.filter(product=product).count(), 1)
+
+
+class ReservationTests(TestCase):
+
+    def setUp(self):
+        self.product = make_product(stock=2)
+
+    def test_holds_count_against_other_carts(self):
+        first, second = make_cart(), make_cart()
+        reserve_for_cart(first, {self.product.id: 2})
+        with self.assertRaises(ReservationError):
+            reserve_for_cart(second, {self.product.id: 1})
+        self.assertEqual(available_stock([self.product.id])[self.product.id], 0)
+        # a cart's own hold does not block it from changing its quantity
+        reserve_for_cart(first, {self.product.id: 1})
+        reserve_for_cart(second, {self.product.id: 1})
+
+    def test_expired_holds_free_the_stock(self):
+        first, second = make_cart(), make_cart()
+        reserve_for_cart(first, {self.product.id: 2})
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        reserve_for_cart(second, {self.product.id: 2})
+        self.assertEqual(expire_reservations(), 1)
+        self.assertEqual(list(StockReservation.objects.values_list('cart_id', flat=True)), [second.id])
+
+    def test_failed_payment_releases_the_order_holds(self):
+        cart = make_cart()
+        order = Order.objects.create(customer=cart.customer, total_price=20, shipping_address='a', city='c', zipcode='1')
+        OrderItem.objects.create(order=order, product=self.product, quantity=2, price=10)
+        reserve_for_cart(cart, {self.product.id: 2})
+        move_to_order(cart.id, order, {self.product.id: 2})
+        payment = Payment.objects.create(order=order, user=cart.customer, method='PayPal', amount=20)
+        self.assertEqual(available_stock([self.product.id])[self.product.id], 0)
+
+        event = GatewayEvent.objects.create(event_id='evt_failed', type=FAILED, payload={
+            'id': 'evt_failed', 'type': FAILED, 'data': {'payment_id': payment.id, 'amount': '20.00'},
+        })
+        self.assertEqual(process_event(event.pk), 'Processed')
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, 'Failed')
+        self.assertFalse(StockReservation.objects.filter(order=order).exists())
+        self.assertEqual(available_stock([self.product.id])[self.product.id], 2)
+
+
+class CartBatchTests(TestCase):
+
+    def setUp(self):
+        self.cart = make_cart()
+        self.first, self.second = make_product(stock=10), make_product(stock=10)
+
+    def lines(self):
+        return dict(CartItem.objects.filter(cart=self.cart).values_list('product_id', 'quantity'))
+
+    def test_operations_fold_per_product(self):
+        self.assertEqual(merge_operations([
+            {'product_id': 1, 'op': INCREMENT, 'quantity': 2},
+            {'product_id': 1, 'op': INCREMENT},
+            {'product_id': 2, 'op': SET, 'quantity': 4},
+            {'product_id': 2, 'op': INCREMENT, 'quantity': 2},
+            {'product_id': 3, 'op': REMOVE},
+            {'product_id': 3, 'op': INCREMENT, 'quantity': 5},
+            {'product_id': 4, 'op': INCREMENT, 'quantity': 5},
+            {'product_id': 4, 'op': SET, 'quantity': 0},
+        ]), {1: (INCREMENT, 3), 2: (SET, 6), 3: (SET, 5), 4: (REMOVE, 0)})
+
+    def test_mutate_cart(self):
+        mutate_cart(self.cart, [{'product_id': self.first.id, 'op': SET, 'quantity': 2}])
+        with self.assertNumQueries(11):
+            mutate_cart(self.cart, [
+                {'product_id': self.first.id, 'op': INCREMENT, 'quantity': 3},
+                {'product_id': self.second.id, 'op': INCREMENT, 'quantity': 1},
+                {'product_id': self.second.id, 'op': INCREMENT, 'quantity': 1},
+            ])
+        self.assertEqual(self.lines(), {self.first.id: 5, self.second.id: 2})
+        self.assertEqual(available_stock([self.first.id])[self.first.id], 5)
+        mutate_cart(self.cart, [{'product_id': self.first.id, 'op': REMOVE}])
+        self.assertEqual(self.lines(), {self.second.id: 2})
+        self.assertEqual(available_stock([self.first.id])[self.first.id], 10)
+
+    def test_failed_batch_changes_nothing(self):
+        mutate_cart(self.cart, [{'product_id': self.first.id, 'op': SET, 'quantity': 2}])
+        for operations in (
+            [{'product_id': self.first.id, 'op': INCREMENT, 'quantity': 1}, {'product_id': 0, 'op': SET, 'quantity': 1}],
+            [{'product_id': self.first.id, 'op': INCREMENT, 'quantity': 1}, {'product_id': self.second.id, 'op': SET, 'quantity': 11}],
+        ):
+            with self.subTest(operations=operations), self.assertRaises(CartError):
+                mutate_cart(self.cart, operations)
+            self.assertEqual(self.lines(), {self.first.id: 2})
+
+    def test_batch_endpoint(self):
+        client = APIClient()
+        client.credentials(HTTP_X_API_KEY=settings.API_KEY)
+        client.force_authenticate(self.cart.customer)
+        response = client.post(reverse('cart_batch'), {'items': [
+            {'product_id': self.first.id, 'quantity': 2},
+            {'product_id': self.second.id, 'op': 'set', 'quantity': 3},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.lines(), {self.first.id: 2, self.second.id: 3})
+        response = client.post(reverse('cart_batch'), {'items': [
+            {'product_id': self.first.id, 'op': 'increment', 'quantity': 0},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class GuestCartTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_API_KEY=settings.API_KEY)
+        self.first, self.second = make_product(stock=5), make_product(stock=5)
+        self.customer = MyUser.objects.create_user(mobile=f'0{next(mobiles)}')
+
+    def add(self, product, quantity):
+        response = self.client.post(reverse('add_to_cart'), {'product_id': product.id, 'quantity': quantity})
+        self.assertEqual(response.status_code, 201)
+
+    def login(self):
+        with mock.patch('builtins.print'):
+            otp = self.customer.generate_otp()
+        response = self.client.post(reverse('verify_customer_otp'), {'mobile': self.customer.mobile, 'otp': otp})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def lines(self):
+        cart = Cart.objects.get(customer=self.customer)
+        return dict(cart.items.values_list('product_id', 'quantity'))
+
+    def test_tampered_cookie_is_ignored(self):
+        self.add(self.first, 2)
+        token = self.client.cookies[settings.GUEST_CART_COOKIE].value
+        self.client.cookies[settings.GUEST_CART_COOKIE] = token.replace(':', ':x', 1)
+        self.assertEqual(self.client.get(reverse('cart')).data['items'], [])
+        self.login()
+        self.assertEqual(self.lines(), {})
+
+    def test_merge_into_the_existing_cart(self):
+        cart, _ = Cart.objects.get_or_create(customer=self.customer)
+        mutate_cart(cart, [{'product_id': self.first.id, 'op': SET, 'quantity': 1}])
+        self.add(self.first, 2)
+        self.add(self.second, 1)
+        response = self.login()
+        self.assertEqual(self.lines(), {self.first.id: 3, self.second.id: 1})
+        # the cookie is cleared once merged
+        cookie = response.cookies[settings.GUEST_CART_COOKIE]
+        self.assertEqual((cookie.value, cookie['max-age']), ('', 0))
+        self.assertEqual(
+            dict(StockReservation.objects.filter(cart__customer=self.customer).values_list('product_id', 'quantity')),
+            {self.first.id: 3, self.second.id: 1},
+        )
+
+    def test_merge_is_clamped_to_the_stock_left(self):
+        self.add(self.first, 4)
+        self.add(self.second, 1)
+        # meanwhile another customer holds 3 of the 5 units
+        reserve_for_cart(make_cart(), {self.first.id: 3})
+        self.login()
+        self.assertEqual(self.lines(), {self.first.id: 2, self.second.id: 1})
+        self.assertEqual(available_stock([self.first.id])[self.first.id], 0)
+
+    def test_sold_out_products_are_dropped(self):
+        self.add(self.first, 1)
+        self.add(self.second, 1)
+        reserve_for_cart(make_cart(), {self.first.id: 5})
+        self.login()
+        self.assertEqual(self.lines(), {self.second.id: 1})
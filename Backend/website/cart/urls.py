@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import CartView, AddToCartView, RemoveFromCartView
+from .views import CartView, AddToCartView, RemoveFromCartView, CartBatchView
 
 urlpatterns = [
     path('', CartView.as_view(), name="cart"),
     path('add/', AddToCartView.as_view(), name="add_to_cart"),
+    path('batch/', CartBatchView.as_view(), name="cart_batch"),
     path('remove/<int:item_id>/', RemoveFromCartView.as_view(), name="remove_from_cart"),
 ]
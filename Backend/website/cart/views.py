@@ -3,49 +3,90 @@ from django.shortcuts import render
 # Create your views here.
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework import status
+from django.db import transaction
+from django.db.models import Prefetch
 from .models import Cart, CartItem
-from products.models import Product
-from .serializers import CartSerializer, CartItemSerializer
+from .reservations import reserve_for_cart
+from .services import mutate_cart, CartError
+from .serializers import CartSerializer, CartItemSerializer, CartBatchSerializer
+from . import guest
 
+def priced_cart(user):
+    # two queries whatever the cart size: the cart, then its priced lines
+    items = Prefetch('items', queryset=CartItem.objects.with_prices().order_by('id'))
+    return Cart.objects.prefetch_related(items).filter(customer=user).first()
+
+# anonymous visitors get a cookie cart (see cart.guest), nothing is written to the database for them
 class CartView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [AllowAny]
 
     def get(self, request):
-        cart, _ = Cart.objects.get_or_create(customer=request.user)
+        if not request.user.is_authenticated:
+            return Response(guest.cart_data(guest.load(request)))
+        cart = priced_cart(request.user)
+        if cart is None:
+            return Response(guest.cart_data({}, customer=request.user.id))
         serializer = CartSerializer(cart)
         return Response(serializer.data)
 
 class AddToCartView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [AllowAny]
 
     def post(self, request):
-        cart, _ = Cart.objects.get_or_create(customer=request.user)
-        product_id = request.data.get("product_id")
-        quantity = request.data.get("quantity", 1)
-
         try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
-            return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+            product_id = int(request.data.get("product_id"))
+            quantity = int(request.data.get("quantity", 1))
+        except (TypeError, ValueError):
+            return Response({"error": "product_id and quantity must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        if quantity < 1:
+            return Response({"error": "Quantity must be at least 1"}, status=status.HTTP_400_BAD_REQUEST)
 
-        cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-        if not created:
-            cart_item.quantity += int(quantity)
-        else:
-            cart_item.quantity = int(quantity)
-        cart_item.save()
+        try:
+            if not request.user.is_authenticated:
+                items = guest.add(guest.load(request), product_id, quantity)
+                response = Response({"message": "Product added to cart"}, status=status.HTTP_201_CREATED)
+                return guest.store(response, items)
+            cart, _ = Cart.objects.get_or_create(customer=request.user)
+            # atomic increment of the line, also holds the stock for this cart
+            mutate_cart(cart, [{"product_id": product_id, "op": "increment", "quantity": quantity}])
+        except CartError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response({"message": "Product added to cart"}, status=status.HTTP_201_CREATED)
 
 class RemoveFromCartView(APIView):
-    permission_classes = [IsAuthenticated]
+    permission_classes = [AllowAny]
 
     def delete(self, request, item_id):
+        if not request.user.is_authenticated:
+            # guest lines are identified by their product id
+            items = guest.load(request)
+            if items.pop(item_id, None) is None:
+                return Response({"error": "Item not found"}, status=status.HTTP_404_NOT_FOUND)
+            response = Response({"message": "Item removed from cart"}, status=status.HTTP_200_OK)
+            return guest.store(response, items)
         try:
             cart_item = CartItem.objects.get(id=item_id, cart__customer=request.user)
-            cart_item.delete()
+            with transaction.atomic():
+                cart_item.delete()
+                reserve_for_cart(cart_item.cart, {cart_item.product_id: 0})
             return Response({"message": "Item removed from cart"}, status=status.HTTP_200_OK)
         except CartItem.DoesNotExist:
             return Response({"error": "Item not found"}, status=status.HTTP_404_NOT_FOUND)
+
+
+# set / increment / remove many lines in one request, e.g. to restore a saved cart or reorder
+class CartBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cart, _ = Cart.objects.get_or_create(customer=request.user)
+        try:
+            mutate_cart(cart, serializer.validated_data['items'])
+        except CartError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(CartSerializer(priced_cart(request.user)).data)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dashboard.sales import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the seller sales fact table from the completed orders (backfill or repair)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            written = rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} daily sales rows."))
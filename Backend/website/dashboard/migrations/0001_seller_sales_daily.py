@@ -0,0 +1,94 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill(apps, schema_editor):
+    OrderItem = apps.get_model("orders", "OrderItem")
+    SellerSalesDaily = apps.get_model("dashboard", "SellerSalesDaily")
+    rows = (
+        OrderItem.objects.filter(order__status="Completed")
+        .annotate(day=TruncDate("order__date_created"))
+        .values("product__seller_id", "product_id", "day")
+        .annotate(sold=Sum("quantity"), revenue=Sum(F("quantity") * F("price")))
+        .order_by()
+    )
+    SellerSalesDaily.objects.bulk_create(
+        [
+            SellerSalesDaily(
+                seller_id=row["product__seller_id"],
+                product_id=row["product_id"],
+                day=row["day"],
+                quantity=row["sold"],
+                revenue=row["revenue"],
+            )
+            for row in rows.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("orders", "0004_notification_counter"),
+        ("products", "0009_product_rating_sum"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SellerSalesDaily",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("quantity", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sales_daily",
+                        to="products.product",
+                    ),
+                ),
+                (
+                    "seller",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sales_daily",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["seller", "day"], name="sales_seller_day_idx")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("seller", "product", "day"),
+                        name="unique_seller_product_day",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
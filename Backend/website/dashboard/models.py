@@ -1,3 +1,24 @@
 from django.db import models
+from users.models import MyUser
+from products.models import Product
 
-# Create your models here.
+
+# pre-aggregated sales per seller, product and order day, fed by dashboard.sales when an
+# order completes, so revenue reports never touch the order tables
+class SellerSalesDaily(models.Model):
+    seller = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='sales_daily')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_daily')
+    day = models.DateField()
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['seller', 'product', 'day'], name='unique_seller_product_day'),
+        ]
+        indexes = [
+            models.Index(fields=['seller', 'day'], name='sales_seller_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.product_id}: {self.quantity} sold"
@@ -0,0 +1,75 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+
+# Runs the independent read sections of an endpoint side by side, each on its own thread
+# and database connection, under a cap on the number of queries they may issue together.
+# SQLite, and callers already inside a transaction (whose rows other connections cannot
+# see), run the sections one after the other on the current connection instead.
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=settings.DASHBOARD_WORKERS, thread_name_prefix='dashboard')
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+_DROPPED = object()
+
+
+class QueryBudget:
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            # refused queries are not counted, they never reach the database
+            if self.used >= self.limit:
+                raise QueryBudgetExceeded(f"More than {self.limit} queries: {sql[:200]}")
+            self.used += 1
+        return execute(sql, params, many, context)
+
+
+def _run_section(name, section, budget, own_connection):
+    try:
+        with connection.execute_wrapper(budget):
+            return name, section()
+    except QueryBudgetExceeded as error:
+        # the section is left out, the rest of the response is still served
+        logger.error("Section %s dropped: %s", name, error)
+        return name, _DROPPED
+    finally:
+        if own_connection:
+            # worker threads must not keep a connection open between requests
+            connection.close()
+
+
+def run_sections(sections, max_queries):
+    """Run {name: callable} and return {name: result}. A section whose query would take
+    the total over ``max_queries`` is logged and left out of the result, and its name is
+    listed under "sections_omitted" so clients can tell it from an empty section.
+
+    On SQLite the sections always run one after the other (and so do they inside a
+    transaction): the response time is the sum of the sections, not the slowest one."""
+    budget = QueryBudget(max_queries)
+    if connection.vendor == 'sqlite' or connection.in_atomic_block:
+        results = [_run_section(name, section, budget, False) for name, section in sections.items()]
+    else:
+        results = [
+            future.result() for future in
+            [_executor.submit(_run_section, name, section, budget, True) for name, section in sections.items()]
+        ]
+    data = {name: result for name, result in results if result is not _DROPPED}
+    omitted = [name for name, result in results if result is _DROPPED]
+    if omitted:
+        data['sections_omitted'] = omitted
+    return data
@@ -0,0 +1,84 @@
+from django.db.models import Case, When, F, Sum, Value, IntegerField, DecimalField
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from orders.models import OrderItem
+from .models import SellerSalesDaily
+
+
+def record_order(order):
+    """Add the lines of a completed order to its day's facts at their sold price: one
+    grouped read, one insert of the missing rows and one UPDATE, in the caller's transaction."""
+    day = timezone.localtime(order.date_created).date()
+    lines = {
+        row['product_id']: row
+        for row in OrderItem.objects.filter(order=order)
+        .values('product_id', 'product__seller_id')
+        .annotate(sold=Sum('quantity'), revenue=Sum(F('quantity') * F('price')))
+        .order_by()
+    }
+    if not lines:
+        return
+    SellerSalesDaily.objects.bulk_create(
+        [
+            SellerSalesDaily(seller_id=row['product__seller_id'], product_id=product_id, day=day)
+            for product_id, row in lines.items()
+        ],
+        ignore_conflicts=True,
+    )
+    # rows are keyed by (seller, product, day): matching on the seller as well keeps the
+    # update on this order's rows and lets it use the (seller, day) index
+    sellers = {row['product__seller_id'] for row in lines.values()}
+    SellerSalesDaily.objects.filter(day=day, seller_id__in=sellers, product_id__in=lines).update(
+        quantity=F('quantity') + Case(
+            *[
+                When(seller_id=row['product__seller_id'], product_id=product_id, then=Value(row['sold']))
+                for product_id, row in lines.items()
+            ],
+            output_field=IntegerField(),
+        ),
+        revenue=F('revenue') + Case(
+            *[
+                When(seller_id=row['product__seller_id'], product_id=product_id, then=Value(row['revenue']))
+                for product_id, row in lines.items()
+            ],
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+def product_sales(since):
+    """(product id, day, units sold) for every product and day from ``since``, across
+    sellers; the input of products.rankings."""
+    return (
+        SellerSalesDaily.objects.filter(day__gte=since)
+        .values_list('product_id', 'day')
+        .annotate(sold=Sum('quantity'))
+        .order_by()
+        .iterator()
+    )
+
+
+def rebuild(batch_size=1000):
+    """Recompute every fact from the completed orders, returns how many rows were written."""
+    SellerSalesDaily.objects.all().delete()
+    rows = (
+        OrderItem.objects.filter(order__status='Completed')
+        .annotate(day=TruncDate('order__date_created'))
+        .values('product__seller_id', 'product_id', 'day')
+        .annotate(sold=Sum('quantity'), revenue=Sum(F('quantity') * F('price')))
+        .order_by('day', 'product_id')
+        .iterator(chunk_size=batch_size)
+    )
+    written, batch = 0, []
+    for row in rows:
+        batch.append(SellerSalesDaily(
+            seller_id=row['product__seller_id'], product_id=row['product_id'], day=row['day'],
+            quantity=row['sold'], revenue=row['revenue'],
+        ))
+        if len(batch) >= batch_size:
+            written += len(SellerSalesDaily.objects.bulk_create(batch))
+            batch = []
+    if batch:
+        written += len(SellerSalesDaily.objects.bulk_create(batch))
+    return written
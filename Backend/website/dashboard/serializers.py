@@ -1,27 +1,41 @@
 from rest_framework import serializers
 from products.models import Product
 from orders.models import Order, Notification
+from orders.serializers import OrderItemSerializer
 from payments.models import Payment 
 
+# expects the items prefetched with orders.views.order_items_prefetch
 class LastOrdersSerializer(serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True, read_only=True)
+
     class Meta:
         model = Order
-        fields = ['id', 'product', 'quantity', 'total_price', 'date_created']
+        fields = ['id', 'total_price', 'status', 'date_created', 'items']
 
 class LastPaymentsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
-        fields = ['id', 'amount', 'date', 'status']
+        fields = ['id', 'order', 'method', 'amount', 'status', 'created_at']
 
 class NotificationsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
-        fields = ['id', 'message', 'date']
+        fields = ['id', 'order', 'message', 'created_at', 'is_read']
 
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ['id', 'name', 'price', 'stock', 'sold_quantity', 'description']
 
+class RevenuePointSerializer(serializers.Serializer):
+    period = serializers.DateField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    quantity = serializers.IntegerField()
+
 class RevenueSummarySerializer(serializers.Serializer):
-    total_revenue = serializers.DecimalField(max_digits=10, decimal_places=2)
+    start = serializers.DateField()
+    end = serializers.DateField()
+    interval = serializers.CharField()
+    total_revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    total_quantity = serializers.IntegerField()
+    series = RevenuePointSerializer(many=True)
@@ -0,0 +1,9 @@
+from django.dispatch import receiver
+
+from orders.signals import order_completed
+from .sales import record_order
+
+
+@receiver(order_completed)
+def add_order_to_sales(sender, order, **kwargs):
+    record_order(order)
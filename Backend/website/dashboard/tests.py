@@ -1,3 +1,99 @@
+import itertools
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from orders.models import Order, OrderItem
+from products.models import Product
+from users.models import MyUser
+from .models import SellerSalesDaily
+from .parallel import run_sections
+from .sales import record_order, rebuild
+
+mobiles = itertools.count(9120000001)
+
+
+def make_user(**fields):
+    return MyUser.objects.create_user(mobile=f'0{next(mobiles)}', **fields)
+
+
+class SalesFactsTests(TestCase):
+
+    def setUp(self):
+        self.seller = make_user(is_seller=True, is_customer=False)
+        self.customer = make_user()
+        self.product = Product.objects.create(
+            seller=self.seller, name='product', description='description', price=10, stock=10,
+        )
+
+    def order(self, quantity, price=10):
+        order = Order.objects.create(
+            customer=self.customer, total_price=quantity * price, shipping_address='a', city='c', zipcode='1',
+            status='Completed',
+        )
+        OrderItem.objects.create(order=order, product=self.product, quantity=quantity, price=price)
+        return order
+
+    def facts(self):
+        return set(SellerSalesDaily.objects.values_list('seller_id', 'product_id', 'quantity', 'revenue'))
+
+    def test_orders_add_up(self):
+        record_order(self.order(2))
+        record_order(self.order(1, price=8))
+        self.assertEqual(self.facts(), {(self.seller.id, self.product.id, 3, Decimal('28.00'))})
+        self.assertEqual(rebuild(), 1)
+        self.assertEqual(self.facts(), {(self.seller.id, self.product.id, 3, Decimal('28.00'))})
+
+    def test_other_sellers_rows_are_left_alone(self):
+        # the product was sold by another seller earlier the same day
+        previous = make_user(is_seller=True, is_customer=False)
+        SellerSalesDaily.objects.create(
+            seller=previous, product=self.product, day=timezone.localdate(), quantity=5, revenue=50,
+        )
+        record_order(self.order(2))
+        self.assertEqual(self.facts(), {
+            (previous.id, self.product.id, 5, Decimal('50.00')),
+            (self.seller.id, self.product.id, 2, Decimal('20.00')),
+        })
+
+
+class DashboardSectionTests(TestCase):
+
+    def dashboard(self):
+        client = APIClient()
+        client.credentials(HTTP_X_API_KEY=settings.API_KEY)
+        client.force_authenticate(make_user())
+        return client.get(reverse('customer_dashboard'))
+
+    def test_customer_dashboard_within_its_budget(self):
+        response = self.dashboard()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(response.data), {'last_orders', 'last_payments', 'notifications', 'unread_notifications', 'chat_support'},
+        )
+
+    def test_section_over_the_budget_is_dropped(self):
+        def users(count):
+            return lambda: [MyUser.objects.count() for _ in range(count)]
+
+        with self.assertLogs('dashboard.parallel', 'ERROR'):
+            data = run_sections({'one': users(1), 'too_many': users(3)}, 3)
+        self.assertEqual(data, {'one': [0], 'sections_omitted': ['too_many']})
+
+    def test_dashboard_renders_without_the_dropped_section(self):
+        def unread_count(user):
+            return [MyUser.objects.count() for _ in range(10)]
 
-# Create your tests here.
+        with mock.patch('dashboard.views.unread_count', unread_count), self.assertLogs('dashboard.parallel', 'ERROR'):
+            response = self.dashboard()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['sections_omitted'], ['unread_notifications'])
+        self.assertEqual(
+            set(response.data), {'last_orders', 'last_payments', 'notifications', 'chat_support', 'sections_omitted'},
+        )
+        self.assertEqual(response.data['last_orders'], [])
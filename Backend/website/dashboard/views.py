@@ -5,6 +5,7 @@ from products.models import Product
 from orders.models import Order, Notification
 from payments.models import Payment
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 
 
 from .serializers import (
@@ -15,45 +16,74 @@ from .serializers import (
     RevenueSummarySerializer
 )
 from django.db.models import Sum, F
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+from .models import SellerSalesDaily
+from .parallel import run_sections
+from orders.views import order_items_prefetch
+from orders.notifications import unread_count
+from website.utils import date_param
+
+
+# dashboard sections, each one or two indexed queries
+def last_orders(user, request=None):
+    orders = (
+        Order.objects.filter(customer=user).prefetch_related(order_items_prefetch())
+        .order_by('-date_created', '-id')[:5]
+    )
+    return LastOrdersSerializer(orders, many=True, context={'request': request}).data
+
+def last_payments(user):
+    payments = Payment.objects.filter(user=user).order_by('-created_at', '-id')[:5]
+    return LastPaymentsSerializer(payments, many=True).data
+
+def unread_notifications(user):
+    notifications = Notification.objects.filter(user=user, is_read=False).order_by('-id')[:10]
+    return NotificationsSerializer(notifications, many=True).data
 
 # Customer Views
 class CustomerDashboardView(APIView):
     permission_classes = [IsAuthenticated]
+    # 5 today (orders + their lines, payments, notifications, unread count), the headroom
+    # keeps one more query from dropping a section
+    max_queries = 8
 
     def get(self, request):
         user = request.user
         if not user.is_customer:
             return Response({"error": "Not a customer"}, status=403)
-        return Response({
-            "last_orders": "/api/customers/orders/",
-            "last_payments": "/api/customers/payments/",
-            "notifications": "/api/customers/notifications/",
-            "chat_support": "/api/customers/chat-support/"
-        })
+        # everything in one response, the independent sections run concurrently
+        data = run_sections({
+            "last_orders": lambda: last_orders(user, request),
+            "last_payments": lambda: last_payments(user),
+            "notifications": lambda: unread_notifications(user),
+            "unread_notifications": lambda: unread_count(user),
+        }, self.max_queries)
+        data["chat_support"] = reverse('customer_chat_support')
+        return Response(data)
 
 class LastOrdersView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        orders = Order.objects.filter(customer=user).order_by('-date_created')[:5]
-        return Response(LastOrdersSerializer(orders, many=True).data)
+        return Response(last_orders(request.user, request))
 
 class LastPaymentsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        payments = Payment.objects.filter(customer=user).order_by('-date')[:5]
-        return Response(LastPaymentsSerializer(payments, many=True).data)
+        return Response(last_payments(request.user))
 
 class NotificationsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        user = request.user
-        notifications = Notification.objects.filter(user=user).order_by('-date')[:10]
-        return Response(NotificationsSerializer(notifications, many=True).data)
+        return Response({
+            "unread": unread_count(request.user),
+            "results": unread_notifications(request.user),
+        })
 
 class ChatSupportView(APIView):
     permission_classes = [IsAuthenticated]
@@ -107,16 +137,45 @@ class ProductManagementView(APIView):
         product.delete()
         return Response({"message": "Product deleted successfully"})
 
+# revenue at the sold prices from the daily sales facts, e.g.
+# ?start=2024-01-01&end=2024-12-31&interval=month&product=12
 class RevenueSummaryView(APIView):
     permission_classes = [IsAuthenticated]
+    max_days = 3 * 366
 
     def get(self, request):
         user = request.user
         if not user.is_seller:
             return Response({"error": "Not a seller"}, status=403)
 
-        revenue = Product.objects.filter(seller=user).aggregate(
-            total_revenue=Sum(F('price') * F('sold_quantity'))
-        )
-
-        return Response({"total_revenue": revenue['total_revenue'] or 0})
\ No newline at end of file
+        end = date_param(request, 'end', timezone.localdate())
+        start = date_param(request, 'start', end and end - timedelta(days=29))
+        interval = request.query_params.get('interval', 'day')
+        if start is None or end is None or start > end:
+            return Response({"error": "start and end must be dates (YYYY-MM-DD), start before end"}, status=400)
+        if interval not in ('day', 'month'):
+            return Response({"error": "interval must be day or month"}, status=400)
+        if interval == 'day' and (end - start).days >= self.max_days:
+            return Response({"error": f"Daily series are limited to {self.max_days} days, use interval=month"}, status=400)
+
+        # a range scan on the (seller, day) index
+        facts = SellerSalesDaily.objects.filter(seller=user, day__range=(start, end))
+        if request.query_params.get('product', '').isdigit():
+            facts = facts.filter(product_id=request.query_params['product'])
+        period = F('day') if interval == 'day' else TruncMonth('day')
+        series = facts.annotate(period=period).values('period').annotate(
+            revenue=Sum('revenue'), quantity=Sum('quantity'),
+        ).order_by('period')
+        series = [
+            {"period": row['period'], "revenue": row['revenue'], "quantity": row['quantity']}
+            for row in series
+        ]
+
+        return Response(RevenueSummarySerializer({
+            "start": start,
+            "end": end,
+            "interval": interval,
+            "total_revenue": sum((row['revenue'] for row in series), Decimal('0.00')),
+            "total_quantity": sum(row['quantity'] for row in series),
+            "series": series,
+        }).data)
\ No newline at end of file
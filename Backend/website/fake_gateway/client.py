@@ -0,0 +1,47 @@
+import json
+import uuid
+
+from django.conf import settings
+from django.test import RequestFactory
+
+from payments.gateway import sign, SIGNATURE_HEADER, SUCCEEDED, FAILED
+from payments.views import GatewayWebhookView
+
+WEBHOOK_PATH = '/api/payments/webhook/'
+
+
+class FakeGateway:
+    """Stand-in for the payment gateway: builds events shaped like the real webhooks and
+    hands them straight to GatewayWebhookView, without any network. They are signed with
+    settings.FAKE_GATEWAY_SECRET, never with the real gateway's secret."""
+
+    def __init__(self, secret=None):
+        self.secret = secret if secret is not None else settings.FAKE_GATEWAY_SECRET
+        self.factory = RequestFactory()
+        self.webhook = GatewayWebhookView.as_view()
+
+    def event(self, payment, succeeded=True, amount=None):
+        return {
+            'id': f"evt_{uuid.uuid4().hex}",
+            'type': SUCCEEDED if succeeded else FAILED,
+            'data': {
+                'payment_id': payment.id,
+                'transaction_id': f"txn_{uuid.uuid4().hex}" if succeeded else None,
+                'amount': str(amount if amount is not None else payment.amount),
+            },
+        }
+
+    def deliver(self, event, secret=None):
+        """POST the event to the webhook view, returns the response."""
+        body = json.dumps(event).encode()
+        signature = sign(body, secret if secret is not None else self.secret)
+        request = self.factory.post(
+            WEBHOOK_PATH, body, content_type='application/json',
+            headers={SIGNATURE_HEADER: signature},
+        )
+        return self.webhook(request)
+
+    def charge(self, payment, succeeded=True):
+        event = self.event(payment, succeeded)
+        self.deliver(event)
+        return event
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.gateway import process_pending
+from payments.models import Payment
+from fake_gateway.client import FakeGateway
+
+
+class Command(BaseCommand):
+    help = "Pay pending payments through the fake gateway and time the webhook and the worker"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100, help="how many pending payments to pay")
+        parser.add_argument('--fail-every', type=int, default=0, help="make every n-th payment fail")
+
+    def handle(self, *args, **options):
+        gateway = FakeGateway()
+        payments = list(Payment.objects.filter(status='Pending').order_by('id')[:options['count']])
+        if not payments:
+            self.stdout.write("No pending payments.")
+            return
+
+        started = time.perf_counter()
+        for position, payment in enumerate(payments, 1):
+            fail = options['fail_every'] and position % options['fail_every'] == 0
+            gateway.charge(payment, succeeded=not fail)
+        delivered = time.perf_counter()
+        handled = process_pending()
+        finished = time.perf_counter()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Delivered {len(payments)} webhooks in {delivered - started:.2f}s "
+            f"({len(payments) / max(delivered - started, 1e-9):.0f}/s), "
+            f"processed {handled} events in {finished - delivered:.2f}s "
+            f"({handled / max(finished - delivered, 1e-9):.0f}/s)."
+        ))
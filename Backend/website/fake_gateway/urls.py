@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import FakeChargeView
+
+urlpatterns = [
+    path('charge/', FakeChargeView.as_view(), name='fake_gateway_charge'),
+]
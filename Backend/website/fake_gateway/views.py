@@ -0,0 +1,26 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from rest_framework import status
+from payments.models import Payment
+from payments.gateway import process_pending
+from .client import FakeGateway
+
+
+# "pay" one of your payments through the fake gateway: the signed webhook is delivered
+# in-process and, with "process": true, the queue is applied before answering
+class FakeChargeView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            payment = Payment.objects.get(id=request.data.get('payment_id'), user=request.user)
+        except (Payment.DoesNotExist, ValueError, TypeError):
+            return Response({"error": "Payment not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        succeeded = request.data.get('outcome', 'succeeded') != 'failed'
+        event = FakeGateway().charge(payment, succeeded)
+        if request.data.get('process'):
+            process_pending()
+            payment.refresh_from_db()
+        return Response({"event": event['id'], "payment_status": payment.status}, status=status.HTTP_200_OK)
@@ -0,0 +1,125 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:19
+
+import django.db.models.deletion
+from django.conf import settings
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def split_orders(apps, schema_editor):
+    # one sub-order per (order, seller) for the existing orders, dated like their order
+    Order = apps.get_model("orders", "Order")
+    OrderItem = apps.get_model("orders", "OrderItem")
+    SubOrder = apps.get_model("orders", "SubOrder")
+
+    order_ids = list(Order.objects.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(order_ids), 500):
+        chunk = order_ids[start : start + 500]
+        subtotals, item_ids = defaultdict(int), defaultdict(list)
+        for item_id, order_id, seller_id, quantity, price in OrderItem.objects.filter(
+            order_id__in=chunk
+        ).values_list("id", "order_id", "product__seller_id", "quantity", "price"):
+            subtotals[order_id, seller_id] += quantity * price
+            item_ids[order_id, seller_id].append(item_id)
+        SubOrder.objects.bulk_create(
+            [
+                SubOrder(order_id=order_id, seller_id=seller_id, subtotal=subtotal)
+                for (order_id, seller_id), subtotal in subtotals.items()
+            ]
+        )
+        for sub_order_id, order_id, seller_id in SubOrder.objects.filter(
+            order_id__in=chunk
+        ).values_list("id", "order_id", "seller_id"):
+            OrderItem.objects.filter(id__in=item_ids[order_id, seller_id]).update(
+                sub_order_id=sub_order_id
+            )
+
+    SubOrder.objects.update(
+        date_created=Subquery(
+            Order.objects.filter(id=OuterRef("order_id")).values("date_created")
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SubOrder",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("subtotal", models.DecimalField(decimal_places=2, max_digits=10)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Pending", "Pending"),
+                            ("Processing", "Processing"),
+                            ("Shipped", "Shipped"),
+                            ("Delivered", "Delivered"),
+                            ("Cancelled", "Cancelled"),
+                        ],
+                        default="Pending",
+                        max_length=20,
+                    ),
+                ),
+                ("date_created", models.DateTimeField(auto_now_add=True)),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sub_orders",
+                        to="orders.order",
+                    ),
+                ),
+                (
+                    "seller",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sub_orders",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="orderitem",
+            name="sub_order",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="items",
+                to="orders.suborder",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="suborder",
+            index=models.Index(
+                fields=["seller", "-date_created", "-id"],
+                name="suborder_seller_created_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="suborder",
+            constraint=models.UniqueConstraint(
+                fields=("order", "seller"), name="unique_order_seller"
+            ),
+        ),
+        migrations.RunPython(split_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0002_sub_order"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["customer", "-date_created", "-id"],
+                name="order_customer_created_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_unread(apps, schema_editor):
+    Notification = apps.get_model("orders", "Notification")
+    NotificationCounter = apps.get_model("orders", "NotificationCounter")
+    rows = (
+        Notification.objects.filter(is_read=False)
+        .values("user_id")
+        .annotate(unread=Count("id"))
+        .order_by()
+    )
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=row["user_id"], unread=row["unread"]) for row in rows],
+        batch_size=1000,
+    )
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0003_order_customer_created_idx"),
+        ("users", "0006_seller_business_license_seller_is_approved"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NotificationCounter",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="notification_counter",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("unread", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="order",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="notifications",
+                to="orders.order",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["user", "is_read", "-id"], name="notification_user_unread_idx"
+            ),
+        ),
+        migrations.RunPython(count_unread, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0004_notification_counter"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="order",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("Pending", "Pending"),
+                    ("Completed", "Completed"),
+                    ("Oversold", "Oversold"),
+                ],
+                default="Pending",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -1,6 +1,15 @@
-from django.db import models
+import logging
+
+from django.db import models, transaction
+from django.db.models import Case, When, F, Value, IntegerField, Sum
 from users.models import MyUser
 from products.models import Product
+from products.cache import bump_catalog_version
+from cart.reservations import active_reservations, lock_and_check, release_order, ReservationError
+from website.events import publish_on_commit
+from .signals import order_completed
+
+logger = logging.getLogger(__name__)
 
 
 class Order(models.Model):
@@ -8,37 +17,108 @@ class Order(models.Model):
     customer = models.ForeignKey(MyUser, on_delete=models.CASCADE)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     date_created = models.DateTimeField(auto_now_add=True)
-    status = models.CharField(max_length=20, choices=[('Pending', 'Pending'), ('Completed', 'Completed')], default='Pending')
+    # Oversold: paid after its stock holds expired and the stock was gone, needs a refund
+    status = models.CharField(max_length=20, choices=[
+        ('Pending', 'Pending'), ('Completed', 'Completed'), ('Oversold', 'Oversold'),
+    ], default='Pending')
     shipping_address = models.TextField()
     city = models.CharField(max_length=200)
     zipcode = models.CharField(max_length=10)
 
+    class Meta:
+        indexes = [
+            # customer order history, newest first (see OrderCursorPagination)
+            models.Index(fields=['customer', '-date_created', '-id'], name='order_customer_created_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.id} - {self.MyUser.mobile}"
     
     def complete_order(self):
-        self.status = "Completed"
-        self.save()
-        for item in self.items.all():
-            product = item.product
-            product.sold_quantity += item.quantity
-            product.save()
-
-    def create_order_from_cart(self, cart):
-        self.customer = cart.customer
-        self.total_price = sum(item.total_price() for item in cart.items.all())
-        self.save()
-        for cart_item in cart.items.all():
-            OrderItem.objects.create(
-                order=self,
-                product=cart_item.product,
-                quantity=cart_item.quantity,
-                price=cart_item.product.price
+        # one-time Pending -> Completed transition. Returns False when the order was
+        # already handled, so repeated calls never count the same sale twice.
+        with transaction.atomic():
+            updated = Order.objects.filter(pk=self.pk, status="Pending").update(status="Completed")
+            if not updated:
+                return False
+            quantities = dict(
+                OrderItem.objects.filter(order=self).values("product_id").annotate(total=Sum("quantity"))
+                .order_by("product_id").values_list("product_id", "total")
             )
-        cart.items.all().delete()
+            try:
+                with transaction.atomic():
+                    held = set(active_reservations().filter(order=self).values_list("product_id", flat=True))
+                    if not held.issuperset(quantities):
+                        # the holds expired (a late or retried payment), other carts may hold the stock by now
+                        lock_and_check(quantities, exclude_order=self)
+                    # take the stock of every line in one UPDATE, guarded per line so no
+                    # product goes below zero; a short rowcount rolls the whole take back
+                    wanted = Case(
+                        *[When(id=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+                        output_field=IntegerField(),
+                    )
+                    taken = Product.objects.filter(id__in=quantities, stock__gte=wanted).update(
+                        stock=F("stock") - wanted, sold_quantity=F("sold_quantity") + wanted,
+                    )
+                    if taken != len(quantities):
+                        raise ReservationError(f"Not enough stock for {len(quantities) - taken} of the lines.")
+            except ReservationError as error:
+                # paid but no longer deliverable: flag the order for a refund, stock is untouched
+                logger.warning("Order %s was paid but is oversold: %s", self.pk, error)
+                Order.objects.filter(pk=self.pk).update(status="Oversold")
+                release_order(self)
+                publish_on_commit(self.customer_id, 'order', {'id': self.pk, 'status': 'Oversold'})
+                self.status = "Oversold"
+                return False
+            release_order(self)
+            order_completed.send(sender=Order, order=self)
+            transaction.on_commit(bump_catalog_version)
+            publish_on_commit(self.customer_id, 'order', {'id': self.pk, 'status': 'Completed'})
+        self.status = "Completed"
+        return True
+
+# the part of an order a single seller fulfils, so seller listings never have to join
+# through order items and every shipment has its own status
+class SubOrder(models.Model):
+
+    STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Processing', 'Processing'),
+        ('Shipped', 'Shipped'),
+        ('Delivered', 'Delivered'),
+        ('Cancelled', 'Cancelled'),
+    ]
+    # the statuses a sub-order may move to from each status; Shipped also needs a paid
+    # (Completed) order
+    TRANSITIONS = {
+        'Pending': {'Processing', 'Cancelled'},
+        'Processing': {'Shipped', 'Cancelled'},
+        'Shipped': {'Delivered'},
+        'Delivered': set(),
+        'Cancelled': set(),
+    }
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='sub_orders')
+    seller = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='sub_orders')
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'seller'], name='unique_order_seller'),
+        ]
+        indexes = [
+            # seller order listing, newest first (see SubOrderCursorPagination)
+            models.Index(fields=['seller', '-date_created', '-id'], name='suborder_seller_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order {self.order_id} - seller {self.seller_id}"
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
+    sub_order = models.ForeignKey(SubOrder, on_delete=models.CASCADE, related_name='items', null=True, blank=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='order_items')
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -48,9 +128,24 @@ class OrderItem(models.Model):
 
 class Notification(models.Model):
     user = models.ForeignKey(MyUser, on_delete=models.CASCADE)
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='notifications')
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # unread notifications of a user, newest first
+            models.Index(fields=['user', 'is_read', '-id'], name='notification_user_unread_idx'),
+        ]
+
     def __str__(self):
         return f"Notification for {self.user.username}"
+
+# denormalized unread notification count, only changed through orders.notifications
+class NotificationCounter(models.Model):
+    user = models.OneToOneField(MyUser, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.unread} unread notifications for {self.user_id}"
@@ -0,0 +1,70 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, When, F, Value, IntegerField
+from django.db.models.functions import Greatest
+
+from website.events import publish_on_commit
+from .models import Notification, NotificationCounter
+
+
+def notification_event(notification):
+    # payload of the "notification" server-sent event, resumable by its id
+    return {
+        'id': notification.id,
+        'order': notification.order_id,
+        'message': notification.message,
+        'created_at': notification.created_at,
+    }
+
+
+def notify(notifications):
+    """Write unsaved Notification objects with one bulk insert and add them to their
+    users' unread counters with one UPDATE, in the caller's transaction. Open event
+    streams of the users get them once it commits."""
+    if not notifications:
+        return []
+    with transaction.atomic():
+        created = Notification.objects.bulk_create(notifications)
+        per_user = Counter(notification.user_id for notification in notifications)
+        NotificationCounter.objects.bulk_create(
+            [NotificationCounter(user_id=user_id) for user_id in per_user], ignore_conflicts=True
+        )
+        NotificationCounter.objects.filter(user_id__in=per_user).update(unread=F('unread') + Case(
+            *[When(user_id=user_id, then=Value(count)) for user_id, count in per_user.items()],
+            output_field=IntegerField(),
+        ))
+        for notification in created:
+            publish_on_commit(notification.user_id, 'notification', notification_event(notification), notification.id)
+    return created
+
+
+def order_notifications(order, lines_by_seller):
+    """One notification per seller for a new order, {seller id: number of lines}."""
+    return [
+        Notification(
+            user_id=seller_id,
+            order=order,
+            message=f"{count} item{'s' if count != 1 else ''} in order #{order.id}. "
+                    f"Shipping to {order.shipping_address}, {order.city}, {order.zipcode}.",
+        )
+        for seller_id, count in lines_by_seller.items()
+    ]
+
+
+def mark_read(user, up_to_id=None):
+    """Mark every unread notification of the user up to ``up_to_id`` (all of them when
+    None) as read with a single UPDATE and take exactly the flipped rows off the counter.
+    Returns how many were marked."""
+    with transaction.atomic():
+        unread = Notification.objects.filter(user=user, is_read=False)
+        if up_to_id is not None:
+            unread = unread.filter(id__lte=up_to_id)
+        marked = unread.update(is_read=True)
+        if marked:
+            NotificationCounter.objects.filter(user=user).update(unread=Greatest(F('unread') - marked, 0))
+    return marked
+
+
+def unread_count(user):
+    return NotificationCounter.objects.filter(user=user).values_list('unread', flat=True).first() or 0
@@ -0,0 +1,16 @@
+from website.pagination import KeysetPagination
+
+
+# newest first, backed by the (customer, date_created, id) index on Order
+class OrderCursorPagination(KeysetPagination):
+    ordering = ('-date_created', '-id')
+
+
+# newest first, backed by the (seller, date_created, id) index on SubOrder
+class SubOrderCursorPagination(KeysetPagination):
+    ordering = ('-date_created', '-id')
+
+
+# newest first, backed by the (user, is_read, id) index on Notification
+class NotificationCursorPagination(KeysetPagination):
+    ordering = ('-id',)
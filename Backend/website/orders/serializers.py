@@ -1,20 +1,56 @@
 from rest_framework import serializers
-from .models import Order, OrderItem, Notification
+from products.images import srcset
+from .models import Order, SubOrder, OrderItem, Notification
 
 
+# expects the items prefetched with their product (see order_items_prefetch)
 class OrderItemSerializer(serializers.ModelSerializer):
+    product_name = serializers.ReadOnlyField(source='product.name')
+    product_image = serializers.SerializerMethodField()
+
     class Meta:
         model = OrderItem
-        fields = ['product', 'quantity', 'price']
+        fields = ['product', 'product_name', 'product_image', 'quantity', 'price']
+
+    def get_product_image(self, obj):
+        return srcset(obj.product.image, self.context.get('request'))
 
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
-        fields = ['id', 'user', 'total_amount', 'created_at', 'status', 'items', 'shipping_address', 'city', 'zipcode']
+        fields = ['id', 'customer', 'total_price', 'date_created', 'status', 'items', 'shipping_address', 'city', 'zipcode']
+
+# what one seller sees of an order: its own lines and where to ship them
+class SubOrderSerializer(serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True, read_only=True)
+    shipping_address = serializers.ReadOnlyField(source='order.shipping_address')
+    city = serializers.ReadOnlyField(source='order.city')
+    zipcode = serializers.ReadOnlyField(source='order.zipcode')
+    payment_status = serializers.ReadOnlyField(source='order.status')
+
+    class Meta:
+        model = SubOrder
+        fields = [
+            'id', 'order', 'subtotal', 'status', 'payment_status', 'date_created', 'items',
+            'shipping_address', 'city', 'zipcode'
+        ]
+
+class SubOrderStatusSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=SubOrder.STATUS_CHOICES)
+
+class CheckoutSerializer(serializers.Serializer):
+    # each field defaults to the customer's profile address
+    shipping_address = serializers.CharField(required=False)
+    city = serializers.CharField(max_length=200, required=False)
+    zipcode = serializers.CharField(max_length=10, required=False)
 
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
-        fields = ['id', 'user', 'message', 'created_at', 'is_read']
\ No newline at end of file
+        fields = ['id', 'user', 'order', 'message', 'created_at', 'is_read']
+
+class MarkReadSerializer(serializers.Serializer):
+    # left out to mark every notification read
+    up_to_id = serializers.IntegerField(min_value=1, required=False)
\ No newline at end of file
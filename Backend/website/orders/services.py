@@ -0,0 +1,72 @@
+from collections import defaultdict
+
+from django.db import transaction
+
+from cart.models import CartItem
+from cart.reservations import lock_and_check, move_to_order, ReservationError
+from .models import Order, SubOrder, OrderItem
+from .notifications import notify, order_notifications
+
+
+class CheckoutError(Exception):
+    pass
+
+
+def checkout(customer, shipping_address, city, zipcode):
+    """Turn the customer's cart into an order in one transaction and a fixed number of
+    queries, whatever the cart size: lock the products (in id order, so concurrent
+    checkouts cannot deadlock), check the stock left after other carts' and orders'
+    holds, move the cart's holds onto the order, create the per-seller sub-orders, the
+    order lines and one notification per seller in bulk, then empty the cart. The stock
+    itself is taken when the order's payment completes (Order.complete_order)."""
+    with transaction.atomic():
+        lines = list(
+            CartItem.objects.filter(cart__customer=customer).values_list('id', 'cart_id', 'product_id', 'quantity')
+        )
+        if not lines:
+            raise CheckoutError("Your cart is empty.")
+        cart_id = lines[0][1]
+
+        quantities = defaultdict(int)
+        for _, _, product_id, quantity in lines:
+            quantities[product_id] += quantity
+
+        try:
+            products = lock_and_check(quantities, exclude_cart=cart_id)
+        except ReservationError as error:
+            raise CheckoutError(str(error))
+
+        order = Order.objects.create(
+            customer=customer,
+            total_price=sum(products[product_id].unit_price * quantity for product_id, quantity in quantities.items()),
+            shipping_address=shipping_address,
+            city=city,
+            zipcode=zipcode,
+        )
+        subtotals = defaultdict(int)
+        for product_id, quantity in quantities.items():
+            subtotals[products[product_id].seller_id] += products[product_id].unit_price * quantity
+        sub_orders = {
+            sub_order.seller_id: sub_order
+            for sub_order in SubOrder.objects.bulk_create([
+                SubOrder(order=order, seller_id=seller_id, subtotal=subtotal)
+                for seller_id, subtotal in subtotals.items()
+            ])
+        }
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                sub_order=sub_orders[products[product_id].seller_id],
+                product_id=product_id,
+                quantity=quantity,
+                price=products[product_id].unit_price,
+            )
+            for product_id, quantity in quantities.items()
+        ])
+        lines_by_seller = defaultdict(int)
+        for product_id in quantities:
+            lines_by_seller[products[product_id].seller_id] += 1
+        notify(order_notifications(order, lines_by_seller))
+        move_to_order(cart_id, order, quantities)
+        CartItem.objects.filter(id__in=[line[0] for line in lines]).delete()
+    return order
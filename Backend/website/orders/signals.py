@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# sent inside the transaction of Order.complete_order, once per order (sender=Order, order=...)
+order_completed = Signal()
@@ -1,3 +1,299 @@
+import itertools
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from cart.models import Cart, CartItem, StockReservation
+from cart.reservations import reserve_for_cart, move_to_order
+from products.models import Product
+from users.models import MyUser
+from .models import Order, SubOrder, OrderItem, Notification, NotificationCounter
+from .notifications import notify, mark_read, unread_count
+from .services import checkout, CheckoutError
+from .signals import order_completed
+
+mobiles = itertools.count(9120000001)
+
+
+class OrderTestCase(TestCase):
+
+    def setUp(self):
+        self.seller = MyUser.objects.create_user(mobile=f'0{next(mobiles)}', is_seller=True, is_customer=False)
+        self.customer = MyUser.objects.create_user(mobile=f'0{next(mobiles)}')
+        self.product = Product.objects.create(
+            seller=self.seller, name='product', description='description', price=10, stock=3,
+        )
+
+    def order(self, quantity, hold=True):
+        order = Order.objects.create(
+            customer=self.customer, total_price=10 * quantity, shipping_address='a', city='c', zipcode='1',
+        )
+        OrderItem.objects.create(order=order, product=self.product, quantity=quantity, price=10)
+        if hold:
+            cart, _ = Cart.objects.get_or_create(customer=self.customer)
+            reserve_for_cart(cart, {self.product.id: quantity})
+            move_to_order(cart.id, order, {self.product.id: quantity})
+        return order
+
+    def complete(self, order):
+        with self.captureOnCommitCallbacks(execute=True):
+            return order.complete_order()
+
+    def add_to_cart(self, product, quantity):
+        cart, _ = Cart.objects.get_or_create(customer=self.customer)
+        CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+        reserve_for_cart(cart, {product.id: quantity})
+        return cart
+
+    def cart_of(self, lines):
+        # one line of 2 for each of ``lines`` new sellers
+        for _ in range(lines):
+            self.add_to_cart(Product.objects.create(
+                seller=MyUser.objects.create_user(mobile=f'0{next(mobiles)}', is_seller=True, is_customer=False),
+                name='product', description='description', price=10, stock=3,
+            ), 2)
+
+    def checkout(self):
+        return checkout(self.customer, 'a', 'c', '1')
+
+
+class OversoldCompletionTests(OrderTestCase):
+
+    def test_held_order_takes_its_stock(self):
+        order = self.order(2)
+        self.assertTrue(self.complete(order))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.sold_quantity), (1, 2))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_hold_with_stock_left_still_completes(self):
+        order = self.order(2)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(self.complete(order))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 1)
+
+    def test_expired_hold_with_stock_gone_is_flagged(self):
+        order = self.order(2)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        Product.objects.filter(pk=self.product.pk).update(stock=1)
+        self.assertFalse(self.complete(order))
+        order.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual(order.status, 'Oversold')
+        self.assertEqual((self.product.stock, self.product.sold_quantity), (1, 0))
+        # a redelivered payment event does not retry the completion
+        self.assertFalse(self.complete(order))
+
+    def test_expired_hold_taken_by_another_cart_is_flagged(self):
+        order = self.order(2)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        other = MyUser.objects.create_user(mobile=f'0{next(mobiles)}')
+        cart, _ = Cart.objects.get_or_create(customer=other)
+        reserve_for_cart(cart, {self.product.id: 3})
+        self.assertFalse(self.complete(order))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'Oversold')
+
+
+class GuardedCompletionTests(OrderTestCase):
+
+    def test_sale_is_counted_once(self):
+        order = self.order(2, hold=False)
+        # a second line of the same product is taken in the same update
+        OrderItem.objects.create(order=order, product=self.product, quantity=1, price=10)
+        receiver = mock.Mock()
+        order_completed.connect(receiver, sender=Order)
+        self.addCleanup(order_completed.disconnect, receiver, sender=Order)
+
+        # loaded before the completion, e.g. by a redelivered payment event
+        stale = Order.objects.get(pk=order.pk)
+        self.assertTrue(self.complete(order))
+        self.assertFalse(self.complete(order))
+        self.assertFalse(self.complete(stale))
+        # saving a completed order does not count it again
+        order.save()
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.sold_quantity), (0, 3))
+        self.assertEqual(receiver.call_count, 1)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'Completed')
+
+
+    def test_query_count_does_not_grow_with_the_lines(self):
+        def completion_queries(lines):
+            order = self.order(1, hold=False)
+            for _ in range(lines - 1):
+                product = Product.objects.create(
+                    seller=self.seller, name='product', description='description', price=10, stock=3,
+                )
+                OrderItem.objects.create(order=order, product=product, quantity=1, price=10)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertTrue(self.complete(order))
+            return len(queries)
+
+        self.assertEqual(completion_queries(1), completion_queries(5))
+
+    def test_short_line_rolls_back_the_whole_take(self):
+        order = self.order(1, hold=False)
+        short = Product.objects.create(seller=self.seller, name='short', description='description', price=10, stock=0)
+        OrderItem.objects.create(order=order, product=short, quantity=1, price=10)
+        self.assertFalse(self.complete(order))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.sold_quantity), (3, 0))
+        self.assertEqual(Order.objects.get(pk=order.pk).status, 'Oversold')
+
+
+class CheckoutTests(OrderTestCase):
+
+    def test_totals_add_up_from_the_rounded_unit_price(self):
+        Product.objects.filter(pk=self.product.pk).update(in_sale=True, sale_price=Decimal('9.995'))
+        self.add_to_cart(self.product, 3)
+        client = APIClient()
+        client.credentials(HTTP_X_API_KEY=settings.API_KEY)
+        client.force_authenticate(self.customer)
+        cart = client.get(reverse('cart')).json()
+        self.assertEqual((cart['items'][0]['product_price'], cart['items'][0]['total_price']), ('10.00', '30.00'))
+        self.assertEqual(cart['total_price'], '30.00')
+
+        order = self.checkout()
+        order.refresh_from_db()
+        line = order.items.get()
+        self.assertEqual(line.price, Decimal('10.00'))
+        self.assertEqual(order.total_price, sum(item.price * item.quantity for item in order.items.all()))
+        self.assertEqual(order.total_price, Decimal('30.00'))
+        self.assertEqual(SubOrder.objects.get(order=order).subtotal, Decimal('30.00'))
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        counts = []
+        for lines in (1, 6):
+            self.cart_of(lines)
+            with CaptureQueriesContext(connection) as queries:
+                self.checkout()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_stock_shortfall_rolls_back(self):
+        cart = self.add_to_cart(self.product, 2)
+        other = MyUser.objects.create_user(mobile=f'0{next(mobiles)}')
+        other_cart, _ = Cart.objects.get_or_create(customer=other)
+        # the holds expired and another customer took the stock meanwhile
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        reserve_for_cart(other_cart, {self.product.id: 2})
+        with self.assertRaises(CheckoutError):
+            self.checkout()
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(SubOrder.objects.exists())
+        self.assertEqual(list(cart.items.values_list('product_id', 'quantity')), [(self.product.id, 2)])
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.product.sold_quantity), (3, 0))
+        self.assertFalse(StockReservation.objects.filter(order__isnull=False).exists())
+
+    def test_cart_and_holds_move_to_the_order(self):
+        cart = self.add_to_cart(self.product, 2)
+        self.cart_of(2)
+        order = self.checkout()
+        self.assertFalse(cart.items.exists())
+        self.assertFalse(StockReservation.objects.filter(cart=cart).exists())
+        self.assertEqual(
+            sorted(StockReservation.objects.filter(order=order).values_list('product_id', 'quantity')),
+            sorted(order.items.values_list('product_id', 'quantity')),
+        )
+        self.assertEqual(SubOrder.objects.filter(order=order).count(), 3)
+        with self.assertRaises(CheckoutError):
+            self.checkout()
+
+
+class NotificationTests(OrderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_API_KEY=settings.API_KEY)
+        self.client.force_authenticate(self.seller)
+
+    def notify(self, count, user=None):
+        return notify([Notification(user=user or self.seller, message=str(i)) for i in range(count)])
+
+    def test_one_notification_per_seller_and_order(self):
+        second = Product.objects.create(seller=self.seller, name='other', description='description', price=5, stock=3)
+        self.add_to_cart(self.product, 2)
+        self.add_to_cart(second, 1)
+        self.cart_of(1)
+        order = self.checkout()
+        notifications = Notification.objects.filter(order=order)
+        self.assertEqual(notifications.count(), 2)
+        self.assertTrue(notifications.get(user=self.seller).message.startswith(f'2 items in order #{order.id}.'))
+        self.assertEqual(unread_count(self.seller), 1)
+
+    def test_counter_follows_notify_and_mark_read(self):
+        first, second, third = self.notify(3)
+        self.notify(2, user=self.customer)
+        self.assertEqual((unread_count(self.seller), unread_count(self.customer)), (3, 2))
+        self.assertEqual(mark_read(self.seller, second.id), 2)
+        self.assertEqual(unread_count(self.seller), 1)
+        # already read notifications are not taken off the counter again
+        self.assertEqual(mark_read(self.seller, second.id), 0)
+        Notification.objects.filter(pk=first.pk).update(is_read=True)
+        self.assertEqual(mark_read(self.seller, first.id), 0)
+        self.assertEqual(unread_count(self.seller), 1)
+        self.assertEqual(unread_count(self.customer), 2)
+
+    def test_mark_read_endpoints(self):
+        created = self.notify(3)
+        response = self.client.get(reverse('seller-notifications-unread-count'))
+        self.assertEqual(response.data, {'unread': 3})
+        response = self.client.post(reverse('seller-notifications-mark-read'), {'up_to_id': created[0].id})
+        self.assertEqual(response.data, {'marked': 1, 'unread': 2})
+        # without up_to_id every notification is marked
+        response = self.client.post(reverse('seller-notifications-mark-read'), {})
+        self.assertEqual(response.data, {'marked': 2, 'unread': 0})
+        self.assertEqual(NotificationCounter.objects.get(user=self.seller).unread, 0)
+        self.assertEqual(self.client.post(reverse('seller-notifications-mark-read'), {}).data, {'marked': 0, 'unread': 0})
+
+
+class OrderHistoryTests(OrderTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_API_KEY=settings.API_KEY)
+        self.client.force_authenticate(self.customer)
+
+    def history(self, url=None):
+        response = self.client.get(url or reverse('order-list'))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_only_own_orders_newest_first(self):
+        orders = [self.order(1, hold=False) for _ in range(3)]
+        other = Order.objects.create(
+            customer=MyUser.objects.create_user(mobile=f'0{next(mobiles)}'),
+            total_price=10, shipping_address='a', city='c', zipcode='1',
+        )
+        data = self.history(f"{reverse('order-list')}?page_size=2")
+        ids = [order['id'] for order in data['results']]
+        ids += [order['id'] for order in self.history(data['next'])['results']]
+        self.assertEqual(ids, [order.id for order in reversed(orders)])
+        self.assertEqual(self.client.get(reverse('order-detail', args=[other.pk])).status_code, 404)
+
+    def test_query_count_does_not_grow_with_the_page(self):
+        def history_queries(orders):
+            Order.objects.all().delete()
+            for _ in range(orders):
+                order = self.order(1, hold=False)
+                OrderItem.objects.create(order=order, product=self.product, quantity=1, price=10)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(len(self.history()['results']), orders)
+            return len(queries)
 
-# Create your tests here.
+        self.assertEqual(history_queries(1), history_queries(20))
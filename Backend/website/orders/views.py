@@ -1,49 +1,51 @@
-from rest_framework import viewsets, status
+from rest_framework import viewsets, mixins, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import Order, OrderItem, Notification
-from .serializers import OrderSerializer, NotificationSerializer
-from cart.models import CartItem
+from django.db.models import Prefetch
+from .models import Order, OrderItem
+from .pagination import OrderCursorPagination
+from .serializers import OrderSerializer, CheckoutSerializer
+from .services import checkout, CheckoutError
 
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = Order.objects.all()
-    serializer_class = OrderSerializer
-    permission_classes = [IsAuthenticated]
 
-    def create(self, request, *args, **kwargs):
-        user = request.user
-        customer_profile = user.customer_profile
-        cart_items = CartItem.objects.filter(user=user, ordered=False)
+def order_items_prefetch(lookup='items'):
+    # the lines of every order with a summary of their product, in one query
+    return Prefetch(lookup, queryset=OrderItem.objects.select_related('product').only(
+        'id', 'order_id', 'sub_order_id', 'product_id', 'quantity', 'price', 'product__name', 'product__image', 'product__image_variants',
+    ).order_by('id'))
 
-        if not cart_items.exists():
-            return Response({"error": "Your cart is empty."}, status=status.HTTP_400_BAD_REQUEST)
-
-        total_amount = sum(item.product.price * item.quantity for item in cart_items)
-        order = Order.objects.create(
-            user=user, 
-            total_amount=total_amount,
-            shipping_address=f"{customer_profile.address1}, {customer_profile.address2}",
-            city=customer_profile.city,
-            zipcode=customer_profile.zipcode
+# the requesting customer's order history, orders are only created through checkout
+class OrderViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    serializer_class = OrderSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
+
+    def get_queryset(self):
+        # a range scan on the (customer, date_created, id) index plus one query for the lines
+        return (
+            Order.objects.filter(customer=self.request.user)
+            .prefetch_related(order_items_prefetch())
+            .order_by('-date_created', '-id')
         )
 
-        for cart_item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.product,
-                quantity=cart_item.quantity,
-                price=cart_item.product.price
-            )
-            cart_item.ordered = True
-            cart_item.save()
-
-            seller = cart_item.product.seller
-            Notification.objects.create(
-                user=seller.user,
-                message=f"New order for product '{cart_item.product.name}' with quantity {cart_item.quantity}. Shipping to {order.shipping_address}, {order.city}, {order.zipcode}."
-            )
-
-        CartItem.objects.filter(user=user, ordered=True).delete()
-        serializer = self.get_serializer(order)
+    def create(self, request, *args, **kwargs):
+        serializer = CheckoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        profile = getattr(request.user, 'customer_profile', None)
+        shipping = {
+            'shipping_address': serializer.validated_data.get('shipping_address')
+                or (profile and ", ".join(part for part in (profile.address1, profile.address2) if part)),
+            'city': serializer.validated_data.get('city') or (profile and profile.city),
+            'zipcode': serializer.validated_data.get('zipcode') or (profile and profile.zipcode),
+        }
+        missing = [field for field, value in shipping.items() if not value]
+        if missing:
+            return Response({"error": f"Missing shipping details: {', '.join(missing)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            order = checkout(request.user, **shipping)
+        except CheckoutError as error:
+            return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(self.get_queryset().get(pk=order.pk))
         return Response(serializer.data, status=status.HTTP_201_CREATED)
-
@@ -0,0 +1,125 @@
+import hashlib
+import hmac
+import logging
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from cart.reservations import release_order
+from .models import Payment, GatewayEvent
+
+logger = logging.getLogger(__name__)
+
+
+# Webhooks carry a "t=<unix time>,v1=<hex HMAC-SHA256 of '<t>.<raw body>'>" signature
+# header made with settings.PAYMENT_GATEWAY_SECRET (see webhook_secrets).
+# The body is a JSON event:
+#   {"id": "evt_...", "type": "payment.succeeded" | "payment.failed",
+#    "data": {"payment_id": 1, "transaction_id": "...", "amount": "10.00"}}
+SIGNATURE_HEADER = 'X-Gateway-Signature'
+SUCCEEDED, FAILED = 'payment.succeeded', 'payment.failed'
+MAX_ATTEMPTS = 5
+
+
+def sign(body, secret=None, timestamp=None):
+    secret = secret if secret is not None else settings.PAYMENT_GATEWAY_SECRET
+    timestamp = int(timestamp if timestamp is not None else time.time())
+    digest = hmac.new(secret.encode(), f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+
+def verify_signature(body, header, secret=None, tolerance=None):
+    secret = secret if secret is not None else settings.PAYMENT_GATEWAY_SECRET
+    tolerance = tolerance if tolerance is not None else settings.PAYMENT_WEBHOOK_TOLERANCE
+    if not secret or not header:
+        return False
+    try:
+        parts = dict(part.split('=', 1) for part in header.split(','))
+        timestamp = int(parts['t'])
+    except (KeyError, ValueError):
+        return False
+    if abs(time.time() - timestamp) > tolerance:
+        return False
+    return hmac.compare_digest(sign(body, secret, timestamp), f"t={timestamp},v1={parts.get('v1', '')}")
+
+def webhook_secrets():
+    # the fake gateway's test-only secret is refused unless that app is enabled
+    secrets = [settings.PAYMENT_GATEWAY_SECRET]
+    if settings.FAKE_GATEWAY_ENABLED:
+        secrets.append(settings.FAKE_GATEWAY_SECRET)
+    return [secret for secret in secrets if secret]
+
+#---------------------------------------------------------------------------
+# queue worker
+
+class EventError(Exception):
+    pass
+
+
+def apply_event(event):
+    data = event.payload.get('data', {})
+    try:
+        payment = Payment.objects.select_for_update().select_related('order').get(id=data.get('payment_id'))
+    except (Payment.DoesNotExist, ValueError, TypeError):
+        raise EventError("Unknown payment.")
+
+    if event.type == SUCCEEDED:
+        if payment.status == 'Completed':
+            return
+        # compared as numbers: gateways send 10, "10" or "10.0" for a 10.00 payment
+        try:
+            amount = Decimal(str(data['amount']))
+        except (KeyError, InvalidOperation):
+            raise EventError("Missing or invalid amount.")
+        if not amount.is_finite() or amount != payment.amount:
+            raise EventError(f"Amount {data['amount']} does not match the payment amount {payment.amount}.")
+        # completes the order too, which turns its stock holds into real decrements
+        payment.mark_as_completed(transaction_id=data.get('transaction_id'))
+    elif event.type == FAILED:
+        if payment.status != 'Pending':
+            return
+        payment.mark_as_failed()
+        release_order(payment.order)
+    else:
+        raise EventError(f"Unsupported event type {event.type}.")
+
+
+def process_event(event_pk):
+    """Apply one pending event in its own transaction. Returns its final status."""
+    with transaction.atomic():
+        event = GatewayEvent.objects.select_for_update().filter(pk=event_pk, status='Pending').first()
+        if event is None:
+            return None
+        event.attempts += 1
+        try:
+            with transaction.atomic():
+                apply_event(event)
+        except EventError as error:
+            event.status, event.error = 'Failed', str(error)
+        except Exception as error:
+            # unexpected failure, the event stays queued until MAX_ATTEMPTS
+            logger.exception("Could not process gateway event %s", event.event_id)
+            event.error = repr(error)
+            if event.attempts >= MAX_ATTEMPTS:
+                event.status = 'Failed'
+        else:
+            event.status, event.error = 'Processed', ''
+        if event.status != 'Pending':
+            event.processed_at = timezone.now()
+        event.save(update_fields=['status', 'error', 'attempts', 'processed_at'])
+        return event.status
+
+
+def process_pending(batch_size=100):
+    """Apply the pending events in arrival order, returns how many were handled."""
+    handled = 0
+    while True:
+        ids = list(GatewayEvent.objects.filter(status='Pending').order_by('id').values_list('id', flat=True)[:batch_size])
+        processed = [pk for pk in ids if process_event(pk) not in (None, 'Pending')]
+        handled += len(processed)
+        # stop when the queue is empty or only events waiting for a retry are left
+        if len(ids) < batch_size or not processed:
+            return handled
@@ -0,0 +1,95 @@
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+
+def fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def replay(record):
+    return Response(record.response, status=record.status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(endpoint):
+    """Make a POST handler idempotent per (user, endpoint, Idempotency-Key header).
+
+    The handler runs in one transaction with the insert of the key row, and its response
+    is stored in that row. A duplicate sent meanwhile blocks on the unique key until the
+    first one commits, then gets the stored response back, so retries can never repeat
+    the work. Reusing a key with a different body is refused with 422. Server errors are
+    not stored: the transaction rolls back with the key and the request can be retried.
+    Requests without the header run as before."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return handler(view, request, *args, **kwargs)
+            if len(key) > 255:
+                return Response({"error": f"{HEADER} is too long."}, status=status.HTTP_400_BAD_REQUEST)
+
+            lookup = {'user': request.user, 'endpoint': endpoint, 'key': key}
+            body_fingerprint = fingerprint(request)
+            for _ in range(2):
+                with transaction.atomic():
+                    try:
+                        with transaction.atomic():
+                            record = IdempotencyKey.objects.create(
+                                **lookup,
+                                fingerprint=body_fingerprint,
+                                status_code=status.HTTP_202_ACCEPTED,
+                                response={},
+                                expires_at=timezone.now() + settings.IDEMPOTENCY_KEY_TTL,
+                            )
+                    except IntegrityError:
+                        record = None
+
+                    if record is not None:
+                        response = handler(view, request, *args, **kwargs)
+                        if response.status_code >= 500:
+                            transaction.set_rollback(True)
+                            return response
+                        record.status_code, record.response = response.status_code, response.data
+                        record.save(update_fields=['status_code', 'response'])
+                        return response
+
+                    existing = IdempotencyKey.objects.filter(**lookup).first()
+                    if existing is None:
+                        continue
+                    if existing.expires_at <= timezone.now():
+                        # an old key is being reused, forget it and start over
+                        existing.delete()
+                        continue
+                    if existing.fingerprint != body_fingerprint:
+                        return Response(
+                            {"error": f"This {HEADER} was already used with a different request."},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                        )
+                    return replay(existing)
+            return Response({"error": "Please retry the request."}, status=status.HTTP_409_CONFLICT)
+        return wrapper
+    return decorator
+
+
+def purge_expired(batch_size=1000):
+    """Delete expired keys in batches, returns how many were removed."""
+    removed = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return removed
+        removed += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.gateway import process_pending
+
+
+class Command(BaseCommand):
+    help = "Apply the queued payment gateway webhooks in arrival order (once, or continuously with --loop)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help="keep polling the queue")
+        parser.add_argument('--interval', type=float, default=1.0, help="seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            handled = process_pending(options['batch_size'])
+            if handled or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"Processed {handled} gateway events."))
+            if not options['loop']:
+                return
+            if not handled:
+                time.sleep(options['interval'])
@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from payments.reconciliation import reconcile_file
+
+
+class Command(BaseCommand):
+    help = "Match a gateway settlement file (CSV or NDJSON, optionally .gz) against the payments"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help="defaults to the file extension")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument(
+            '--grace-hours', type=int, default=24,
+            help="completed payments younger than this are not expected in the file yet",
+        )
+
+    def handle(self, *args, **options):
+        def progress(counts):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{counts['lines']} lines read")
+
+        try:
+            run = reconcile_file(
+                options['path'], options['format'], options['chunk_size'],
+                timedelta(hours=options['grace_hours']), progress,
+            )
+        except OSError as error:
+            raise CommandError(f"Could not read {options['path']}: {error}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Reconciliation #{run.id}: {run.lines} lines, {run.matched} matched, {run.mismatched} mismatched, "
+            f"{run.unknown} unknown transactions, {run.unsettled} unsettled payments, {run.invalid} invalid lines."
+        ))
@@ -0,0 +1,132 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0004_notification_counter"),
+        ("payments", "0003_gateway_event"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReconciliationEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("amount_mismatch", "Amount mismatch"),
+                            ("status_mismatch", "Status mismatch"),
+                            ("duplicate", "Settled twice"),
+                            ("unknown_transaction", "Settled but unknown to us"),
+                            ("unsettled_payment", "Completed but never settled"),
+                            ("invalid_line", "Unreadable line"),
+                        ],
+                        max_length=30,
+                    ),
+                ),
+                ("transaction_id", models.CharField(blank=True, max_length=100)),
+                (
+                    "expected_amount",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=10, null=True
+                    ),
+                ),
+                (
+                    "settled_amount",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=10, null=True
+                    ),
+                ),
+                ("line_number", models.PositiveIntegerField(blank=True, null=True)),
+                ("detail", models.TextField(blank=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ReconciliationRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("source", models.CharField(max_length=500)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("Running", "Running"),
+                            ("Finished", "Finished"),
+                            ("Failed", "Failed"),
+                        ],
+                        default="Running",
+                        max_length=20,
+                    ),
+                ),
+                ("lines", models.PositiveIntegerField(default=0)),
+                ("matched", models.PositiveIntegerField(default=0)),
+                ("mismatched", models.PositiveIntegerField(default=0)),
+                ("unknown", models.PositiveIntegerField(default=0)),
+                ("unsettled", models.PositiveIntegerField(default=0)),
+                ("invalid", models.PositiveIntegerField(default=0)),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="settled_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["status", "settled_at"], name="payment_settlement_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="reconciliationentry",
+            name="payment",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="reconciliation_entries",
+                to="payments.payment",
+            ),
+        ),
+        migrations.AddField(
+            model_name="reconciliationentry",
+            name="run",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="entries",
+                to="payments.reconciliationrun",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reconciliationentry",
+            index=models.Index(
+                fields=["run", "kind"], name="reconciliation_run_kind_idx"
+            ),
+        ),
+    ]
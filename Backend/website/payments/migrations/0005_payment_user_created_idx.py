@@ -0,0 +1,22 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0004_notification_counter"),
+        ("payments", "0004_reconciliation"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"], name="payment_user_created_idx"
+            ),
+        ),
+    ]
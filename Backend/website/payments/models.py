@@ -1,8 +1,8 @@
-from django.db import models
-
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
 from orders.models import Order
 from users.models import MyUser
+from website.events import publish_on_commit
 from datetime import datetime
 
 
@@ -29,15 +29,138 @@ class Payment(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # set by reconcile_settlements when the gateway's settlement file lists the payment
+    settled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # completed payments still waiting for their settlement
+            models.Index(fields=['status', 'settled_at'], name='payment_settlement_idx'),
+            # a customer's latest payments
+            models.Index(fields=['user', '-created_at', '-id'], name='payment_user_created_idx'),
+        ]
 
     def __str__(self):
         return f"Payment #{self.id} - {self.status}"
 
     def mark_as_completed(self, transaction_id):
-        self.status = 'Completed'
-        self.transaction_id = transaction_id
-        self.save()
+        # completing the payment completes the order, which converts its stock holds
+        with transaction.atomic():
+            self.status = 'Completed'
+            self.transaction_id = transaction_id
+            self.save()
+            self.order.complete_order()
+            self.publish_status()
 
     def mark_as_failed(self):
         self.status = 'Failed'
         self.save()
+        self.publish_status()
+
+    def publish_status(self):
+        # pushed to the customer's open event streams (website.sse)
+        publish_on_commit(self.user_id, 'payment', {'id': self.pk, 'order': self.order_id, 'status': self.status})
+
+
+# first response of a request sent with an Idempotency-Key header, replayed to its retries
+# (see payments.idempotency)
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='idempotency_keys')
+    endpoint = models.CharField(max_length=100)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'endpoint', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint} {self.key}"
+
+
+# a gateway callback, stored by the webhook and applied in order by process_gateway_events
+class GatewayEvent(models.Model):
+
+    STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Processed', 'Processed'),
+        ('Failed', 'Failed'),
+    ]
+
+    event_id = models.CharField(max_length=100, unique=True)  # the gateway's id, deduplicates redeliveries
+    type = models.CharField(max_length=50)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='gateway_event_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.type} {self.event_id} - {self.status}"
+
+
+# one run of reconcile_settlements over a gateway settlement file
+class ReconciliationRun(models.Model):
+
+    STATUS_CHOICES = [
+        ('Running', 'Running'),
+        ('Finished', 'Finished'),
+        ('Failed', 'Failed'),
+    ]
+
+    source = models.CharField(max_length=500)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Running')
+    lines = models.PositiveIntegerField(default=0)
+    matched = models.PositiveIntegerField(default=0)
+    mismatched = models.PositiveIntegerField(default=0)
+    unknown = models.PositiveIntegerField(default=0)
+    unsettled = models.PositiveIntegerField(default=0)
+    invalid = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Reconciliation #{self.id} of {self.source} - {self.status}"
+
+# a problem found by a reconciliation run
+class ReconciliationEntry(models.Model):
+
+    KIND_CHOICES = [
+        ('amount_mismatch', 'Amount mismatch'),
+        ('status_mismatch', 'Status mismatch'),
+        ('duplicate', 'Settled twice'),
+        ('unknown_transaction', 'Settled but unknown to us'),
+        ('unsettled_payment', 'Completed but never settled'),
+        ('invalid_line', 'Unreadable line'),
+    ]
+
+    run = models.ForeignKey(ReconciliationRun, on_delete=models.CASCADE, related_name='entries')
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True, related_name='reconciliation_entries')
+    transaction_id = models.CharField(max_length=100, blank=True)
+    expected_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    settled_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    line_number = models.PositiveIntegerField(null=True, blank=True)
+    detail = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run', 'kind'], name='reconciliation_run_kind_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.transaction_id}"
@@ -0,0 +1,173 @@
+import csv
+import gzip
+import itertools
+import json
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Payment, ReconciliationRun, ReconciliationEntry
+
+
+# Settlement files list one settled transaction per line, as CSV with a header row or as
+# NDJSON, optionally gzip compressed:
+#   transaction_id,amount,status        {"transaction_id": "...", "amount": "10.00", "status": "settled"}
+# They are read as a generator pipeline (lines -> records -> chunks), so memory stays the
+# size of one chunk whatever the file size, and every chunk is matched with one in_bulk.
+SETTLED_STATUSES = {'settled', 'paid', 'completed', 'success'}
+
+
+def open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'ndjson' if name.endswith(('.ndjson', '.jsonl', '.json')) else 'csv'
+
+
+def read_rows(stream, file_format):
+    """(line number, dict or None for an unreadable line)"""
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+def parse_records(rows):
+    """(line number, transaction id, amount, settled, error)"""
+    for line_number, row in rows:
+        try:
+            transaction_id = str(row['transaction_id']).strip()
+            # kept exact: a fraction of a cent off is reported as an amount mismatch
+            amount = Decimal(str(row['amount']))
+            settled = str(row.get('status') or 'settled').strip().lower() in SETTLED_STATUSES
+        except (TypeError, KeyError, InvalidOperation):
+            amount = None
+        if amount is None or not amount.is_finite():
+            yield line_number, None, None, None, "Missing or malformed transaction_id/amount."
+            continue
+        if not transaction_id:
+            yield line_number, None, None, None, "Empty transaction_id."
+            continue
+        yield line_number, transaction_id, amount, settled, None
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def reconcile_chunk(run, chunk, counts):
+    """Match one chunk of records against the payments, store the problems and stamp the
+    matched payments as settled."""
+    entries, settled_ids = [], []
+    ids = [record[1] for record in chunk if record[1] is not None]
+    payments = Payment.objects.only('id', 'transaction_id', 'amount', 'status', 'settled_at').in_bulk(
+        ids, field_name='transaction_id'
+    )
+    seen = set()
+
+    for line_number, transaction_id, amount, settled, error in chunk:
+        counts['lines'] += 1
+        if error:
+            counts['invalid'] += 1
+            entries.append(ReconciliationEntry(run=run, kind='invalid_line', line_number=line_number, detail=error))
+            continue
+
+        payment = payments.get(transaction_id)
+        if payment is None:
+            counts['unknown'] += 1
+            entries.append(ReconciliationEntry(
+                run=run, kind='unknown_transaction', transaction_id=transaction_id,
+                settled_amount=amount, line_number=line_number,
+            ))
+            continue
+
+        problems = []
+        if transaction_id in seen or (payment.settled_at and payment.settled_at >= run.started_at):
+            problems.append(('duplicate', "Listed more than once in this file."))
+        if payment.amount != amount:
+            problems.append(('amount_mismatch', f"Expected {payment.amount}, settled {amount}."))
+        if settled != (payment.status == 'Completed'):
+            state = 'settled' if settled else 'not settled'
+            problems.append(('status_mismatch', f"Payment is {payment.status} but the gateway reports it {state}."))
+        seen.add(transaction_id)
+
+        if problems:
+            counts['mismatched'] += 1
+        else:
+            counts['matched'] += 1
+        if settled:
+            settled_ids.append(payment.id)
+        entries.extend(
+            ReconciliationEntry(
+                run=run, kind=kind, payment=payment, transaction_id=transaction_id,
+                expected_amount=payment.amount, settled_amount=amount, line_number=line_number, detail=detail,
+            )
+            for kind, detail in problems
+        )
+
+    ReconciliationEntry.objects.bulk_create(entries)
+    if settled_ids:
+        Payment.objects.filter(id__in=settled_ids).update(settled_at=timezone.now())
+
+
+def flag_unsettled(run, grace, chunk_size, counts):
+    """Completed payments older than ``grace`` that no settlement file ever listed.
+
+    An unsettled_payment entry stays open until the payment settles (which takes it out of
+    this query), so payments an earlier run already flagged are not flagged again."""
+    cutoff = run.started_at - grace
+    flagged = ReconciliationEntry.objects.filter(payment=OuterRef('pk'), kind='unsettled_payment')
+    payments = (
+        Payment.objects.filter(status='Completed', settled_at__isnull=True, updated_at__lt=cutoff)
+        .exclude(Exists(flagged))
+        .values_list('id', 'transaction_id', 'amount')
+        .iterator(chunk_size=chunk_size)
+    )
+    for chunk in chunked(payments, chunk_size):
+        counts['unsettled'] += len(chunk)
+        ReconciliationEntry.objects.bulk_create([
+            ReconciliationEntry(
+                run=run, kind='unsettled_payment', payment_id=payment_id,
+                transaction_id=transaction_id or '', expected_amount=amount,
+            )
+            for payment_id, transaction_id, amount in chunk
+        ])
+
+
+def reconcile_file(path, file_format=None, chunk_size=5000, grace=timedelta(days=1), progress=None):
+    """Reconcile a settlement file, returns the finished ReconciliationRun."""
+    run = ReconciliationRun.objects.create(source=path)
+    counts = dict.fromkeys(['lines', 'matched', 'mismatched', 'unknown', 'unsettled', 'invalid'], 0)
+    try:
+        with open_text(path) as stream:
+            records = parse_records(read_rows(stream, file_format or detect_format(path)))
+            for chunk in chunked(records, chunk_size):
+                reconcile_chunk(run, chunk, counts)
+                # counters are saved per chunk so a long run can be followed from the table
+                ReconciliationRun.objects.filter(pk=run.pk).update(**counts)
+                if progress:
+                    progress(counts)
+        flag_unsettled(run, grace, chunk_size, counts)
+    except (OSError, UnicodeDecodeError, csv.Error, EOFError):
+        ReconciliationRun.objects.filter(pk=run.pk).update(status='Failed', finished_at=timezone.now(), **counts)
+        raise
+    ReconciliationRun.objects.filter(pk=run.pk).update(status='Finished', finished_at=timezone.now(), **counts)
+    run.refresh_from_db()
+    return run
@@ -1,3 +1,311 @@
-from django.test import TestCase
+import gzip
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from orders.models import Order
+from users.models import MyUser
+from .gateway import sign, process_pending, SUCCEEDED, FAILED
+from .idempotency import purge_expired
+from .models import Payment, IdempotencyKey, GatewayEvent, ReconciliationEntry
+from .reconciliation import reconcile_file
+
+mobiles = itertools.count(9120000001)
+INITIATE = '/api/payments/initiate/'
+
+
+def make_customer():
+    return MyUser.objects.create_user(mobile=f'0{next(mobiles)}')
+
+
+def make_order(customer, total=10):
+    return Order.objects.create(customer=customer, total_price=total, shipping_address='a', city='c', zipcode='1')
+
+
+def api_client(user=None):
+    client = APIClient()
+    client.credentials(HTTP_X_API_KEY=settings.API_KEY)
+    if user is not None:
+        client.force_authenticate(user)
+    return client
+
+
+class IdempotencyTests(TestCase):
+
+    def setUp(self):
+        self.customer = make_customer()
+        self.order = make_order(self.customer)
+        self.client = api_client(self.customer)
+
+    def initiate(self, key, method='COD'):
+        return self.client.post(INITIATE, {'order_id': self.order.id, 'method': method}, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_gets_the_first_response(self):
+        first = self.initiate('key-1')
+        self.assertEqual(first.status_code, 201)
+        retry = self.initiate('key-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_key_reused_with_another_body_is_refused(self):
+        self.initiate('key-1')
+        response = self.initiate('key-1', method='PayPal')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Payment.objects.get().method, 'COD')
+
+    def test_keys_are_scoped_per_user(self):
+        self.initiate('key-1')
+        other = make_customer()
+        response = api_client(other).post(
+            INITIATE, {'order_id': make_order(other).id, 'method': 'COD'}, HTTP_IDEMPOTENCY_KEY='key-1',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Payment.objects.count(), 2)
+
+    def test_expired_key_runs_again(self):
+        self.initiate('key-1')
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        response = self.initiate('key-1', method='PayPal')
+        # a fresh run of the handler: the open payment is handed back
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_verify_retry_gets_the_first_answer(self):
+        payment = self.initiate('key-1').json()
+        verify = '/api/payments/verify/'
+        first = self.client.post(verify, {'payment_id': payment['id']}, HTTP_IDEMPOTENCY_KEY='verify-1')
+        self.assertEqual(first.status_code, 202)
+        Payment.objects.filter(pk=payment['id']).update(status='Completed')
+        retry = self.client.post(verify, {'payment_id': payment['id']}, HTTP_IDEMPOTENCY_KEY='verify-1')
+        self.assertEqual((retry.status_code, retry.json()), (202, first.json()))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        # a new key asks again
+        fresh = self.client.post(verify, {'payment_id': payment['id']}, HTTP_IDEMPOTENCY_KEY='verify-2')
+        self.assertEqual((fresh.status_code, fresh.json()['status']), (200, 'Completed'))
+
+    def test_purge_expired(self):
+        self.initiate('key-1')
+        self.initiate('key-2', method='PayPal')
+        IdempotencyKey.objects.filter(key='key-1').update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(purge_expired(), 1)
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['key-2'])
+
+
+class ConcurrentIdempotencyTests(TransactionTestCase):
+
+    def test_concurrent_duplicates_run_once(self):
+        customer = make_customer()
+        order = make_order(customer)
+        create = Payment.objects.create
+        barrier = threading.Barrier(3)
+        responses = []
+
+        def slow_create(**fields):
+            # keep the first request inside its transaction while the duplicates arrive
+            time.sleep(0.2)
+            return create(**fields)
+
+        def post():
+            try:
+                barrier.wait()
+                responses.append(api_client(customer).post(
+                    INITIATE, {'order_id': order.id, 'method': 'COD'}, HTTP_IDEMPOTENCY_KEY='key-1',
+                ))
+            finally:
+                connection.close()
+
+        with mock.patch.object(Payment.objects, 'create', side_effect=slow_create):
+            threads = [threading.Thread(target=post) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual([response.status_code for response in responses], [201, 201, 201])
+        self.assertEqual(len({response.json()['id'] for response in responses}), 1)
+        self.assertEqual(sum(response.get('Idempotent-Replayed') == 'true' for response in responses), 2)
+        self.assertEqual(Payment.objects.count(), 1)
+
+
+@override_settings(PAYMENT_GATEWAY_SECRET='gateway-secret', FAKE_GATEWAY_ENABLED=False, FAKE_GATEWAY_SECRET='fake-secret')
+class GatewayWebhookTests(TestCase):
+
+    def setUp(self):
+        self.customer = make_customer()
+        self.order = make_order(self.customer, total=10)
+        self.payment = Payment.objects.create(order=self.order, user=self.customer, method='PayPal', amount=10)
+        self.events = itertools.count(1)
+
+    def event(self, event_type=SUCCEEDED, **data):
+        return {
+            'id': f'evt_{next(self.events)}',
+            'type': event_type,
+            'data': {'payment_id': self.payment.id, 'transaction_id': 'txn_1', 'amount': '10.00', **data},
+        }
+
+    def deliver(self, event, secret='gateway-secret', timestamp=None):
+        body = json.dumps(event).encode()
+        return self.client.post(
+            '/api/payments/webhook/', body, content_type='application/json',
+            HTTP_X_GATEWAY_SIGNATURE=sign(body, secret, timestamp),
+        )
+
+    def process(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            process_pending()
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+
+    def test_invalid_signatures_are_refused(self):
+        event = self.event()
+        self.assertEqual(self.deliver(event, secret='wrong').status_code, 400)
+        self.assertEqual(self.deliver(event, timestamp=time.time() - 3600).status_code, 400)
+        # the fake gateway's secret only works while it is enabled
+        self.assertEqual(self.deliver(event, secret='fake-secret').status_code, 400)
+        response = self.client.post('/api/payments/webhook/', json.dumps(event), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(GatewayEvent.objects.exists())
+        with self.settings(FAKE_GATEWAY_ENABLED=True):
+            self.assertEqual(self.deliver(event, secret='fake-secret').status_code, 202)
+
+    def test_payment_completes_the_order(self):
+        self.assertEqual(self.deliver(self.event()).status_code, 202)
+        self.assertEqual(self.payment.status, 'Pending')
+        self.process()
+        self.assertEqual((self.payment.status, self.payment.transaction_id), ('Completed', 'txn_1'))
+        self.assertEqual(self.order.status, 'Completed')
+
+    def test_redelivered_event_is_applied_once(self):
+        event = self.event()
+        self.deliver(event)
+        self.assertEqual(self.deliver(event).status_code, 202)
+        self.assertEqual(GatewayEvent.objects.count(), 1)
+        self.process()
+        self.deliver(event)
+        self.process()
+        self.assertEqual(GatewayEvent.objects.get().attempts, 1)
+        self.assertEqual(self.payment.status, 'Completed')
+
+    def test_late_failure_after_success_is_ignored(self):
+        self.deliver(self.event(SUCCEEDED))
+        self.deliver(self.event(FAILED))
+        self.process()
+        self.assertEqual(self.payment.status, 'Completed')
+        self.assertEqual(set(GatewayEvent.objects.values_list('status', flat=True)), {'Processed'})
+
+    def test_success_after_failure_completes(self):
+        self.deliver(self.event(FAILED))
+        self.process()
+        self.assertEqual(self.payment.status, 'Failed')
+        self.deliver(self.event(SUCCEEDED))
+        self.process()
+        self.assertEqual(self.payment.status, 'Completed')
+
+    def test_amount_is_compared_as_a_number(self):
+        for amount in (10, '10', '10.0', 10.0):
+            with self.subTest(amount=amount):
+                Payment.objects.filter(pk=self.payment.pk).update(status='Pending', transaction_id=None)
+                self.deliver(self.event(amount=amount, transaction_id=f'txn_{amount!r}'))
+                self.process()
+                self.assertEqual(self.payment.status, 'Completed')
+
+    def test_amount_mismatch_fails_the_event(self):
+        for amount in ('9.99', None, 'ten', 'NaN'):
+            with self.subTest(amount=amount):
+                self.deliver(self.event(amount=amount))
+                self.process()
+                event = GatewayEvent.objects.latest('id')
+                self.assertEqual(event.status, 'Failed')
+                self.assertEqual(self.payment.status, 'Pending')
+        missing = self.event()
+        del missing['data']['amount']
+        self.deliver(missing)
+        self.process()
+        self.assertEqual(GatewayEvent.objects.latest('id').error, 'Missing or invalid amount.')
+
+
+class ReconciliationTests(TestCase):
+
+    def setUp(self):
+        self.customer = make_customer()
+        self.payments = [
+            Payment.objects.create(
+                order=make_order(self.customer), user=self.customer, method='COD', amount=10,
+                transaction_id=f't{i}', status='Pending' if i == 3 else 'Completed',
+            )
+            for i in range(6)
+        ]
+        # t5 completed days ago and is in no settlement file
+        Payment.objects.filter(pk=self.payments[5].pk).update(updated_at=timezone.now() - timedelta(days=3))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def settlement_file(self, name, rows, extra=''):
+        path = os.path.join(self.directory, name)
+        with gzip.open(path, 'wt', encoding='utf-8') as stream:
+            stream.writelines(json.dumps(row) + '\n' for row in rows)
+            stream.write(extra)
+        return path
+
+    def test_problems_are_recorded(self):
+        path = self.settlement_file('settlement.ndjson.gz', [
+            {'transaction_id': 't0', 'amount': '10.00', 'status': 'settled'},
+            {'transaction_id': 't1', 'amount': '9.00', 'status': 'settled'},
+            {'transaction_id': 't3', 'amount': '10', 'status': 'settled'},
+            {'transaction_id': 'unknown', 'amount': '5', 'status': 'settled'},
+            {'amount': '5'},
+            {'transaction_id': 't0', 'amount': '10', 'status': 'settled'},
+            {'transaction_id': 't2', 'amount': '10', 'status': 'settled'},
+        ], extra='not json\n')
+        run = reconcile_file(path, chunk_size=2)
+        self.assertEqual(run.status, 'Finished')
+        self.assertEqual(
+            (run.lines, run.matched, run.mismatched, run.unknown, run.unsettled, run.invalid), (8, 2, 3, 1, 1, 2),
+        )
+        self.assertEqual(sorted(run.entries.values_list('kind', flat=True)), [
+            'amount_mismatch', 'duplicate', 'invalid_line', 'invalid_line',
+            'status_mismatch', 'unknown_transaction', 'unsettled_payment',
+        ])
+        self.assertIsNotNone(Payment.objects.get(transaction_id='t0').settled_at)
+
+    def test_fraction_of_a_cent_is_a_mismatch(self):
+        path = self.settlement_file('settlement.ndjson.gz', [
+            {'transaction_id': 't0', 'amount': '10.001'},
+            {'transaction_id': 't1', 'amount': '9.9999'},
+            {'transaction_id': 't2', 'amount': '10'},
+            {'transaction_id': 't4', 'amount': 'NaN'},
+        ])
+        run = reconcile_file(path)
+        self.assertEqual((run.matched, run.mismatched, run.invalid), (1, 2, 1))
+        self.assertEqual(
+            sorted(run.entries.filter(kind='amount_mismatch').values_list('transaction_id', 'detail')),
+            [('t0', 'Expected 10.00, settled 10.001.'), ('t1', 'Expected 10.00, settled 9.9999.')],
+        )
+
+    def test_unsettled_payment_is_flagged_once(self):
+        path = self.settlement_file('settlement.ndjson.gz', [])
+        self.assertEqual(reconcile_file(path).unsettled, 1)
+        self.assertEqual(reconcile_file(path).unsettled, 0)
+        self.assertEqual(ReconciliationEntry.objects.filter(kind='unsettled_payment').count(), 1)
+
+    def test_csv_file(self):
+        path = os.path.join(self.directory, 'settlement.csv')
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write('transaction_id,amount,status\nt4,10.00,settled\n')
+        run = reconcile_file(path)
+        self.assertEqual((run.lines, run.matched, run.mismatched), (1, 1, 0))
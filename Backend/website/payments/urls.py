@@ -4,5 +4,6 @@ from . import views
 urlpatterns = [
     path('initiate/', views.InitiatePaymentView.as_view(), name='initiate-payment'),
     path('verify/', views.VerifyPaymentView.as_view(), name='verify-payment'),
+    path('webhook/', views.GatewayWebhookView.as_view(), name='payment-webhook'),
     path('history/', views.PaymentHistoryView.as_view(), name='payment-history'),
 ]
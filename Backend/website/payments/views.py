@@ -1,57 +1,99 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework import status
-from .models import Payment
+from django.db import transaction
+import json
+from .models import Payment, GatewayEvent
+from .gateway import verify_signature, webhook_secrets, SIGNATURE_HEADER
 from orders.models import Order
 from .serializers import PaymentSerializer
+from .idempotency import idempotent
 
 
+# accepts an Idempotency-Key header, retries then get the first response back
 class InitiatePaymentView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent('initiate-payment')
     def post(self, request):
         data = request.data
         order_id = data.get('order_id')
         payment_method = data.get('method')
 
-        try:
-            order = Order.objects.get(id=order_id, user=request.user)
-        except Order.DoesNotExist:
-            return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
-
-        if order.status != 'Pending':
-            return Response({"error": "Payment already completed for this order."},
-                            status=status.HTTP_400_BAD_REQUEST)
-
-        payment = Payment.objects.create(
-            order=order,
-            user=request.user,
-            method=payment_method,
-            amount=order.total_amount
-        )
+        if payment_method not in dict(Payment.PAYMENT_METHODS):
+            return Response({"error": "Invalid payment method."}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            try:
+                order = Order.objects.select_for_update().get(id=order_id, customer=request.user)
+            except (Order.DoesNotExist, ValueError, TypeError):
+                return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
+
+            if order.status != 'Pending':
+                return Response({"error": "Payment already completed for this order."},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            # an order has a single payment: hand back the open one, restart a failed one
+            payment = Payment.objects.filter(order=order).first()
+            if payment is not None:
+                if payment.status == 'Failed':
+                    payment.status, payment.method, payment.transaction_id = 'Pending', payment_method, None
+                    payment.save(update_fields=['status', 'method', 'transaction_id', 'updated_at'])
+                return Response(PaymentSerializer(payment).data, status=status.HTTP_200_OK)
+
+            payment = Payment.objects.create(
+                order=order,
+                user=request.user,
+                method=payment_method,
+                amount=order.total_price
+            )
         return Response(PaymentSerializer(payment).data, status=status.HTTP_201_CREATED)
 
 
+# payments are confirmed by the gateway webhook only, the client just asks for the outcome;
+# with an Idempotency-Key header a retry gets the first answer back, like InitiatePaymentView
 class VerifyPaymentView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent('verify-payment')
     def post(self, request):
-        data = request.data
-        transaction_id = data.get('transaction_id')
-        payment_id = data.get('payment_id')
-
         try:
-            payment = Payment.objects.get(id=payment_id, user=request.user)
-        except Payment.DoesNotExist:
+            payment = Payment.objects.get(id=request.data.get('payment_id'), user=request.user)
+        except (Payment.DoesNotExist, ValueError, TypeError):
             return Response({"error": "Payment not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        if transaction_id:
-            payment.mark_as_completed(transaction_id=transaction_id)
-            return Response({"message": "Payment verified successfully."}, status=status.HTTP_200_OK)
+        if payment.status == 'Completed':
+            return Response({"message": "Payment verified successfully.", "status": payment.status}, status=status.HTTP_200_OK)
+        if payment.status == 'Failed':
+            return Response({"error": "Payment verification failed.", "status": payment.status}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"message": "Waiting for the payment gateway confirmation.", "status": payment.status},
+                        status=status.HTTP_202_ACCEPTED)
+
 
-        payment.mark_as_failed()
-        return Response({"error": "Payment verification failed."}, status=status.HTTP_400_BAD_REQUEST)
+# gateway callbacks: check the signature, queue the event and acknowledge right away,
+# process_gateway_events applies the queue in order
+class GatewayWebhookView(APIView):
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    throttle_classes = []
+
+    def post(self, request):
+        body = request.body
+        signature = request.headers.get(SIGNATURE_HEADER)
+        if not any(verify_signature(body, signature, secret) for secret in webhook_secrets()):
+            return Response({"error": "Invalid signature."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            event = json.loads(body)
+            event_id, event_type = str(event['id']), str(event['type'])
+        except (ValueError, KeyError, TypeError):
+            return Response({"error": "Malformed event."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # redeliveries of an event are acknowledged without queueing it twice
+        GatewayEvent.objects.bulk_create(
+            [GatewayEvent(event_id=event_id, type=event_type, payload=event)], ignore_conflicts=True
+        )
+        return Response({"received": True}, status=status.HTTP_202_ACCEPTED)
 
 
 class PaymentHistoryView(APIView):
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from mptt.templatetags.mptt_tags import cache_tree_children
+from rest_framework.renderers import JSONRenderer
+
+from .models import Category
+from .serializers import CategorySerializer
+
+
+CATEGORY_TREE_KEY = 'products:category_tree'
+CATEGORY_TREE_VERSION_KEY = 'products:category_tree_version'
+CATALOG_VERSION_KEY = 'products:catalog_version'
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_category_tree(request):
+    """The serialized category tree and its ETag, built from a single query and cached
+    until a Category changes. The image URLs are absolute, so there is one cached tree
+    per site origin."""
+    origin = hashlib.md5(request.build_absolute_uri('/').encode()).hexdigest()
+    key = f'{CATEGORY_TREE_KEY}:{_version(CATEGORY_TREE_VERSION_KEY)}:{origin}'
+    tree = cache.get(key)
+    if tree is None:
+        roots = cache_tree_children(Category.objects.order_by('tree_id', 'lft'))
+        content = JSONRenderer().render(CategorySerializer(roots, many=True, context={'request': request}).data)
+        tree = {
+            'data': json.loads(content),
+            'etag': '"%s"' % hashlib.md5(content).hexdigest(),
+        }
+        cache.set(key, tree, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    return tree
+
+
+def invalidate_category_tree():
+    # every origin's tree at once
+    cache.set(CATEGORY_TREE_VERSION_KEY, time.time(), timeout=None)
+
+
+#---------------------------------------------------------------------------
+# versioned response cache of the public catalog endpoints. Every key embeds the
+# catalog version, so bumping the version invalidates all cached pages at once.
+
+def catalog_version():
+    return _version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    cache.set(CATALOG_VERSION_KEY, time.time(), timeout=None)
+
+
+class CatalogCacheMixin:
+    """Serve GET responses from the cache, keyed by the catalog version and full URL,
+    with ETag / Last-Modified conditional GET support. Only JSON responses are cached:
+    they do not vary per user and are shared by all visitors, while the browsable API
+    HTML carries the requester's login state and CSRF token."""
+
+    catalog_cache_timeout = settings.CATALOG_CACHE_TIMEOUT
+
+    def catalog_etag(self):
+        # derived from the versioned key, so it is known before the response is built
+        return '"%s"' % hashlib.md5(self.catalog_cache_key.encode()).hexdigest()
+
+    def get(self, request, *args, **kwargs):
+        self.catalog_cache_key = None
+        if request.accepted_renderer.format != 'json':
+            return super().get(request, *args, **kwargs)
+
+        version = catalog_version()
+        digest = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        self.catalog_cache_key = f'products:catalog:{version}:{digest}'
+        self.catalog_last_modified = int(version)
+        etag = self.catalog_etag()
+
+        not_modified = get_conditional_response(request, etag=etag, last_modified=self.catalog_last_modified)
+        if not_modified is not None:
+            self.set_validators(not_modified, etag)
+            return not_modified
+
+        cached = cache.get(self.catalog_cache_key)
+        if cached is None:
+            return super().get(request, *args, **kwargs)
+        content, content_type = cached
+        response = HttpResponse(content, content_type=content_type)
+        self.set_validators(response, etag)
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, 'catalog_cache_key', None)
+        if key and response.status_code == 200 and hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+            cache.set(key, (response.content, response['Content-Type']), self.catalog_cache_timeout)
+            self.set_validators(response, self.catalog_etag())
+        return response
+
+    def set_validators(self, response, etag):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(self.catalog_last_modified)
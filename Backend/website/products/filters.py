@@ -0,0 +1,130 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Case, When, Value, Count, IntegerField
+from django.shortcuts import get_object_or_404
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+from .models import Category, effective_price
+
+
+# Query string filters of the product list, plus the facet counts of the filtered set:
+#   ?category=<id>  the category and all its descendants (one lft/rght range on the MPTT tree)
+#   ?brand=<id>[,<id>...]  ?min_price=  ?max_price=  (effective price)
+#   ?in_sale=true  ?min_rating=  ?in_stock=true
+class ProductFilterSet:
+
+    # lower bounds of the price facet buckets
+    price_buckets = (0, 100000, 500000, 1000000, 5000000, 10000000)
+
+    true_values = ('1', 'true', 'yes')
+
+    # numbers are validated like serializer input, which refuses NaN and Infinity
+    price_field = serializers.DecimalField(max_digits=None, decimal_places=None, min_value=Decimal('0'))
+    rating_field = serializers.DecimalField(max_digits=None, decimal_places=None, min_value=Decimal('0'), max_value=Decimal('5'))
+
+    def __init__(self, params):
+        self.params = params
+        self.category = None
+        if params.get('category'):
+            self.category = get_object_or_404(Category, pk=self.parse(int, 'category'))
+
+    def parse(self, cast, name):
+        try:
+            return cast(self.params[name])
+        except (ValueError, TypeError, InvalidOperation):
+            raise ValidationError({name: 'Invalid value.'})
+
+    def number(self, field, name):
+        try:
+            return field.run_validation(self.params[name])
+        except ValidationError as error:
+            raise ValidationError({name: error.detail})
+
+    def flag(self, name):
+        return self.params.get(name, '').lower() in self.true_values
+
+    def filter(self, queryset):
+        params = self.params
+        if self.category is not None:
+            queryset = queryset.filter(
+                category__tree_id=self.category.tree_id,
+                category__lft__gte=self.category.lft,
+                category__rght__lte=self.category.rght,
+            )
+        if params.get('brand'):
+            brands = self.parse(lambda value: [int(pk) for pk in value.split(',')], 'brand')
+            queryset = queryset.filter(brand_id__in=brands)
+        if params.get('min_price') or params.get('max_price'):
+            queryset = queryset.annotate(effective_price=effective_price())
+            if params.get('min_price'):
+                queryset = queryset.filter(effective_price__gte=self.number(self.price_field, 'min_price'))
+            if params.get('max_price'):
+                queryset = queryset.filter(effective_price__lte=self.number(self.price_field, 'max_price'))
+        if self.flag('in_sale'):
+            queryset = queryset.filter(in_sale=True)
+        if params.get('min_rating'):
+            queryset = queryset.filter(average_rating__gte=self.number(self.rating_field, 'min_rating'))
+        if self.flag('in_stock'):
+            queryset = queryset.filter(stock__gt=0)
+        return queryset
+
+    def price_bucket(self):
+        bounds = self.price_buckets
+        whens = [
+            When(effective_price__lt=upper, then=Value(index))
+            for index, upper in enumerate(bounds[1:])
+        ]
+        return Case(*whens, default=Value(len(bounds) - 1), output_field=IntegerField())
+
+    def price_label(self, index):
+        bounds = self.price_buckets
+        if index == len(bounds) - 1:
+            return f'{bounds[index]}+'
+        return f'{bounds[index]}-{bounds[index + 1]}'
+
+    def facets(self, queryset):
+        """Counts per brand, per child category and per price bucket, from one grouped query."""
+        if self.category is not None:
+            children = list(self.category.get_children())
+            child_whens = [
+                When(category__tree_id=child.tree_id, category__lft__gte=child.lft,
+                     category__rght__lte=child.rght, then=Value(child.id))
+                for child in children
+            ]
+        else:
+            children = list(Category.objects.root_nodes())
+            child_whens = [When(category__tree_id=root.tree_id, then=Value(root.id)) for root in children]
+
+        if 'effective_price' not in queryset.query.annotations:
+            queryset = queryset.annotate(effective_price=effective_price())
+        rows = (
+            queryset.order_by()
+            .annotate(
+                facet_child=Case(*child_whens, default=Value(None), output_field=IntegerField()),
+                facet_price=self.price_bucket(),
+            )
+            .values('brand_id', 'brand__name', 'facet_child', 'facet_price')
+            .annotate(count=Count('id'))
+        )
+
+        brands, categories, prices = {}, {}, {}
+        for row in rows:
+            if row['brand_id'] is not None:
+                brand = brands.setdefault(row['brand_id'], {'id': row['brand_id'], 'name': row['brand__name'], 'count': 0})
+                brand['count'] += row['count']
+            if row['facet_child'] is not None:
+                categories[row['facet_child']] = categories.get(row['facet_child'], 0) + row['count']
+            prices[row['facet_price']] = prices.get(row['facet_price'], 0) + row['count']
+
+        return {
+            'brands': sorted(brands.values(), key=lambda brand: -brand['count']),
+            'categories': [
+                {'id': child.id, 'name': child.name, 'count': categories[child.id]}
+                for child in children if child.id in categories
+            ],
+            'price': [
+                {'range': self.price_label(index), 'count': prices[index]}
+                for index in sorted(prices)
+            ],
+        }
@@ -0,0 +1,114 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .models import IMAGE_MODELS
+
+logger = logging.getLogger(__name__)
+
+
+# Resized derivatives of the uploaded images: every width in WebP plus a JPEG fallback,
+# stored next to each other under variants/ and generated off the request thread.
+VARIANT_WIDTHS = (200, 400, 800)
+VARIANT_FORMATS = (('webp', 'WEBP'), ('jpg', 'JPEG'))
+
+_executor = ThreadPoolExecutor(max_workers=settings.IMAGE_VARIANT_WORKERS, thread_name_prefix='image-variants')
+
+
+def variant_name(name, width, extension):
+    root, _ = os.path.splitext(name)
+    return f'variants/{root}_{width}w.{extension}'
+
+
+def generate_variants(name, force=False, storage=default_storage):
+    """Write the missing variants of the stored image ``name``, returns how many were written."""
+    targets = [
+        (width, extension, image_format, variant_name(name, width, extension))
+        for width in VARIANT_WIDTHS
+        for extension, image_format in VARIANT_FORMATS
+    ]
+    if not force:
+        targets = [target for target in targets if not storage.exists(target[3])]
+    if not targets:
+        return 0
+
+    with storage.open(name, 'rb') as original:
+        image = ImageOps.exif_transpose(Image.open(original))
+        image.load()
+
+    written, resized_by_width = 0, {}
+    # the largest JPEG is written last, its presence marks the set as complete
+    for width, extension, image_format, target in targets:
+        if width not in resized_by_width:
+            resized_by_width[width] = image.copy()
+            resized_by_width[width].thumbnail((width, width * 4), Image.LANCZOS)
+        resized = resized_by_width[width]
+        if image_format == 'JPEG' and resized.mode != 'RGB':
+            background = Image.new('RGB', resized.size, 'white')
+            background.paste(resized.convert('RGBA'), mask=resized.convert('RGBA').split()[-1])
+            resized = background
+        buffer = BytesIO()
+        resized.save(buffer, image_format, quality=80, optimize=True)
+        if storage.exists(target):
+            storage.delete(target)
+        storage.save(target, ContentFile(buffer.getvalue()))
+        written += 1
+    return written
+
+
+def mark_variants_ready(name):
+    """Record on every row showing the image ``name`` that its variants are stored,
+    returns how many rows changed."""
+    marked = 0
+    for model in IMAGE_MODELS:
+        for field in model.image_fields:
+            marked += model.objects.filter(**{field: name}).exclude(**{f'{field}_variants': name}).update(
+                **{f'{field}_variants': name}
+            )
+    return marked
+
+
+def _generate_in_background(name):
+    try:
+        generate_variants(name)
+        if mark_variants_ready(name):
+            # cached catalog responses were rendered without these variants
+            from .cache import bump_catalog_version, invalidate_category_tree
+            bump_catalog_version()
+            invalidate_category_tree()
+    except Exception:
+        logger.exception("Could not generate image variants for %s", name)
+
+
+def schedule_variants(file):
+    """Generate the variants of an image field value in the worker pool once the transaction commits."""
+    if file:
+        name = file.name
+        transaction.on_commit(lambda: _executor.submit(_generate_in_background, name))
+
+
+def srcset(file, request=None):
+    """Original URL plus srcset strings per format, e.g.
+    {"original": url, "webp": "url_200 200w, url_400 400w, ...", "jpeg": "..."}"""
+    if not file:
+        return None
+
+    def url(name):
+        path = default_storage.url(name)
+        return request.build_absolute_uri(path) if request else path
+
+    urls = {'original': url(file.name)}
+    # recorded on the row by the variant job, so no storage lookup per serialized image
+    if file.instance.variants_ready(file.field.name):
+        for extension, image_format in VARIANT_FORMATS:
+            urls[image_format.lower()] = ', '.join(
+                f'{url(variant_name(file.name, width, extension))} {width}w' for width in VARIANT_WIDTHS
+            )
+    return urls
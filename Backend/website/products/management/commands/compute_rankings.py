@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from dashboard.sales import product_sales
+from products.rankings import compute
+
+
+class Command(BaseCommand):
+    help = "Recompute the best seller and trending rails, globally and per category (run it periodically)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, help="products per rail, defaults to settings.RANKING_SIZE")
+
+    def handle(self, *args, **options):
+        written = compute(product_sales, options['size'])
+        summary = ', '.join(f"{rows} {kind} rows" for kind, rows in written.items())
+        self.stdout.write(self.style.SUCCESS(f"Wrote {summary}."))
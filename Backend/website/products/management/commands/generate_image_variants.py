@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from products.cache import bump_catalog_version, invalidate_category_tree
+from products.images import generate_variants, mark_variants_ready
+from products.signals import IMAGE_FIELDS
+
+
+class Command(BaseCommand):
+    help = "Generate the resized WebP/JPEG variants of every stored product, brand and category image"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--force', action='store_true', help="Regenerate variants that already exist")
+
+    def handle(self, *args, **options):
+        names = set()
+        for model, fields in IMAGE_FIELDS.items():
+            for field in fields:
+                names.update(
+                    model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+                    .values_list(field, flat=True).iterator()
+                )
+
+        written = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {executor.submit(generate_variants, name, options['force']): name for name in names}
+            for future in as_completed(futures):
+                try:
+                    written += future.result()
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f"{futures[future]}: {error}")
+                else:
+                    mark_variants_ready(futures[future])
+
+        bump_catalog_version()
+        invalidate_category_tree()
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {len(names)} images, wrote {written} variants, {failed} failed."
+        ))
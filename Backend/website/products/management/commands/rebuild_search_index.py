@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from products import search
+from products.models import Product, Category
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(self.style.WARNING("Full-text index is only used on SQLite, nothing to do."))
+            return
+        search.rebuild(Product, Category, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {Product.objects.count()} products."))
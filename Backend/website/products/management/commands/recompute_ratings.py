@@ -0,0 +1,41 @@
+from django.db.models import Count, Sum
+from django.core.management.base import BaseCommand
+
+from products.models import Product, Review
+
+
+class Command(BaseCommand):
+    help = "Recompute the rating aggregates of every product from its reviews, in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id, repaired = 0, 0
+        while True:
+            products = list(
+                Product.objects.filter(id__gt=last_id).order_by('id')
+                .only('id', 'total_ratings', 'rating_sum', 'average_rating')[:chunk_size]
+            )
+            if not products:
+                break
+            last_id = products[-1].id
+
+            aggregates = {
+                row['product_id']: row
+                for row in Review.objects.filter(product__in=products, rating__isnull=False)
+                .values('product_id').annotate(total=Count('id'), rating_sum=Sum('rating')).order_by()
+            }
+            drifted = []
+            for product in products:
+                row = aggregates.get(product.id, {'total': 0, 'rating_sum': 0})
+                average = row['rating_sum'] / row['total'] if row['total'] else 0.0
+                if (product.total_ratings, product.rating_sum) != (row['total'], row['rating_sum']) \
+                        or abs(product.average_rating - average) > 1e-9:
+                    product.total_ratings, product.rating_sum, product.average_rating = row['total'], row['rating_sum'], average
+                    drifted.append(product)
+            Product.objects.bulk_update(drifted, ['total_ratings', 'rating_sum', 'average_rating'])
+            repaired += len(drifted)
+
+        self.stdout.write(self.style.SUCCESS(f"Repaired the rating aggregates of {repaired} products."))
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0005_product_sold_quantity"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["-date_added", "-id"], name="product_date_added_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["in_sale", "-date_added", "-id"],
+                name="product_sale_date_added_idx",
+            ),
+        ),
+    ]
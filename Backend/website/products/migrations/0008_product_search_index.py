@@ -0,0 +1,60 @@
+from django.db import migrations
+
+# The DDL and the initial fill are spelled out here instead of calling products.search,
+# so later changes to that module cannot rewrite what this migration did.
+SEARCH_TABLE = 'products_product_search'
+VOCAB_TABLE = 'products_product_search_vocab'
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+        "name, description, brand, category, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {VOCAB_TABLE} USING fts5vocab({SEARCH_TABLE}, 'row')"
+    )
+
+    Product = apps.get_model("products", "Product")
+    Category = apps.get_model("products", "Category")
+    nodes = {c['id']: c for c in Category.objects.values('id', 'name', 'parent_id')}
+    paths = {}
+
+    def path(category_id):
+        if category_id not in paths:
+            node = nodes[category_id]
+            parent = node['parent_id']
+            paths[category_id] = (path(parent) + ' > ' if parent in nodes else '') + node['name']
+        return paths[category_id]
+
+    rows = [
+        (p['id'], p['name'], p['description'], p['brand__name'] or '',
+         path(p['category_id']) if p['category_id'] in nodes else '')
+        for p in Product.objects.values('id', 'name', 'description', 'brand__name', 'category_id').iterator()
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, name, description, brand, category) VALUES (%s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {VOCAB_TABLE}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0007_review_product_created_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
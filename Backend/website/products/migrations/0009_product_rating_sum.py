@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:12
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_sum(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    Review = apps.get_model("products", "Review")
+    sums = (
+        Review.objects.filter(product=OuterRef("pk"), rating__isnull=False)
+        .values("product")
+        .annotate(total=Sum("rating"))
+        .values("total")
+    )
+    Product.objects.update(rating_sum=Coalesce(Subquery(sums), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0008_product_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="rating_sum",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_sum, migrations.RunPython.noop),
+    ]
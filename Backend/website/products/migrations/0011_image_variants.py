@@ -0,0 +1,68 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:41
+
+import os
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+IMAGE_FIELDS = {
+    "Category": ("icon", "image"),
+    "Brand": ("image",),
+    "Product": ("image", "icon"),
+    "ProductImage": ("image",),
+}
+
+
+def mark_existing_variants(apps, schema_editor):
+    # the variant job writes the largest JPEG last, its presence means the set is complete
+    ready = {}
+    for model_name, fields in IMAGE_FIELDS.items():
+        model = apps.get_model("products", model_name)
+        for field in fields:
+            names = set(model.objects.exclude(**{field: ""}).exclude(**{f"{field}__isnull": True}).values_list(field, flat=True))
+            for name in names:
+                if name not in ready:
+                    ready[name] = default_storage.exists(f"variants/{os.path.splitext(name)[0]}_800w.jpg")
+                if ready[name]:
+                    model.objects.filter(**{field: name}).update(**{f"{field}_variants": name})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0010_product_ranking"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="brand",
+            name="image_variants",
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="icon_variants",
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="image_variants",
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="icon_variants",
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="image_variants",
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="productimage",
+            name="image_variants",
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.RunPython(mark_existing_variants, migrations.RunPython.noop),
+    ]
@@ -3,16 +3,40 @@ from users.models import MyUser
 from website import settings
 import datetime
 from mptt.models import MPTTModel, TreeForeignKey
-from django.db.models import Avg
+from django.db.models import Avg, Case, When, F, Value, DecimalField, FloatField, Count, Sum
+from django.db.models.functions import Cast, Round
 
 
 #--------------------------------------------------------------------------------------------------------
 
-class Category(MPTTModel):
+class ImageVariantsMixin:
+    # image fields with resized variants (products.images). Each one has a "<field>_variants"
+    # column holding the file name its variants were generated for, and the names loaded
+    # from the database are kept so a save only schedules a job for a newly stored file
+    image_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stored_images = {
+            name: value or '' for name, value in zip(field_names, values) if name in cls.image_fields
+        }
+        return instance
+
+    def variants_ready(self, field):
+        return bool(getattr(self, field).name) and getattr(self, f'{field}_variants') == getattr(self, field).name
+
+#--------------------------------------------------------------------------------------------------------
+
+class Category(ImageVariantsMixin, MPTTModel):
     name = models.CharField(max_length=100)
     parent = TreeForeignKey('self', on_delete=models.PROTECT, null=True, blank=True, related_name='children')
     icon = models.ImageField(upload_to='category_icons/', null=True, blank=True)
     image = models.ImageField(upload_to='category_images/', null=True, blank=True)
+    icon_variants = models.CharField(max_length=100, blank=True, editable=False)
+    image_variants = models.CharField(max_length=100, blank=True, editable=False)
+
+    image_fields = ('icon', 'image')
     
     class MPTTMeta:
         verbose_name_plural = "Categories"
@@ -23,16 +47,38 @@ class Category(MPTTModel):
 
 #--------------------------------------------------------------------------------------------------------
 
-class Brand(models.Model):
+class Brand(ImageVariantsMixin, models.Model):
     name = models.CharField(max_length=50)
     image = models.ImageField(upload_to='brand_images/', blank=True, null=True)
+    image_variants = models.CharField(max_length=100, blank=True, editable=False)
+
+    image_fields = ('image',)
 
     def __str__(self):
         return self.name
 
 #--------------------------------------------------------------------------------------------------------
 
-class Product(models.Model):
+def effective_price(prefix=''):
+    # sale price while the product is on sale, regular price otherwise.
+    # prefix lets related querysets use it, e.g. effective_price('product__')
+    # Sale prices have a third decimal: the unit price is rounded half up to the cents of
+    # price here, once, and cart lines, order lines and all totals are computed from it.
+    price = Product._meta.get_field('price')
+    output_field = DecimalField(max_digits=price.max_digits, decimal_places=price.decimal_places)
+    return Round(
+        Case(
+            When(**{f'{prefix}in_sale': True}, then=F(f'{prefix}sale_price')),
+            default=F(f'{prefix}price'),
+            output_field=output_field,
+        ),
+        price.decimal_places,
+        output_field=output_field,
+    )
+
+#--------------------------------------------------------------------------------------------------------
+
+class Product(ImageVariantsMixin, models.Model):
 
     seller = models.ForeignKey('users.MyUser', on_delete=models.CASCADE, related_name='products')
     category = TreeForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='products')
@@ -46,16 +92,49 @@ class Product(models.Model):
     date_added = models.DateTimeField(auto_now_add=True)  # Only auto_now_add=True
     average_rating = models.FloatField(default=0.0)
     total_ratings = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)  # running sum of ratings, average = rating_sum / total_ratings
     # adding sale 
     in_sale = models.BooleanField(default=False)
     sale_price = models.DecimalField(default=0, max_digits=9, decimal_places=3)    
     icon = models.ImageField(upload_to='product_icons/', blank=True, null=True)  # Optional icon field
+    image_variants = models.CharField(max_length=100, blank=True, editable=False)
+    icon_variants = models.CharField(max_length=100, blank=True, editable=False)
+
+    image_fields = ('image', 'icon')
+
+    class Meta:
+        indexes = [
+            # keyset pagination of the catalog: ORDER BY date_added DESC, id DESC
+            models.Index(fields=['-date_added', '-id'], name='product_date_added_id_idx'),
+            models.Index(fields=['in_sale', '-date_added', '-id'], name='product_sale_date_added_idx'),
+        ]
+
+    @classmethod
+    def apply_rating_change(cls, product_id, count_delta, sum_delta):
+        # adjust the aggregates in one UPDATE, the right-hand side sees the old column values
+        total = F('total_ratings') + count_delta
+        rating_sum = F('rating_sum') + sum_delta
+        cls.objects.filter(pk=product_id).update(
+            total_ratings=total,
+            rating_sum=rating_sum,
+            average_rating=Case(
+                When(total_ratings__gt=-count_delta, then=Cast(rating_sum, FloatField()) / Cast(total, FloatField())),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+        )
 
     def update_ratings(self):
-        reviews = self.reviews.exclude(rating__isnull=True)
-        self.total_ratings = reviews.count()
-        self.average_rating = reviews.aggregate(Avg('rating'))['rating__avg'] or 0
-        self.save()
+        # full recompute for this product, only needed to repair drift
+        aggregates = self.reviews.exclude(rating__isnull=True).aggregate(
+            total=Count('id'), rating_sum=Sum('rating'), average=Avg('rating'),
+        )
+        self.total_ratings = aggregates['total']
+        self.rating_sum = aggregates['rating_sum'] or 0
+        self.average_rating = aggregates['average'] or 0
+        Product.objects.filter(pk=self.pk).update(
+            total_ratings=self.total_ratings, rating_sum=self.rating_sum, average_rating=self.average_rating,
+        )
     
     def total_orders(self):
         return self.order_set.filter(status=True).count()
@@ -65,9 +144,12 @@ class Product(models.Model):
 
 #--------------------------------------------------------------------------------------------------------
 
-class ProductImage(models.Model):
+class ProductImage(ImageVariantsMixin, models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='product_images/')
+    image_variants = models.CharField(max_length=100, blank=True, editable=False)
+
+    image_fields = ('image',)
 
     def __str__(self):
         return f"Image of {self.product.name}"
@@ -82,9 +164,50 @@ class Review(models.Model):
     comment = models.TextField(null=True, blank=True)  # Comment text
     created_at = models.DateTimeField(auto_now_add=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the stored rating so signals can apply the difference on update/delete
+        if 'rating' in field_names:
+            instance._stored_rating = instance.rating
+        return instance
+
     class Meta:
         unique_together = ('product', 'user')
+        indexes = [
+            models.Index(fields=['product', '-created_at', '-id'], name='review_product_created_idx'),
+        ]
 
 
     def __str__(self):
-        return f"Review for {self.product.name} by {self.user.username}"
\ No newline at end of file
+        return f"Review for {self.product.name} by {self.user.username}"
+#--------------------------------------------------------------------------------------------------------
+
+# precomputed storefront rails (see products.rankings), one row per position; a null
+# category is the global rail
+class ProductRanking(models.Model):
+
+    KIND_CHOICES = [
+        ('bestsellers', 'Best sellers'),
+        ('trending', 'Trending'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='rankings')
+    position = models.PositiveSmallIntegerField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='rankings')
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'category', 'position'], name='ranking_rail_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.position}: {self.product_id}"
+
+#--------------------------------------------------------------------------------------------------------
+
+# models whose images get resized variants (see ImageVariantsMixin)
+IMAGE_MODELS = (Category, Brand, Product, ProductImage)
@@ -0,0 +1,11 @@
+from website.pagination import KeysetPagination
+
+
+# newest first, backed by the (date_added, id) index on Product
+class ProductCursorPagination(KeysetPagination):
+    ordering = ('-date_added', '-id')
+
+
+# newest first, backed by the (product, created_at, id) index on Review
+class ReviewCursorPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
@@ -0,0 +1,100 @@
+import heapq
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Product, Category, ProductRanking
+from .cache import bump_catalog_version
+
+
+# Rails are ranked by recency-decayed sales: every unit sold d days ago weighs
+# 0.5 ** (d / half_life). Best sellers use a long half-life, trending a short one. The
+# sales come from the caller as (product id, day, units sold) rows, one per product and
+# day (the compute_rankings command passes dashboard.sales.product_sales, the catalog
+# does not read the dashboard's tables itself), and both scores are accumulated in the
+# same pass; each product then counts for its category and every ancestor, plus the
+# global rail.
+WINDOW_HALF_LIVES = 8  # sales older than 8 half-lives weigh < 0.4% and are skipped
+
+
+def category_ancestors():
+    """{category id: [category id, parent id, ..., root id]}"""
+    parents = dict(Category.objects.values_list('id', 'parent_id'))
+    chains = {}
+
+    def chain(category_id):
+        if category_id not in chains:
+            parent = parents.get(category_id)
+            chains[category_id] = [category_id] + (chain(parent) if parent in parents else [])
+        return chains[category_id]
+
+    for category_id in parents:
+        chain(category_id)
+    return chains
+
+
+def decayed_scores(sales, half_lives, today=None):
+    """{kind: {product id: score}} from ``sales(since)``, one read of the daily sales."""
+    today = today or timezone.localdate()
+    since = today - timedelta(days=int(max(half_lives.values()) * WINDOW_HALF_LIVES))
+    scores = {kind: defaultdict(float) for kind in half_lives}
+    decay = {kind: 0.5 ** (1 / half_life) for kind, half_life in half_lives.items()}
+    for product_id, day, sold in sales(since):
+        age = max((today - day).days, 0)
+        for kind, factor in decay.items():
+            if age <= half_lives[kind] * WINDOW_HALF_LIVES:
+                scores[kind][product_id] += sold * factor ** age
+    return scores
+
+
+def top_per_category(scores, product_categories, ancestors, size):
+    """{category id or None: [(score, product id), ...] best first}"""
+    candidates = defaultdict(list)
+    for product_id, score in scores.items():
+        if score <= 0:
+            continue
+        candidates[None].append((score, product_id))
+        for category_id in ancestors.get(product_categories.get(product_id), ()):
+            candidates[category_id].append((score, product_id))
+    return {
+        category_id: heapq.nlargest(size, entries, key=lambda entry: (entry[0], -entry[1]))
+        for category_id, entries in candidates.items()
+    }
+
+
+def compute(sales, size=None, half_lives=None):
+    """Replace every rail from ``sales(since)`` -> (product id, day, units sold) rows,
+    returns {kind: rows written}."""
+    size = size or settings.RANKING_SIZE
+    half_lives = half_lives or settings.RANKING_HALF_LIFE_DAYS
+    scores = decayed_scores(sales, half_lives)
+    ranked_ids = set().union(*(kind_scores.keys() for kind_scores in scores.values()))
+
+    product_categories = dict(Product.objects.filter(id__in=ranked_ids).values_list('id', 'category_id'))
+    ancestors = category_ancestors()
+    computed_at = timezone.now()
+
+    rows, written = [], {}
+    for kind, kind_scores in scores.items():
+        # products deleted since the sale have no category entry and are left out
+        kind_scores = {pid: score for pid, score in kind_scores.items() if pid in product_categories}
+        rails = top_per_category(kind_scores, product_categories, ancestors, size)
+        before = len(rows)
+        for category_id, entries in rails.items():
+            rows.extend(
+                ProductRanking(
+                    kind=kind, category_id=category_id, position=position, product_id=product_id,
+                    score=score, computed_at=computed_at,
+                )
+                for position, (score, product_id) in enumerate(entries, 1)
+            )
+        written[kind] = len(rows) - before
+
+    with transaction.atomic():
+        ProductRanking.objects.filter(kind__in=list(scores)).delete()
+        ProductRanking.objects.bulk_create(rows, batch_size=1000)
+        transaction.on_commit(bump_catalog_version)
+    return written
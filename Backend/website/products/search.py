@@ -0,0 +1,143 @@
+import difflib
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+
+# SQLite FTS5 inverted index over the catalog, one row per product (rowid = product id),
+# created by migration 0008_product_search_index. Other database backends fall back to
+# plain icontains lookups.
+SEARCH_TABLE = 'products_product_search'
+VOCAB_TABLE = 'products_product_search_vocab'
+
+# bm25 column weights: name, description, brand, category
+RANK_WEIGHTS = (10.0, 1.0, 5.0, 3.0)
+
+CATEGORY_SEPARATOR = ' > '
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_supported(db_connection=None):
+    return (db_connection or connection).vendor == 'sqlite'
+
+
+#---------------------------------------------------------------------------
+# indexing
+
+def category_paths(categories):
+    """Map category id -> "Root > Child > Leaf" for the given categories queryset."""
+    nodes = {c['id']: c for c in categories.values('id', 'name', 'parent_id')}
+    paths = {}
+
+    def path(category_id):
+        if category_id not in paths:
+            node = nodes[category_id]
+            parent = node['parent_id']
+            prefix = path(parent) + CATEGORY_SEPARATOR if parent in nodes else ''
+            paths[category_id] = prefix + node['name']
+        return paths[category_id]
+
+    for category_id in nodes:
+        path(category_id)
+    return paths
+
+
+def index_products(products, paths, db_connection=None):
+    """Upsert the search rows of the given products queryset."""
+    if not is_supported(db_connection):
+        return
+    rows = [
+        (p['id'], p['name'], p['description'], p['brand__name'] or '', paths.get(p['category_id'], ''))
+        for p in products.values('id', 'name', 'description', 'brand__name', 'category_id')
+    ]
+    if not rows:
+        return
+    with (db_connection or connection).cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, name, description, brand, category) VALUES (%s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def remove_products(product_ids, db_connection=None):
+    if not is_supported(db_connection) or not product_ids:
+        return
+    with (db_connection or connection).cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(pk,) for pk in product_ids])
+
+
+def rebuild(product_model, category_model, db_connection=None, chunk_size=1000):
+    """Drop every row and index the whole catalog again, chunk by chunk."""
+    if not is_supported(db_connection):
+        return
+    with (db_connection or connection).cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+    paths = category_paths(category_model.objects.all())
+    ids = list(product_model.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), chunk_size):
+        index_products(product_model.objects.filter(id__in=ids[start:start + chunk_size]), paths, db_connection)
+
+#---------------------------------------------------------------------------
+# querying
+
+def tokenize(query):
+    return [token.lower() for token in TOKEN_RE.findall(query)][:10]
+
+
+def similar_terms(token, limit=3):
+    """Indexed terms close to a (possibly misspelled) token, from the fts5vocab table."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT term FROM {VOCAB_TABLE} WHERE term >= %s AND term < %s",
+            [token[0], token[0] + '\U0010ffff'],
+        )
+        vocabulary = [row[0] for row in cursor.fetchall()]
+    return difflib.get_close_matches(token, vocabulary, n=limit, cutoff=0.75)
+
+
+def build_match(tokens, fuzzy=False):
+    groups = []
+    for token in tokens:
+        # every token is matched as a prefix, so "sams" finds "samsung"
+        options = [f'"{token}"*']
+        if fuzzy:
+            options += [f'"{term}"' for term in similar_terms(token) if term != token]
+        groups.append('(' + ' OR '.join(options) + ')')
+    return ' AND '.join(groups)
+
+
+def _ranked_ids(match, limit, offset):
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+            f"ORDER BY bm25({SEARCH_TABLE}, {weights}), rowid LIMIT %s OFFSET %s",
+            [match, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_ids(query, limit, offset=0):
+    """Product ids matching ``query``, best match first."""
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+
+    if not is_supported():
+        from .models import Product
+
+        condition = Q()
+        for token in tokens:
+            condition &= Q(name__icontains=token) | Q(description__icontains=token) | Q(brand__name__icontains=token)
+        queryset = Product.objects.filter(condition).order_by('-date_added', '-id').values_list('id', flat=True)
+        return list(queryset[offset:offset + limit])
+
+    match = build_match(tokens)
+    ids = _ranked_ids(match, limit, offset)
+    if not ids and (offset == 0 or not _ranked_ids(match, 1, 0)):
+        # nothing matched as typed: retry with close vocabulary terms for typo tolerance
+        ids = _ranked_ids(build_match(tokens, fuzzy=True), limit, offset)
+    return ids
@@ -1,33 +1,40 @@
 from rest_framework import serializers, generics, permissions
 from .models import Product, Category, ProductImage, Review, Brand
+from .images import srcset
 
 
 class CategorySerializer(serializers.ModelSerializer):
 
     children = serializers.SerializerMethodField()
+    icon_url = serializers.SerializerMethodField()
+    image_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Category
-        fields = ['id', 'name', 'parent', 'children', 'icon', 'image',]
+        fields = ['id', 'name', 'parent', 'children', 'icon', 'image', 'icon_url', 'image_url']
+
+    def get_icon_url(self, obj):
+        return srcset(obj.icon, self.context.get('request'))
+
+    def get_image_url(self, obj):
+        return srcset(obj.image, self.context.get('request'))
 
     def get_children(self, obj):
-        return CategorySerializer(obj.children, many=True).data
+        # get_children() reads the children cached by mptt's cache_tree_children
+        return CategorySerializer(obj.get_children(), many=True, context=self.context).data
 
 #---------------------------------------------------------------------------
 
 class ProductImageSerializer(serializers.ModelSerializer):
 
-    image_url = serializers.ImageField(source='image', read_only=True)
+    image_url = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductImage
         fields = ['id', 'image', 'image_url']
 
     def get_image_url(self, obj):
-        request = self.context.get('request')
-        if obj.image:
-            return request.build_absolute_uri(obj.image.url)
-        return None
+        return srcset(obj.image, self.context.get('request'))
 
 #---------------------------------------------------------------------------
 
@@ -36,6 +43,12 @@ class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = ['id', 'user', 'rating', 'comment', 'created_at']
+        read_only_fields = ['user']
+
+    def validate_rating(self, value):
+        if value is not None and not 1 <= value <= 5:
+            raise serializers.ValidationError("Rating must be between 1 and 5.")
+        return value
 
 
 #---------------------------------------------------------------------------
@@ -44,21 +57,17 @@ class ProductSerializer(serializers.ModelSerializer):
 
     images = ProductImageSerializer(many=True, read_only=True)
     image_url = serializers.SerializerMethodField()  
-    reviews = ReviewSerializer(many=True, read_only=True)
 
     class Meta:
         model = Product
         fields = [
             'id', 'seller', 'category', 'name', 'description', 'price', 'stock',
             'image', 'date_added', 'average_rating', 'total_ratings', 'in_sale', 
-            'sale_price', 'images', 'reviews', 'image_url'
+            'sale_price', 'images', 'image_url'
         ]
         
     def get_image_url(self, obj):
-        request = self.context.get('request')
-        if obj.image:
-            return request.build_absolute_uri(obj.image.url)
-        return None
+        return srcset(obj.image, self.context.get('request'))
 
     def validate(self, data):
         if data.get("in_sale") and data.get("sale_price") >= data.get("price"):
@@ -66,6 +75,27 @@ class ProductSerializer(serializers.ModelSerializer):
         return data
 #---------------------------------------------------------------------------
 
+# slim representation for list endpoints, reviews live in their own endpoint
+class ProductCardSerializer(serializers.ModelSerializer):
+
+    image_url = serializers.SerializerMethodField()
+    in_stock = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = [
+            'id', 'name', 'price', 'in_sale', 'sale_price', 'image_url',
+            'average_rating', 'total_ratings', 'in_stock'
+        ]
+
+    def get_image_url(self, obj):
+        return srcset(obj.image, self.context.get('request'))
+
+    def get_in_stock(self, obj):
+        return obj.stock > 0
+
+#---------------------------------------------------------------------------
+
 class BrandSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()  
 
@@ -74,7 +104,4 @@ class BrandSerializer(serializers.ModelSerializer):
         fields = ['image_url', 'name', 'image']
 
     def get_image_url(self, obj):
-        request = self.context.get('request')
-        if obj.image:
-            return request.build_absolute_uri(obj.image.url)
-        return None
\ No newline at end of file
+        return srcset(obj.image, self.context.get('request'))
\ No newline at end of file
@@ -1,11 +1,130 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from orders.models import Order
-
-@receiver(post_save, sender=Order)
-def update_sold_quantity(sender, instance, **kwargs):
-    if instance.status == "Completed":  # Check if the order is completed
-        for item in instance.items.all():
-            product = item.product
-            product.sold_quantity += item.quantity  # Increment sold quantity
-            product.save()
+from .models import Product, Brand, Category, Review, ProductImage, IMAGE_MODELS
+from . import search
+from .cache import invalidate_category_tree, bump_catalog_version
+from .images import schedule_variants
+
+#---------------------------------------------------------------------------
+# keep the full-text search index in sync, after the transaction commits
+
+def reindex_products(product_ids):
+    products = Product.objects.filter(id__in=product_ids)
+    search.index_products(products, search.category_paths(Category.objects.all()))
+
+SEARCHED_FIELDS = {'name', 'description', 'brand', 'category'}
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not SEARCHED_FIELDS.intersection(update_fields):
+        return
+
+    def index():
+        categories = Category.objects.none()
+        if instance.category_id:
+            categories = Category.objects.get(pk=instance.category_id).get_ancestors(include_self=True)
+        search.index_products(Product.objects.filter(pk=instance.pk), search.category_paths(categories))
+    transaction.on_commit(index)
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    transaction.on_commit(lambda: search.remove_products([instance.pk]))
+
+@receiver(post_save, sender=Brand)
+def reindex_brand_products(sender, instance, created, **kwargs):
+    if not created:
+        product_ids = list(instance.product_set.values_list('id', flat=True))
+        transaction.on_commit(lambda: reindex_products(product_ids))
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, **kwargs):
+    # a renamed or moved category changes the path of its whole subtree
+    if not created:
+        categories = instance.get_descendants(include_self=True)
+        product_ids = list(Product.objects.filter(category__in=categories).values_list('id', flat=True))
+        transaction.on_commit(lambda: reindex_products(product_ids))
+
+@receiver(pre_delete, sender=Brand)
+@receiver(pre_delete, sender=Category)
+def reindex_orphaned_products(sender, instance, **kwargs):
+    # the FK is SET_NULL by a bulk update that sends no Product signals
+    lookup = 'brand' if sender is Brand else 'category'
+    product_ids = list(Product.objects.filter(**{lookup: instance}).values_list('id', flat=True))
+    transaction.on_commit(lambda: reindex_products(product_ids))
+
+
+#---------------------------------------------------------------------------
+# cached category tree
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_tree_changed(sender, **kwargs):
+    transaction.on_commit(invalidate_category_tree)
+
+
+#---------------------------------------------------------------------------
+# incremental rating aggregates on Product
+
+UNKNOWN = object()
+
+def rating_delta(old, new):
+    return (new is not None) - (old is not None), (new or 0) - (old or 0)
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    old = None if created else getattr(instance, '_stored_rating', UNKNOWN)
+    if old is UNKNOWN:
+        # saved without being loaded first, the previous rating is unknown
+        instance.product.update_ratings()
+    else:
+        count_delta, sum_delta = rating_delta(old, instance.rating)
+        if count_delta or sum_delta:
+            Product.apply_rating_change(instance.product_id, count_delta, sum_delta)
+    instance._stored_rating = instance.rating
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    count_delta, sum_delta = rating_delta(getattr(instance, '_stored_rating', instance.rating), None)
+    if count_delta or sum_delta:
+        Product.apply_rating_change(instance.product_id, count_delta, sum_delta)
+
+
+#---------------------------------------------------------------------------
+# cached catalog responses
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def catalog_changed(sender, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+
+
+#---------------------------------------------------------------------------
+# resized image variants
+
+IMAGE_FIELDS = {model: model.image_fields for model in IMAGE_MODELS}
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Category)
+def image_uploaded(sender, instance, update_fields=None, **kwargs):
+    # only a newly stored file needs variants, not every stock or price edit of the row
+    stored = getattr(instance, '_stored_images', {})
+    deferred = instance.get_deferred_fields()
+    for field in IMAGE_FIELDS[sender]:
+        if field in deferred or (update_fields is not None and field not in update_fields):
+            continue
+        name = getattr(instance, field).name or ''
+        if name != stored.get(field, ''):
+            schedule_variants(getattr(instance, field))
+        stored[field] = name
+    instance._stored_images = stored
@@ -1,3 +1,351 @@
+import itertools
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from users.models import MyUser
+from .models import Product, Category, ProductRanking, Review, effective_price
+from .cache import CATALOG_VERSION_KEY, catalog_version
+from .images import srcset, mark_variants_ready
+from .rankings import compute
+
+mobiles = itertools.count(9120000002)
+
+
+class CatalogTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = MyUser.objects.create_user(mobile='09120000001', is_seller=True, is_customer=False)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_API_KEY=settings.API_KEY)
+
+    def product(self, **fields):
+        return Product.objects.create(**{
+            'seller': self.seller, 'name': 'product', 'description': 'description', 'price': 10, 'stock': 5,
+            **fields,
+        })
+
+
+class ProductFilterTests(CatalogTestCase):
+
+    def ids(self, query):
+        response = self.client.get(f'/api/products/products/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return {product['id'] for product in response.data['results']}
+
+    def test_sale_price_is_rounded_half_up_to_cents(self):
+        on_sale = self.product(price=20, in_sale=True, sale_price=Decimal('9.995'))
+        self.product(price=Decimal('12.50'))
+        self.product(price=20, in_sale=True, sale_price=Decimal('9.994'))
+        prices = Product.objects.annotate(unit_price=effective_price()).order_by('id').values_list('unit_price', flat=True)
+        self.assertEqual(list(prices), [Decimal('10.00'), Decimal('12.50'), Decimal('9.99')])
+        self.assertEqual(self.ids('min_price=10&max_price=10'), {on_sale.id})
+
+    def test_min_rating(self):
+        rated = self.product(average_rating=4.5)
+        self.product(average_rating=2)
+        self.assertEqual(self.ids('min_rating=4'), {rated.id})
+
+    def test_invalid_numbers_are_refused(self):
+        for query in ('min_rating=nan', 'min_rating=inf', 'min_rating=6', 'min_rating=-1',
+                      'min_price=nan', 'max_price=Infinity', 'min_price=abc'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/products/products/?{query}').status_code, 400)
+
+
+class CatalogPaginationTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.products = [self.product(name=str(i)) for i in range(5)]
+        # a tie on date_added is broken by id
+        Product.objects.filter(pk__in=[self.products[1].pk, self.products[2].pk]).update(
+            date_added=self.products[1].date_added,
+        )
+
+    def page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [product['id'] for product in response.data['results']], response.data
+
+    def test_pages_newest_first_and_back(self):
+        newest_first = list(Product.objects.order_by('-date_added', '-id').values_list('id', flat=True))
+        ids, data = self.page('/api/products/products/?page_size=2')
+        self.assertIsNone(data['previous'])
+        pages = [ids]
+        while data['next']:
+            ids, data = self.page(data['next'])
+            pages.append(ids)
+        self.assertEqual([len(ids) for ids in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), newest_first)
+        ids, data = self.page(data['previous'])
+        self.assertEqual(ids, pages[1])
+        ids, data = self.page(data['previous'])
+        self.assertEqual(ids, pages[0])
+        self.assertIsNone(data['previous'])
+
+    def test_deep_page_costs_the_same(self):
+        Product.objects.update(in_sale=True, sale_price=5)
+        url, counts = '/api/products/products/on-sale/?page_size=1', []
+        while url:
+            # a cold cache, so every page reaches the database
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                url = self.client.get(url).data['next']
+            counts.append(len(queries))
+        self.assertEqual(counts, [1] * 5)
+
+    def test_page_size_and_cursor_are_checked(self):
+        self.assertEqual(len(self.page('/api/products/products/?page_size=1000')[0]), 5)
+        self.assertEqual(len(self.page('/api/products/products/?page_size=0')[0]), 5)
+        for cursor in ('abc', 'e30', 'eyJ2IjpbXX0'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(f'/api/products/products/?cursor={cursor}').status_code, 404)
+
+
+class ProductCardTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.reviewed = self.product(name='reviewed', stock=0)
+        self.reviews = [
+            Review.objects.create(product=self.reviewed, user=MyUser.objects.create_user(mobile=f'0{next(mobiles)}'), rating=4)
+            for _ in range(3)
+        ]
+
+    def test_lists_render_cards_without_reviews(self):
+        card = self.client.get('/api/products/products/').data['results'][0]
+        self.assertEqual(set(card), {
+            'id', 'name', 'price', 'in_sale', 'sale_price', 'image_url', 'average_rating', 'total_ratings', 'in_stock',
+        })
+        self.assertEqual((card['total_ratings'], card['in_stock']), (3, False))
+        self.assertNotIn('reviews', self.client.get(f'/api/products/products/{self.reviewed.pk}/').data)
+
+    def test_reviews_endpoint(self):
+        url = f'/api/products/products/{self.reviewed.pk}/reviews/'
+        response = self.client.get(f'{url}?page_size=2')
+        self.assertEqual([review['id'] for review in response.data['results']], [self.reviews[2].id, self.reviews[1].id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([review['id'] for review in response.data['results']], [self.reviews[0].id])
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(self.client.get('/api/products/products/0/reviews/').status_code, 404)
+
+
+class CatalogCacheTests(CatalogTestCase):
+
+    def test_conditional_get_without_a_cached_response(self):
+        self.product()
+        etag = self.client.get('/api/products/products/')['ETag']
+        # the cached page is evicted, the catalog has not changed
+        version = cache.get(CATALOG_VERSION_KEY)
+        cache.clear()
+        cache.set(CATALOG_VERSION_KEY, version)
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_catalog_change_invalidates(self):
+        product = self.product()
+        etag = self.client.get('/api/products/products/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'renamed'
+            product.save()
+        response = self.client.get('/api/products/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['name'], 'renamed')
+
+    def test_browsable_api_is_not_cached(self):
+        self.product()
+        html = self.client.get('/api/products/products/', HTTP_ACCEPT='text/html')
+        self.assertTrue(html['Content-Type'].startswith('text/html'))
+        self.assertNotIn('ETag', html)
+        response = self.client.get('/api/products/products/', HTTP_ACCEPT='text/html')
+        self.assertNotIn('ETag', response)
+        self.assertTrue(self.client.get('/api/products/products/')['Content-Type'].startswith('application/json'))
+
+    def test_category_tree_conditional_get(self):
+        with mock.patch('products.signals.schedule_variants'):
+            Category.objects.create(name='phones', icon='category_icons/phones.png')
+        response = self.client.get('/api/products/categories/')
+        self.assertEqual(response.data[0]['icon_url']['original'], 'http://testserver/media/category_icons/phones.png')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/categories/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        # one cached tree per origin
+        with self.settings(ALLOWED_HOSTS=['shop.example.com']):
+            response = self.client.get('/api/products/categories/', HTTP_HOST='shop.example.com')
+        self.assertEqual(response.data[0]['icon_url']['original'], 'http://shop.example.com/media/category_icons/phones.png')
+
+    def test_category_save_changes_the_tree(self):
+        category = Category.objects.create(name='phones')
+        etag = self.client.get('/api/products/categories/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            category.name = 'mobiles'
+            category.save()
+        response = self.client.get('/api/products/categories/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['name'], 'mobiles')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_product_save_bumps_the_catalog_version(self):
+        product = self.product()
+        version = catalog_version()
+        with mock.patch('products.cache.time.time', return_value=version + 1), self.captureOnCommitCallbacks(execute=True):
+            product.stock = 3
+            product.save()
+        self.assertNotEqual(catalog_version(), version)
+
+
+class ImageVariantTests(CatalogTestCase):
+
+    def test_variants_only_for_a_new_file(self):
+        with mock.patch('products.signals.schedule_variants') as schedule:
+            product = self.product(image='product_images/a.png')
+            self.assertEqual(schedule.call_count, 1)
+            product = Product.objects.get(pk=product.pk)
+            product.stock = 3
+            product.save()
+            Product.objects.get(pk=product.pk).save()
+            self.assertEqual(schedule.call_count, 1)
+            product.image = 'product_images/b.png'
+            product.save()
+            self.assertEqual(schedule.call_count, 2)
+
+    def test_srcset_reads_the_recorded_variants(self):
+        with mock.patch('products.signals.schedule_variants'):
+            product = self.product(image='product_images/a.png')
+        with mock.patch.object(default_storage, 'exists', side_effect=AssertionError("storage lookup")):
+            self.assertEqual(set(srcset(product.image)), {'original'})
+            self.assertEqual(mark_variants_ready('product_images/a.png'), 1)
+            product.refresh_from_db()
+            urls = srcset(product.image)
+        self.assertIn('variants/product_images/a_200w.webp 200w', urls['webp'])
+        self.assertIn('variants/product_images/a_800w.jpg 800w', urls['jpeg'])
+
+
+class RankingTests(CatalogTestCase):
+
+    def test_rails_from_the_given_sales(self):
+        parent = Category.objects.create(name='electronics')
+        phones = Category.objects.create(name='phones', parent=parent)
+        old_hit, new_hit, other = (self.product(category=phones), self.product(category=phones), self.product())
+        today = timezone.localdate()
+        sales = [
+            (old_hit.id, today - timedelta(days=20), 10),
+            (new_hit.id, today, 4),
+            (other.id, today - timedelta(days=1), 1),
+        ]
+        requested = []
+
+        def product_sales(since):
+            requested.append(since)
+            return [row for row in sales if row[1] >= since]
+
+        written = compute(product_sales, size=5, half_lives={'bestsellers': 30, 'trending': 3})
+        self.assertEqual(requested, [today - timedelta(days=240)])
+        # global, electronics and phones rails
+        self.assertEqual(written, {'bestsellers': 7, 'trending': 7})
+
+        def rail(kind, category=None):
+            return list(
+                ProductRanking.objects.filter(kind=kind, category=category)
+                .order_by('position').values_list('product_id', flat=True)
+            )
+
+        self.assertEqual(rail('bestsellers'), [old_hit.id, new_hit.id, other.id])
+        self.assertEqual(rail('trending'), [new_hit.id, other.id, old_hit.id])
+        self.assertEqual(rail('trending', parent), [new_hit.id, old_hit.id])
+        self.assertEqual(rail('bestsellers', phones), [old_hit.id, new_hit.id])
+
+
+class RatingAggregateTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.rated = self.product()
+
+    def review(self, rating):
+        user = MyUser.objects.create_user(mobile=f'0{next(mobiles)}')
+        return Review.objects.create(product=self.rated, user=user, rating=rating)
+
+    def assertRatings(self, total, rating_sum, average):
+        self.rated.refresh_from_db()
+        self.assertEqual((self.rated.total_ratings, self.rated.rating_sum), (total, rating_sum))
+        self.assertAlmostEqual(self.rated.average_rating, average)
+
+    def test_reviews_update_the_aggregates(self):
+        first, second = self.review(5), self.review(2)
+        self.review(None)
+        self.assertRatings(2, 7, 3.5)
+        second.rating = 4
+        second.save()
+        self.assertRatings(2, 9, 4.5)
+        first.rating = None
+        first.save()
+        self.assertRatings(1, 4, 4)
+        Review.objects.get(pk=second.pk).delete()
+        self.assertRatings(0, 0, 0)
+
+    def test_save_without_loading_recomputes(self):
+        review = self.review(5)
+        Review(pk=review.pk, product=self.rated, user=review.user, rating=1, created_at=review.created_at).save()
+        self.assertRatings(1, 1, 1)
+
+    def test_recompute_repairs_drift(self):
+        self.review(4)
+        self.review(3)
+        Product.objects.filter(pk=self.rated.pk).update(total_ratings=7, rating_sum=1, average_rating=0.1)
+        call_command('recompute_ratings', chunk_size=1, stdout=mock.Mock())
+        self.assertRatings(2, 7, 3.5)
+
+
+class SearchTests(CatalogTestCase):
+
+    def search(self, query):
+        response = self.client.get('/api/products/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [product['id'] for product in response.data['results']]
+
+    def indexed_product(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.product(**fields)
+
+    def test_prefix_and_typo_matches(self):
+        phone = self.indexed_product(name='Samsung Galaxy', description='android phone')
+        self.indexed_product(name='Kettle', description='boils water')
+        self.assertEqual(self.search('sams'), [phone.id])
+        self.assertEqual(self.search('galaxy andr'), [phone.id])
+        # one edit away from an indexed term
+        self.assertEqual(self.search('samsnug'), [phone.id])
+        self.assertEqual(self.search('toaster'), [])
+
+    def test_name_matches_rank_first(self):
+        in_description = self.indexed_product(name='Case', description='fits the galaxy')
+        in_name = self.indexed_product(name='Galaxy', description='phone')
+        self.assertEqual(self.search('galaxy'), [in_name.id, in_description.id])
 
-# Create your tests here.
+    def test_index_follows_updates_and_deletes(self):
+        product = self.indexed_product(name='Kettle', description='boils water')
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = 'Teapot'
+            product.save()
+        self.assertEqual(self.search('teapot'), [product.id])
+        self.assertEqual(self.search('kettle'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertEqual(self.search('teapot'), [])
@@ -3,7 +3,8 @@ from .views import (
     ProductListView, ProductDetailView, AddProductView, 
     CategoryListView, ProductUpdateView, ProductDeleteView,
     BrandListView, ProductRetrieveUpdateDestroyView, ProductListCreateView,
-    SaleProductListView,
+    SaleProductListView, ProductReviewListView, ProductSearchView,
+    AddReviewView, ReviewDetailView, ProductRankingView,
 )
 
 urlpatterns = [
@@ -12,6 +13,14 @@ urlpatterns = [
     path('products/', ProductListView.as_view(), name='product_list'),
     # product detail
     path('products/<int:pk>/', ProductDetailView.as_view(), name='product_detail'),
+    # reviews of a product
+    path('products/<int:pk>/reviews/', ProductReviewListView.as_view(), name='product_reviews'),
+    path('products/<int:pk>/reviews/add/', AddReviewView.as_view(), name='add_review'),
+    path('reviews/<int:pk>/', ReviewDetailView.as_view(), name='review_detail'),
+    # full-text search
+    path('search/', ProductSearchView.as_view(), name='product_search'),
+    # best seller / trending rails
+    path('rankings/<str:kind>/', ProductRankingView.as_view(), name='product_rankings'),
     # sale products box
     path('products/on-sale/', SaleProductListView.as_view(), name='products_on_sale'),
 
@@ -1,43 +1,140 @@
 from rest_framework import generics, permissions, status
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
-from .models import Product, Category, ProductImage, Review, Brand
+from .models import Product, Category, ProductImage, Review, Brand, ProductRanking
 from drf_spectacular.utils import extend_schema
 from .permissions import IsSeller
 from django.shortcuts import get_object_or_404
 from drf_spectacular.utils import extend_schema_view, extend_schema
 from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError
+from .pagination import ProductCursorPagination, ReviewCursorPagination
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+from . import search
+from .filters import ProductFilterSet
+from .cache import get_category_tree, CatalogCacheMixin
 
 from .serializers import (
     ProductSerializer, CategorySerializer, ReviewSerializer, 
-    ProductImageSerializer, BrandSerializer,
+    ProductImageSerializer, BrandSerializer, ProductCardSerializer,
+)
+
+# columns needed to render a product card
+CARD_FIELDS = (
+    'id', 'name', 'price', 'in_sale', 'sale_price', 'image',
+    'average_rating', 'total_ratings', 'stock', 'date_added', 'image_variants',
 )
 
 
-class ProductListView(generics.ListAPIView):
+@extend_schema(description="List products, filtered by ?category= (with descendants), ?brand=, ?min_price=, "
+                           "?max_price=, ?in_sale=, ?min_rating= and ?in_stock=, with facet counts")
+class ProductListView(CatalogCacheMixin, generics.ListAPIView):
 
     permission_classes = [AllowAny]
-    queryset = Product.objects.select_related("category", "brand").prefetch_related("images", "reviews")
-    serializer_class = ProductSerializer
+    queryset = Product.objects.only(*CARD_FIELDS)
+    serializer_class = ProductCardSerializer
+    pagination_class = ProductCursorPagination
+
+    def get_queryset(self):
+        self.filterset = ProductFilterSet(self.request.query_params)
+        return self.filterset.filter(super().get_queryset())
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        page = self.paginate_queryset(queryset)
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        response.data['facets'] = self.filterset.facets(queryset)
+        return response
 
 #-----------------------------------------------------------------------------------
 
-class ProductDetailView(generics.RetrieveAPIView):
+class ProductDetailView(CatalogCacheMixin, generics.RetrieveAPIView):
 
     permission_classes = [AllowAny]
-    queryset = Product.objects.all()
+    queryset = Product.objects.prefetch_related("images")
     serializer_class = ProductSerializer
 
 #-----------------------------------------------------------------------------------
 
-class SaleProductListView(APIView):
+class ProductReviewListView(generics.ListAPIView):
+
+    permission_classes = [AllowAny]
+    serializer_class = ReviewSerializer
+    pagination_class = ReviewCursorPagination
+
+    def get_queryset(self):
+        product = get_object_or_404(Product.objects.only("id"), pk=self.kwargs["pk"])
+        return Review.objects.filter(product=product)
+
+#-----------------------------------------------------------------------------------
+
+class SaleProductListView(CatalogCacheMixin, generics.ListAPIView):
+
+    permission_classes = [AllowAny]
+    queryset = Product.objects.filter(in_sale=True).only(*CARD_FIELDS)
+    serializer_class = ProductCardSerializer
+    pagination_class = ProductCursorPagination
+
+#-----------------------------------------------------------------------------------
+
+@extend_schema(description="Best sellers or trending products (kind = bestsellers | trending), "
+                           "globally or for a category and its descendants with ?category=")
+class ProductRankingView(CatalogCacheMixin, generics.ListAPIView):
+
+    permission_classes = [AllowAny]
+    serializer_class = ProductCardSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        kind = self.kwargs['kind']
+        if kind not in dict(ProductRanking.KIND_CHOICES):
+            raise ValidationError({"kind": f"Unknown ranking {kind}."})
+        category = self.request.query_params.get('category')
+        if category is not None and not category.isdigit():
+            raise ValidationError({"category": "Must be a category id."})
+        # a single lookup on the (kind, category, position) index of the precomputed rail
+        return [
+            ranking.product for ranking in
+            ProductRanking.objects.filter(kind=kind, category_id=category)
+            .select_related('product').only(*(f'product__{field}' for field in CARD_FIELDS), 'product_id')
+            .order_by('position')
+        ]
+
+#-----------------------------------------------------------------------------------
+
+@extend_schema(description="Full-text product search, best match first (?q=...&page=...)")
+class ProductSearchView(APIView):
+
     permission_classes = [AllowAny]
+    page_size = 20
+    max_page = 50
 
     def get(self, request):
-        products_on_sale = Product.objects.filter(in_sale=True)
-        serializer = ProductSerializer(products_on_sale, many=True, context={'request': request})
-        return Response(serializer.data)
-    
+        query = request.query_params.get("q", "").strip()
+        try:
+            page = min(max(int(request.query_params.get("page", 1)), 1), self.max_page)
+        except ValueError:
+            page = 1
+
+        # one extra id tells whether there is a next page
+        ids = search.search_ids(query, self.page_size + 1, (page - 1) * self.page_size) if query else []
+        has_next = len(ids) > self.page_size and page < self.max_page
+        ids = ids[:self.page_size]
+
+        products = Product.objects.only(*CARD_FIELDS).in_bulk(ids)
+        ranked = [products[pk] for pk in ids if pk in products]
+        serializer = ProductCardSerializer(ranked, many=True, context={'request': request})
+
+        url = request.build_absolute_uri()
+        previous = None
+        if page > 1:
+            previous = replace_query_param(url, "page", page - 1) if page > 2 else remove_query_param(url, "page")
+        return Response({
+            "next": replace_query_param(url, "page", page + 1) if has_next else None,
+            "previous": previous,
+            "results": serializer.data,
+        })
+
 #-----------------------------------------------------------------------------------
 
 # Seller add-update-remove products
@@ -79,10 +176,21 @@ class AddReviewView(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
-        product_id = self.kwargs['pk']
-        product = Product.objects.get(pk=product_id)
+        product = get_object_or_404(Product.objects.only("id"), pk=self.kwargs['pk'])
+        if Review.objects.filter(product=product, user=self.request.user).exists():
+            raise ValidationError("You have already reviewed this product.")
+        # the product's rating aggregates are adjusted by the Review signals
         serializer.save(user=self.request.user, product=product)
-        product.update_ratings()
+
+#-----------------------------------------------------------------------------------
+
+class ReviewDetailView(generics.RetrieveUpdateDestroyAPIView):
+
+    serializer_class = ReviewSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Review.objects.filter(user=self.request.user)
 
 #-----------------------------------------------------------------------------------
 
@@ -98,17 +206,23 @@ class AddProductImageView(generics.CreateAPIView):
 
 #-----------------------------------------------------------------------------------
 
-@extend_schema(description="List root categories")
-class CategoryListView(generics.ListAPIView):
+@extend_schema(description="Category tree (root categories with nested children)", responses=CategorySerializer(many=True))
+class CategoryListView(CatalogCacheMixin, generics.ListAPIView):
     
     permission_classes = [AllowAny]
-    queryset = Category.objects.filter(parent=None).prefetch_related('children')
     serializer_class = CategorySerializer
 
+    def catalog_etag(self):
+        # the tree only changes with a Category, its ETag outlives catalog version bumps
+        return get_category_tree(self.request)['etag']
+
+    def list(self, request, *args, **kwargs):
+        return Response(get_category_tree(request)['data'])
+
 #-----------------------------------------------------------------------------------
 
 @extend_schema(description="List Brands")
-class BrandListView(generics.ListAPIView):
+class BrandListView(CatalogCacheMixin, generics.ListAPIView):
 
     permission_classes = [AllowAny]
     queryset = Brand.objects.all()
@@ -120,6 +234,17 @@ class ProductListCreateView(generics.ListCreateAPIView):
 
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = ProductCursorPagination
+
+    def get_queryset(self):
+        if self.request.method == "GET":
+            return self.queryset.only(*CARD_FIELDS)
+        return self.queryset
+
+    def get_serializer_class(self):
+        if self.request.method == "GET":
+            return ProductCardSerializer
+        return self.serializer_class
 
     def perform_create(self, serializer):
         serializer.save(seller=self.request.user)
@@ -1,3 +1,130 @@
+import gzip
+import itertools
+import json
+from decimal import Decimal
+
+from django.conf import settings
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from cart.models import Cart, CartItem
+from orders.models import Order, SubOrder, OrderItem
+from orders.services import checkout
+from products.models import Product
+from users.models import MyUser
+
+mobiles = itertools.count(9120000001)
+
+
+def make_user(**fields):
+    return MyUser.objects.create_user(mobile=f'0{next(mobiles)}', **fields)
+
+
+class SellerExportTests(TestCase):
+
+    def setUp(self):
+        self.seller = make_user(is_seller=True, is_customer=False)
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_API_KEY=settings.API_KEY)
+        self.client.force_authenticate(self.seller)
+
+    def product(self, name='product', seller=None):
+        return Product.objects.create(
+            seller=seller or self.seller, name=name, description='description', price=10, stock=5,
+        )
+
+    def export(self, name, **params):
+        response = self.client.get(reverse(f'seller-export-{name}'), params)
+        content = b''.join(response.streaming_content) if response.streaming else None
+        return response, content
+
+    def test_products_csv(self):
+        self.product('=HYPERLINK("http://example.com")')
+        self.product('-1+2')
+        self.product('plain')
+        self.product('not mine', seller=make_user(is_seller=True, is_customer=False))
+        response, content = self.export('products')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="products.csv"')
+        lines = content.decode().splitlines()
+        self.assertTrue(lines[0].startswith('id,name,category,brand,price'))
+        self.assertEqual([line.split(',')[1] for line in lines[2:]], ["'-1+2", 'plain'])
+        self.assertIn(',"\'=HYPERLINK(""http://example.com"")",', lines[1])
+
+    def test_orders_ndjson_gzip(self):
+        customer = make_user()
+        order = Order.objects.create(
+            customer=customer, total_price=20, shipping_address='a', city='c', zipcode='1',
+        )
+        sub_order = SubOrder.objects.create(order=order, seller=self.seller, subtotal=20)
+        OrderItem.objects.create(order=order, sub_order=sub_order, product=self.product('=1+1'), quantity=2, price=10)
+        response, content = self.export('orders', export_format='ndjson', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        rows = [json.loads(line) for line in gzip.decompress(content).decode().splitlines()]
+        self.assertEqual(len(rows), 1)
+        # only the CSV cells are escaped, JSON values are never evaluated
+        self.assertEqual((rows[0]['sub_order_id'], rows[0]['product_name']), (sub_order.id, '=1+1'))
+
+    def test_invalid_parameters(self):
+        for params in ({'export_format': 'xml'}, {'start': '2024-13-01'}, {'start': '2024-02-01', 'end': '2024-01-01'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.export('products', **params)[0].status_code, 400)
+
+
+class SellerOrderTests(TestCase):
+
+    def setUp(self):
+        self.customer = make_user()
+        self.sellers = [make_user(is_seller=True, is_customer=False) for _ in range(2)]
+        cart, _ = Cart.objects.get_or_create(customer=self.customer)
+        for seller, prices in zip(self.sellers, ((10, 5), (7,))):
+            for price in prices:
+                product = Product.objects.create(seller=seller, name='product', description='description', price=price, stock=5)
+                CartItem.objects.create(cart=cart, product=product, quantity=2)
+        self.order = checkout(self.customer, 'a', 'c', '1')
+
+    def client_for(self, seller):
+        client = APIClient()
+        client.credentials(HTTP_X_API_KEY=settings.API_KEY)
+        client.force_authenticate(seller)
+        return client
+
+    def set_status(self, sub_order, status, seller=None):
+        return self.client_for(seller or sub_order.seller).post(
+            reverse('seller-orders-set-status', args=[sub_order.pk]), {'status': status},
+        )
+
+    def test_one_sub_order_per_seller(self):
+        sub_orders = {sub_order.seller_id: sub_order for sub_order in self.order.sub_orders.all()}
+        self.assertEqual(set(sub_orders), {seller.id for seller in self.sellers})
+        self.assertEqual(sub_orders[self.sellers[0].id].subtotal, Decimal('30.00'))
+        self.assertEqual(sub_orders[self.sellers[1].id].subtotal, Decimal('14.00'))
+        for seller_id, sub_order in sub_orders.items():
+            self.assertEqual(set(sub_order.items.values_list('product__seller_id', flat=True)), {seller_id})
+        # every seller lists only their own part
+        response = self.client_for(self.sellers[1]).get(reverse('seller-orders-list'))
+        self.assertEqual([row['id'] for row in response.data['results']], [sub_orders[self.sellers[1].id].id])
+
+    def test_status_transitions(self):
+        sub_order = self.order.sub_orders.get(seller=self.sellers[0])
+        self.assertEqual(self.set_status(sub_order, 'Delivered').status_code, 400)
+        self.assertEqual(self.set_status(sub_order, 'Processing').status_code, 200)
+        # not paid yet
+        response = self.set_status(sub_order, 'Shipped')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'The order has not been paid yet.'})
+        Order.objects.filter(pk=self.order.pk).update(status='Completed')
+        self.assertEqual(self.set_status(sub_order, 'Shipped').status_code, 200)
+        self.assertEqual(self.set_status(sub_order, 'Cancelled').status_code, 400)
+        self.assertEqual(self.set_status(sub_order, 'Delivered').status_code, 200)
+        self.assertEqual(self.set_status(sub_order, 'Pending').status_code, 400)
+        sub_order.refresh_from_db()
+        self.assertEqual(sub_order.status, 'Delivered')
 
-# Create your tests here.
+    def test_cancelled_is_final(self):
+        sub_order = self.order.sub_orders.get(seller=self.sellers[1])
+        self.assertEqual(self.set_status(sub_order, 'Cancelled').status_code, 200)
+        self.assertEqual(self.set_status(sub_order, 'Processing').status_code, 400)
+        # another seller cannot touch it
+        self.assertEqual(self.set_status(sub_order, 'Processing', seller=self.sellers[0]).status_code, 404)
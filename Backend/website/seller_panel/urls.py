@@ -1,6 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import SellerProductViewSet, SellerOrderViewSet, SellerNotificationViewSet
+from .views import (
+    SellerProductViewSet, SellerOrderViewSet, SellerNotificationViewSet,
+    SellerOrderExportView, SellerProductExportView,
+)
 
 router = DefaultRouter()
 router.register(r'seller/products', SellerProductViewSet, basename='seller-products'),
@@ -9,5 +12,7 @@ router.register(r'seller/notifications', SellerNotificationViewSet, basename='se
 
 
 urlpatterns = [
+    path('seller/exports/orders/', SellerOrderExportView.as_view(), name='seller-export-orders'),
+    path('seller/exports/products/', SellerProductExportView.as_view(), name='seller-export-products'),
     path('', include(router.urls)),
 ]
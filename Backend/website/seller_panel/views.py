@@ -1,8 +1,21 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
 from rest_framework import viewsets, permissions
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from products.models import Product
 from products.serializers import ProductSerializer
-from orders.models import Order, Notification
-from orders.serializers import OrderSerializer, NotificationSerializer
+from orders.models import SubOrder, OrderItem, Notification
+from orders.pagination import SubOrderCursorPagination, NotificationCursorPagination
+from orders.views import order_items_prefetch
+from orders.serializers import SubOrderSerializer, SubOrderStatusSerializer, NotificationSerializer, MarkReadSerializer
+from orders.notifications import mark_read, unread_count
+from website.events import publish_on_commit
+from users.permissions import IsSeller
+from website.utils import date_param
+from .exports import FORMATS, CHUNK_SIZE, export_response
 
 
 
@@ -20,17 +33,135 @@ class SellerProductViewSet(viewsets.ModelViewSet):
 # show orders to seller
 
 class SellerOrderViewSet(viewsets.ReadOnlyModelViewSet):
-    serializer_class = OrderSerializer
+    serializer_class = SubOrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = SubOrderCursorPagination
 
     def get_queryset(self):
-        return Order.objects.filter(items__product__seller=self.request.user).distinct()
+        # a range scan on the (seller, date_created, id) index, only this seller's lines
+        return (
+            SubOrder.objects.filter(seller=self.request.user)
+            .select_related('order')
+            .prefetch_related(order_items_prefetch())
+            .order_by('-date_created', '-id')
+        )
+
+    @action(detail=True, methods=['post'], url_path='status')
+    def set_status(self, request, pk=None):
+        # fulfilment status of this seller's part of the order
+        sub_order = self.get_object()
+        serializer = SubOrderStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        new_status = serializer.validated_data['status']
+        if new_status not in SubOrder.TRANSITIONS[sub_order.status]:
+            return Response({"error": f"A {sub_order.status} order cannot be moved to {new_status}."}, status=400)
+        if new_status == 'Shipped' and sub_order.order.status != 'Completed':
+            return Response({"error": "The order has not been paid yet."}, status=400)
+        # guarded on the status checked above, so a concurrent change is not overwritten
+        if not SubOrder.objects.filter(pk=sub_order.pk, status=sub_order.status).update(status=new_status):
+            return Response({"error": "The order status changed meanwhile, reload it."}, status=409)
+        sub_order.status = new_status
+        publish_on_commit(sub_order.order.customer_id, 'order', {
+            'id': sub_order.order_id, 'sub_order': sub_order.id, 'status': sub_order.status,
+        })
+        return Response(self.get_serializer(sub_order).data)
 
 
 # notifications of customers orders to seller
 class SellerNotificationViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NotificationCursorPagination
 
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user, is_read=False)
\ No newline at end of file
+        return Notification.objects.filter(user=self.request.user, is_read=False).order_by('-id')
+
+    @action(detail=False, methods=['get'], url_path='unread-count')
+    def unread_count(self, request):
+        return Response({"unread": unread_count(request.user)})
+
+    @action(detail=False, methods=['post'], url_path='mark-read')
+    def mark_read(self, request):
+        # everything up to the newest notification the client has shown, or all of them
+        serializer = MarkReadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        marked = mark_read(request.user, serializer.validated_data.get('up_to_id'))
+        return Response({"marked": marked, "unread": unread_count(request.user)})
+
+
+# streamed downloads of the seller's data, e.g.
+# ?export_format=csv&start=2024-01-01&end=2024-12-31&gzip=1
+class SellerExportView(APIView):
+    permission_classes = [permissions.IsAuthenticated, IsSeller]
+    name = None
+    model = None
+    seller_field = 'seller'
+    date_field = None
+    ordering = ()
+    # header of the file, and the fields read for each column in the same order
+    columns = ()
+    values = ()
+
+    def get_rows(self, filters):
+        # values_list: no ORM objects are built
+        return (
+            self.model.objects.filter(**{self.seller_field: self.request.user}, **filters)
+            .order_by(*self.ordering).values_list(*self.values)
+        )
+
+    def get(self, request):
+        # "format" itself is taken by DRF's renderer override
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in FORMATS:
+            return Response({"error": f"export_format must be one of {', '.join(FORMATS)}"}, status=400)
+        start = date_param(request, 'start', False)
+        end = date_param(request, 'end', False)
+        if start is None or end is None or (start and end and start > end):
+            return Response({"error": "start and end must be dates (YYYY-MM-DD), start before end"}, status=400)
+
+        filters = {}
+        # datetime bounds rather than __date lookups, so the date index is still usable
+        if start:
+            filters[f'{self.date_field}__gte'] = timezone.make_aware(datetime.combine(start, time.min))
+        if end:
+            filters[f'{self.date_field}__lt'] = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+        # iterator() streams from the cursor without filling the queryset cache
+        rows = self.get_rows(filters).iterator(chunk_size=CHUNK_SIZE)
+        filename = '-'.join(str(part) for part in (self.name, start, end) if part)
+        return export_response(
+            self.columns, rows, export_format, filename,
+            compress=request.query_params.get('gzip') in ('1', 'true'),
+        )
+
+
+# one row per sold line of this seller's sub-orders
+class SellerOrderExportView(SellerExportView):
+    name = 'orders'
+    model = OrderItem
+    seller_field = 'sub_order__seller'
+    date_field = 'sub_order__date_created'
+    # walks the (seller, date_created, id) index of the sub-orders
+    ordering = ('sub_order__date_created', 'sub_order_id', 'id')
+    columns = (
+        'order_id', 'sub_order_id', 'date_created', 'order_status', 'status',
+        'product_id', 'product_name', 'quantity', 'price', 'city', 'zipcode',
+    )
+    values = (
+        'order_id', 'sub_order_id', 'sub_order__date_created', 'order__status', 'sub_order__status',
+        'product_id', 'product__name', 'quantity', 'price', 'order__city', 'order__zipcode',
+    )
+
+
+class SellerProductExportView(SellerExportView):
+    name = 'products'
+    model = Product
+    date_field = 'date_added'
+    ordering = ('id',)
+    columns = (
+        'id', 'name', 'category', 'brand', 'price', 'in_sale', 'sale_price', 'stock',
+        'sold_quantity', 'average_rating', 'total_ratings', 'date_added',
+    )
+    values = (
+        'id', 'name', 'category__name', 'brand__name', 'price', 'in_sale', 'sale_price', 'stock',
+        'sold_quantity', 'average_rating', 'total_ratings', 'date_added',
+    )
@@ -22,6 +22,8 @@ from rest_framework_simplejwt.authentication import JWTAuthentication
 from .models import MyUser, Customer, Seller
 from products.models import Product
 from products.serializers import ProductSerializer
+from cart import guest as guest_cart
+from cart.services import merge_guest_cart, CartError
 from . import kavesms 
 from .kavesms import get_random_otp, check_otp_expiration
 from .permissions import IsCustomer, IsSeller
@@ -91,11 +93,25 @@ class VerifyCustomerOTPView(APIView):
             if user.is_otp_valid(otp):
                 tokens = get_tokens_for_user(user)
                 if not hasattr(user, 'customer_profile'):
-                    return Response({'message': 'Profile completion required.', 'tokens': tokens}, status=status.HTTP_200_OK)
-                return Response({'message': 'Login successful.', 'tokens': tokens}, status=status.HTTP_200_OK)
+                    response = Response({'message': 'Profile completion required.', 'tokens': tokens}, status=status.HTTP_200_OK)
+                else:
+                    response = Response({'message': 'Login successful.', 'tokens': tokens}, status=status.HTTP_200_OK)
+                return self.merge_guest_cart(request, response, user)
             return Response({'error': 'Invalid or expired OTP.'}, status=status.HTTP_400_BAD_REQUEST)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def merge_guest_cart(self, request, response, user):
+        # move the cookie cart filled before logging in into the user's cart
+        items = guest_cart.load(request)
+        if not items:
+            return response
+        try:
+            merge_guest_cart(user, items)
+        except CartError:
+            logger.warning("Could not merge the guest cart of user %s", user.pk)
+            return response
+        return guest_cart.store(response, {})
+
 # Complete Customer Profile
 class CompleteCustomerProfileView(APIView):
     authentication_classes = [JWTAuthentication]
@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'website.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# the server-sent events stream is answered before Django's request handling,
+# serve with an ASGI server: uvicorn website.asgi:application
+from website.sse import EventStreamRouter  # noqa: E402
+
+application = EventStreamRouter(django_application)
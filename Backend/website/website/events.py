@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+# Pub/sub for the server-sent events stream (website.sse). Publishers are ordinary sync
+# code (views, services, signals) and call publish() once their transaction commits;
+# subscribers are the streaming connections, each an asyncio queue that sleeps until an
+# event arrives, so idle connections cost nothing but their queue.
+#
+# The broker is chosen by settings.EVENTS_BACKEND. InProcessBroker only reaches the
+# connections of the current process: run a single ASGI worker with it, or point the
+# setting at a broker class backed by a shared bus (e.g. redis pub/sub) with the same
+# publish/subscribe/unsubscribe methods.
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+class Subscription:
+
+    def __init__(self, channel, max_pending):
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        # set when events had to be dropped, the client must reconnect and resume
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """Next event, or None after ``timeout`` seconds without one."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class InProcessBroker:
+
+    max_pending = 100
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+
+    def subscribe(self, channel):
+        # called from the event loop of the streaming connection
+        subscription = Subscription(channel, self.max_pending)
+        with self.lock:
+            self.subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscriptions.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscriptions[subscription.channel]
+
+    def publish(self, channel, event):
+        # may be called from any thread, the queues are fed on their own loop
+        with self.lock:
+            subscribers = list(self.subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # the connection's loop is closed, it unsubscribes on its way out
+                pass
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.EVENTS_BACKEND)()
+    return _broker
+
+
+def publish(user_id, event_type, data, event_id=None):
+    """Push an event to every open stream of the user. Events with an id (notifications)
+    can be resumed after a reconnect, the others are live updates only."""
+    event = {'id': event_id, 'type': event_type, 'data': data}
+    try:
+        get_broker().publish(user_channel(user_id), event)
+    except Exception:
+        # a broken event bus must never fail the request that triggered the event
+        logger.exception("Could not publish %s event", event_type)
+
+
+def publish_on_commit(user_id, event_type, data, event_id=None):
+    transaction.on_commit(lambda: publish(user_id, event_type, data, event_id))
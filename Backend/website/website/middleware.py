@@ -11,6 +11,10 @@ class APIKeyMiddleware:
         # Allow OPTIONS requests (CORS preflight)
         if request.method == "OPTIONS":
             return self.get_response(request)
+
+        # third party callbacks (payment webhooks) are authenticated by the view
+        if request.path in settings.API_KEY_EXEMPT_PATHS:
+            return self.get_response(request)
         
         # Check for API key in headers
         api_key = request.headers.get("X-API-KEY")
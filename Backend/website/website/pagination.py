@@ -0,0 +1,145 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+# Keyset (seek) pagination: every page is a single indexed range scan on the
+# ordering columns, so deep pages cost the same as the first one (no OFFSET).
+class KeysetPagination(BasePagination):
+
+    # all fields must share one direction and the last one must be unique
+    ordering = ('-id',)
+    page_size = settings.KEYSET_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self.descending = self.ordering[0].startswith('-')
+
+        cursor = self.decode_cursor(request, queryset.model)
+        reverse = cursor is not None and cursor['reverse']
+
+        descending = self.descending != reverse
+        queryset = queryset.order_by(*[('-' if descending else '') + field for field in self.fields])
+        if cursor is not None:
+            queryset = queryset.filter(self.keyset_filter(cursor['values'], descending))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.page = results
+        self.has_next = has_more if not reverse else True
+        self.has_previous = cursor is not None if not reverse else has_more
+        return results
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def keyset_filter(self, values, descending):
+        # (a, b, c) < (x, y, z)  ->  a < x OR (a = x AND (b < y OR (b = y AND c < z)))
+        lookup = 'lt' if descending else 'gt'
+        condition = None
+        for field, value in reversed(list(zip(self.fields, values))):
+            step = Q(**{f'{field}__{lookup}': value})
+            if condition is not None:
+                step |= Q(**{field: value}) & condition
+            condition = step
+        return condition
+
+    def encode_cursor(self, instance, reverse):
+        values = [self.cursor_value(getattr(instance, field)) for field in self.fields]
+        payload = json.dumps({'v': values, 'r': int(reverse)}, separators=(',', ':'))
+        token = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request, model):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            token += '=' * (-len(token) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+            values = [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, payload['v'], strict=True)
+            ]
+            return {'values': values, 'reverse': bool(payload['r'])}
+        except (binascii.Error, ValueError, TypeError, KeyError, FieldDoesNotExist, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def cursor_value(self, value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
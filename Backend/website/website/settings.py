@@ -17,9 +17,22 @@ API_KEY = os.environ.get('API_KEY')
 if not API_KEY:
     raise ImproperlyConfigured("API_KEY is not set in environment variables")
 
+# shared secret the payment gateway signs its webhooks with (see payments.gateway)
+PAYMENT_GATEWAY_SECRET = os.environ.get('PAYMENT_GATEWAY_SECRET', '')
+# paths called by third parties, they authenticate themselves and skip the API key check
+API_KEY_EXEMPT_PATHS = ('/api/payments/webhook/',)
+
 # DEBUG
 DEBUG = True
 
+# local stand-in for the payment gateway (fake_gateway app), for tests and load tests only.
+# Never enable it in production: any customer could have their own payments "paid". Its
+# events are signed with FAKE_GATEWAY_SECRET, which the webhook only accepts while enabled.
+FAKE_GATEWAY_ENABLED = os.environ.get('FAKE_GATEWAY_ENABLED', '').lower() in ('1', 'true', 'yes')
+FAKE_GATEWAY_SECRET = os.environ.get('FAKE_GATEWAY_SECRET', '')
+if FAKE_GATEWAY_ENABLED and (not FAKE_GATEWAY_SECRET or FAKE_GATEWAY_SECRET == PAYMENT_GATEWAY_SECRET):
+    raise ImproperlyConfigured("FAKE_GATEWAY_SECRET must be set, and differ from PAYMENT_GATEWAY_SECRET")
+
 # ALLOWED_HOSTS
 ALLOWED_HOSTS = []
 
@@ -49,6 +62,8 @@ INSTALLED_APPS = [
     'cart',
     'axes',  
 ]
+if FAKE_GATEWAY_ENABLED:
+    INSTALLED_APPS.append('fake_gateway')
 
 
 
@@ -91,6 +106,11 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),  # Path to your database file
+        # SQLite ignores select_for_update: take the write lock when a transaction starts,
+        # so concurrent stock checks queue up instead of failing with "database is locked"
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+        # a file rather than the in-memory default, so tests can run concurrent transactions
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
     }
 }
 
@@ -138,6 +158,42 @@ REST_FRAMEWORK = {
 
 AUTH_USER_MODEL = 'users.MyUser'
 
+# per-process cache, point it at a shared backend (redis/memcached) when running several workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+# how long stock stays held for a cart line, and for an order waiting for its payment
+CART_RESERVATION_TTL = timedelta(minutes=15)
+ORDER_RESERVATION_TTL = timedelta(minutes=30)
+# anonymous carts live in a signed cookie only and are merged into the user's cart at login
+GUEST_CART_COOKIE = 'guest_cart'
+GUEST_CART_MAX_AGE = 60 * 60 * 24 * 30
+GUEST_CART_MAX_LINES = 50
+# webhook signatures older than this many seconds are refused (replay protection)
+PAYMENT_WEBHOOK_TOLERANCE = 300
+# how long the response of a request sent with an Idempotency-Key header is replayed to its retries
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+# lifetime of cached public catalog responses, they are also invalidated on every catalog change
+CATALOG_CACHE_TIMEOUT = 60 * 15
+
+# server-sent events (website.sse), the in-process broker only reaches streams of the same process
+EVENTS_BACKEND = 'website.events.InProcessBroker'
+EVENTS_STREAM_PATH = '/api/events/stream/'
+# seconds a stream ticket stays valid, tickets live in the cache so it must be shared by all workers
+EVENTS_TICKET_TTL = 30
+
+# products kept per rail by compute_rankings, and the half-lives (days) of the sales weights
+RANKING_SIZE = 20
+RANKING_HALF_LIFE_DAYS = {'bestsellers': 30, 'trending': 3}
+
+# threads running the independent queries of the customer dashboard concurrently
+DASHBOARD_WORKERS = 4
+
+# default page size of the keyset paginated endpoints (?page_size= overrides it)
+KEYSET_PAGE_SIZE = 20
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),  # مدت زمان اعتبار توکن دسترسی
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),  # مدت زمان اعتبار توکن رفرش
@@ -217,6 +273,8 @@ CSP_FONT_SRC = ["'self'", "https://trusted.fonts.com"]
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# background threads that render the resized variants of uploaded images
+IMAGE_VARIANT_WORKERS = 2
 
 #Ensure HTTPS
 SECURE_SSL_REDIRECT = False
@@ -0,0 +1,203 @@
+import asyncio
+import functools
+import json
+import secrets
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+
+from .events import get_broker, user_channel
+
+
+# Server-sent events endpoint, served straight from the ASGI application so a connection
+# holds no worker thread while it waits. The stream carries:
+#   notification  new Notification rows, with their id as the SSE event id
+#   order         order and sub-order status changes
+#   payment       payment status changes
+# EventSource cannot send custom headers, so browsers first POST to the ticket endpoint
+# (website.views.EventStreamTicketView, API key + JWT as usual) and open the stream with
+# ?ticket=, a short-lived single-use value that is harmless in access logs. Other clients
+# may send the X-API-KEY and Authorization headers instead. A ticket is used up by the
+# first connection: on reconnect the client gets a new one and passes the id of the last
+# event it saw as ?last_event_id= (or the Last-Event-ID header), the notifications created
+# after it are replayed.
+# Only ASGI servers reach this endpoint (uvicorn website.asgi:application), runserver and
+# the WSGI application answer it with a 404.
+
+TICKET_PREFIX = 'events:ticket:'
+KEEPALIVE_SECONDS = 15
+REPLAY_LIMIT = 100
+
+
+def encode(event):
+    lines = []
+    if event.get('id') is not None:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event['data'], cls=DjangoJSONEncoder, separators=(',', ':'))}")
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+def issue_ticket(user_id):
+    ticket = secrets.token_urlsafe(32)
+    cache.set(TICKET_PREFIX + ticket, user_id, timeout=settings.EVENTS_TICKET_TTL)
+    return ticket
+
+
+def redeem_ticket(ticket):
+    # the user id of an unused ticket, the key is deleted so a second use fails
+    key = TICKET_PREFIX + ticket
+    user_id = cache.get(key)
+    if user_id is None or not cache.delete(key):
+        return None
+    return user_id
+
+
+def database_sync_to_async(function):
+    # like Django's request handler does around a view: drop stale or broken connections,
+    # a long-lived stream would otherwise keep using them
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(wrapper)
+
+
+@database_sync_to_async
+def authenticate(token):
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(token)).id
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+@database_sync_to_async
+def missed_notifications(user_id, last_event_id):
+    from orders.models import Notification
+    from orders.notifications import notification_event
+
+    notifications = Notification.objects.filter(user_id=user_id, id__gt=last_event_id).order_by('id')[:REPLAY_LIMIT]
+    return [
+        {'id': notification.id, 'type': 'notification', 'data': notification_event(notification)}
+        for notification in notifications
+    ]
+
+
+def cors_headers(headers):
+    # the stream skips Django's middleware, so CorsMiddleware's answer is repeated here
+    origin = headers.get('origin')
+    if not origin or origin not in settings.CORS_ALLOWED_ORIGINS:
+        return []
+    cors = [(b'access-control-allow-origin', origin.encode('latin-1')), (b'vary', b'origin')]
+    if settings.CORS_ALLOW_CREDENTIALS:
+        cors.append((b'access-control-allow-credentials', b'true'))
+    return cors
+
+
+async def respond(send, status, body, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), *headers],
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps(body).encode()})
+
+
+async def event_stream(scope, receive, send):
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    query = {key: values[-1] for key, values in parse_qs(scope.get('query_string', b'').decode()).items()}
+
+    cors = cors_headers(headers)
+
+    if 'ticket' in query:
+        user_id = await sync_to_async(redeem_ticket)(query['ticket'])
+        if user_id is None:
+            return await respond(send, 401, {'error': 'Invalid or used stream ticket.'}, cors)
+    else:
+        if headers.get('x-api-key') != settings.API_KEY:
+            return await respond(send, 403, {'error': 'Invalid API Key'}, cors)
+        authorization = headers.get('authorization', '')
+        token = authorization[7:] if authorization.lower().startswith('bearer ') else None
+        user_id = await authenticate(token.encode()) if token else None
+        if user_id is None:
+            return await respond(send, 401, {'error': 'Authentication credentials were not provided or are invalid.'}, cors)
+
+    try:
+        last_event_id = int(headers.get('last-event-id', query.get('last_event_id', '')))
+    except ValueError:
+        last_event_id = None
+
+    broker = get_broker()
+    # subscribe before reading the missed rows so nothing falls in between
+    subscription = broker.subscribe(user_channel(user_id))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+                *cors,
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b'retry: 5000\n\n', 'more_body': True})
+
+        if last_event_id is not None:
+            for event in await missed_notifications(user_id, last_event_id):
+                last_event_id = event['id']
+                await send({'type': 'http.response.body', 'body': encode(event), 'more_body': True})
+
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            while not subscription.overflowed:
+                getter = asyncio.ensure_future(subscription.get(KEEPALIVE_SECONDS))
+                await asyncio.wait({getter, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    getter.cancel()
+                    return
+                event = getter.result()
+                if event is None:
+                    body = b': keepalive\n\n'
+                elif event['type'] == 'notification' and last_event_id is not None and event['id'] <= last_event_id:
+                    # already sent by the replay
+                    continue
+                else:
+                    body = encode(event)
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+            # a slow client that fell behind is cut off, it reconnects and resumes from its last id
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            disconnected.cancel()
+    except OSError:
+        pass
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+class EventStreamRouter:
+    """Serve settings.EVENTS_STREAM_PATH from event_stream, everything else from Django."""
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == settings.EVENTS_STREAM_PATH and scope['method'] == 'GET':
+            return await event_stream(scope, receive, send)
+        return await self.application(scope, receive, send)
@@ -0,0 +1,141 @@
+import asyncio
+import itertools
+import json
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from orders.models import Notification
+from orders.notifications import notify
+from users.models import MyUser
+from website.events import publish
+from website.sse import EventStreamRouter, issue_ticket
+
+mobiles = itertools.count(9120000001)
+
+
+async def not_django(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+application = EventStreamRouter(not_django)
+
+
+def stream(query='', headers=(), path=None, events=0, on_open=None):
+    """Open the stream and read until ``events`` events arrived, then disconnect.
+    Returns (status, headers, [(event type, id, data), ...])."""
+    async def run():
+        start, bodies = {}, []
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                start.update(message)
+                return
+            bodies.append(message['body'])
+            if message['body'].startswith(b'retry:') and on_open:
+                on_open()
+            if len(parse(bodies)) >= events:
+                disconnected.set()
+
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': path or settings.EVENTS_STREAM_PATH,
+            'query_string': query.encode(),
+            'headers': [(name.encode(), value.encode()) for name, value in headers],
+        }
+        await asyncio.wait_for(application(scope, receive, send), 5)
+        return start['status'], dict(start['headers']), parse(bodies) if start['status'] == 200 else bodies
+
+    return async_to_sync(run)()
+
+
+def parse(bodies):
+    events = []
+    for block in b''.join(bodies).decode().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line and not line.startswith(':'))
+        if 'event' in fields:
+            events.append((fields['event'], fields.get('id'), json.loads(fields['data'])))
+    return events
+
+
+class EventStreamTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = MyUser.objects.create_user(mobile=f'0{next(mobiles)}')
+
+    def test_ticket_endpoint(self):
+        client = APIClient()
+        client.credentials(HTTP_X_API_KEY=settings.API_KEY)
+        self.assertEqual(client.post(reverse('event_stream_ticket')).status_code, 401)
+        client.force_authenticate(self.user)
+        response = client.post(reverse('event_stream_ticket'))
+        self.assertEqual(response.status_code, 201)
+        status, _, _ = stream(f"ticket={response.data['ticket']}")
+        self.assertEqual(status, 200)
+
+    def test_ticket_is_single_use(self):
+        ticket = issue_ticket(self.user.id)
+        self.assertEqual(stream(f'ticket={ticket}')[0], 200)
+        status, _, body = stream(f'ticket={ticket}')
+        self.assertEqual(status, 401)
+        self.assertEqual(json.loads(b''.join(body)), {'error': 'Invalid or used stream ticket.'})
+
+    def test_expired_ticket_is_refused(self):
+        ticket = issue_ticket(self.user.id)
+        later = time.time() + settings.EVENTS_TICKET_TTL + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertEqual(stream(f'ticket={ticket}')[0], 401)
+
+    def test_requests_without_valid_credentials_are_refused(self):
+        self.assertEqual(stream()[0], 403)
+        self.assertEqual(stream('ticket=made-up')[0], 401)
+        self.assertEqual(stream(headers=[('x-api-key', settings.API_KEY)])[0], 401)
+        self.assertEqual(stream(headers=[('x-api-key', settings.API_KEY), ('authorization', 'Bearer nope')])[0], 401)
+        token = str(AccessToken.for_user(self.user))
+        self.assertEqual(stream(headers=[('x-api-key', 'wrong'), ('authorization', f'Bearer {token}')])[0], 403)
+        self.assertEqual(stream(headers=[('x-api-key', settings.API_KEY), ('authorization', f'Bearer {token}')])[0], 200)
+
+    def test_resume_from_the_last_event_id(self):
+        first, second, third = notify([Notification(user=self.user, message=str(i)) for i in range(3)])
+        _, _, events = stream(f'ticket={issue_ticket(self.user.id)}&last_event_id={first.id}', events=2)
+        self.assertEqual([(kind, int(event_id)) for kind, event_id, _ in events], [
+            ('notification', second.id), ('notification', third.id),
+        ])
+        # the header wins over the query parameter
+        _, _, events = stream(
+            f'ticket={issue_ticket(self.user.id)}&last_event_id={first.id}',
+            headers=[('last-event-id', str(second.id))], events=1,
+        )
+        self.assertEqual([data['message'] for _, _, data in events], ['2'])
+
+    def test_published_event_reaches_the_stream(self):
+        other = MyUser.objects.create_user(mobile=f'0{next(mobiles)}')
+
+        def on_open():
+            publish(other.id, 'order', {'id': 1, 'status': 'Completed'})
+            publish(self.user.id, 'order', {'id': 2, 'status': 'Completed'})
+
+        status, headers, events = stream(
+            f'ticket={issue_ticket(self.user.id)}', headers=[('origin', settings.CORS_ALLOWED_ORIGINS[0])],
+            events=1, on_open=on_open,
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'content-type'], b'text/event-stream')
+        self.assertEqual(headers[b'access-control-allow-origin'], settings.CORS_ALLOWED_ORIGINS[0].encode())
+        self.assertEqual(events, [('order', None, {'id': 2, 'status': 'Completed'})])
+
+    def test_other_requests_go_to_django(self):
+        self.assertEqual(stream(path='/api/products/')[0], 204)
@@ -7,6 +7,7 @@ from django.conf.urls.static import static
 
 # documentation with spectacular package
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from .views import EventStreamTicketView
 
 
 urlpatterns = [
@@ -21,6 +22,8 @@ urlpatterns = [
    path('api/dashboard', include('dashboard.urls')),
    path('api/payments/', include('payments.urls')),
    path('api/cart/', include('cart.urls')),
+   # the stream itself is served by the ASGI application (website.sse)
+   path('api/events/ticket/', EventStreamTicketView.as_view(), name='event_stream_ticket'),
 
 
 
@@ -31,5 +34,7 @@ urlpatterns = [
 
 
 ]
+if settings.FAKE_GATEWAY_ENABLED:
+    urlpatterns += [path('api/fake-gateway/', include('fake_gateway.urls'))]
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -0,0 +1,11 @@
+from django.utils.dateparse import parse_date
+
+
+def date_param(request, name, default):
+    # None when the parameter is not a valid date
+    if name not in request.query_params:
+        return default
+    try:
+        return parse_date(request.query_params[name])
+    except ValueError:
+        return None
@@ -0,0 +1,15 @@
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .sse import issue_ticket
+
+
+# single-use ticket to open the event stream with (see website.sse), so browsers never put
+# the API key or the access token in the stream URL
+class EventStreamTicketView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        return Response({"ticket": issue_ticket(request.user.id)}, status=status.HTTP_201_CREATED)